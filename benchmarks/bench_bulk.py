@@ -0,0 +1,53 @@
+"""Compare `Metric.record_many` against one `Metric.save` per document.
+
+Usage:
+
+    python benchmarks/bench_bulk.py --latency 1
+"""
+import datetime as dt
+
+import utils
+
+utils.setup()
+
+from elasticsearch_metrics import metrics  # noqa: E402
+
+DOCUMENT_COUNT = 1000
+
+
+class PageView(metrics.Metric):
+    user_id = metrics.Integer()
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "benchmarks"
+
+
+def make_documents():
+    timestamp = dt.datetime(2020, 2, 14, 12)
+    return [
+        {"timestamp": timestamp, "user_id": i, "page_id": "page{}".format(i % 10)}
+        for i in range(DOCUMENT_COUNT)
+    ]
+
+
+def save_each():
+    for kwargs in make_documents():
+        PageView.record(**kwargs)
+
+
+def record_many():
+    PageView.record_many(make_documents())
+
+
+def main():
+    args = utils.get_parser(__doc__).parse_args()
+    utils.StubConnection.latency = args.latency / 1000
+    print("{} documents, {} ms simulated latency".format(DOCUMENT_COUNT, args.latency))
+    per_doc = utils.bench("record (one save per document)", save_each, 1, args.repeat)
+    bulk = utils.bench("record_many", record_many, 1, args.repeat)
+    print("speedup: {:.1f}x".format(per_doc / bulk))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Measure `Metric.get_index_name` with and without the index name cache.
+
+Usage:
+
+    python benchmarks/bench_index_name.py
+"""
+import datetime as dt
+
+import utils
+
+utils.setup()
+
+from django.conf import settings  # noqa: E402
+
+from elasticsearch_metrics import metrics  # noqa: E402
+from elasticsearch_metrics.dateformat import DEFAULT_DATE_FORMAT  # noqa: E402
+
+NUMBER = 100000
+
+
+class PageView(metrics.Metric):
+    class Meta:
+        app_label = "benchmarks"
+
+
+DATE = dt.date(2020, 2, 14)
+TIMESTAMP = dt.datetime(2020, 2, 14, 12, 30)
+
+
+def uncached():
+    # Equivalent to get_index_name before index names were cached
+    dateformat = getattr(
+        settings, "ELASTICSEARCH_METRICS_DATE_FORMAT", DEFAULT_DATE_FORMAT
+    )
+    PageView._format_index_name(TIMESTAMP, dateformat)
+
+
+def cached_date():
+    PageView.get_index_name(DATE)
+
+
+def cached_timestamp():
+    PageView.get_index_name(TIMESTAMP)
+
+
+def main():
+    args = utils.get_parser(__doc__).parse_args()
+    baseline = utils.bench("uncached", uncached, NUMBER, args.repeat)
+    for name, func in (
+        ("cached (date)", cached_date),
+        ("cached (datetime)", cached_timestamp),
+    ):
+        best = utils.bench(name, func, NUMBER, args.repeat)
+        print("  speedup: {:.1f}x".format(baseline / best))
+
+
+if __name__ == "__main__":
+    main()
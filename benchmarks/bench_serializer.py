@@ -0,0 +1,80 @@
+"""Compare the throughput of serializers when encoding ``_bulk`` payloads.
+
+Usage:
+
+    python benchmarks/bench_serializer.py
+"""
+import datetime as dt
+
+import utils
+
+utils.setup()
+
+from elasticsearch_metrics import metrics  # noqa: E402
+from elasticsearch_metrics.serializer import SERIALIZERS  # noqa: E402
+
+DOCUMENT_COUNT = 1000
+
+
+class PageView(metrics.Metric):
+    user_id = metrics.Integer()
+    page_id = metrics.Keyword()
+    referrer = metrics.Keyword()
+    duration = metrics.Float()
+
+    class Meta:
+        app_label = "benchmarks"
+
+
+def make_actions():
+    timestamp = dt.datetime(2020, 2, 14, 12, 30, 15, 123456, tzinfo=dt.timezone.utc)
+    return [
+        PageView(
+            timestamp=timestamp + dt.timedelta(seconds=i),
+            user_id=i,
+            page_id="page{}".format(i % 10),
+            referrer="search",
+            duration=i / 7,
+        ).to_bulk_action(index="benchmarks_pageview_2020.02.14")
+        for i in range(DOCUMENT_COUNT)
+    ]
+
+
+def encode(serializer, actions):
+    """Encode actions as the ``_bulk`` helpers do."""
+    lines = []
+    for action in actions:
+        action = dict(action)
+        source = action.pop("_source")
+        lines.append(serializer.dumps({"index": action}))
+        lines.append(serializer.dumps(source))
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    args = utils.get_parser(__doc__).parse_args()
+    actions = make_actions()
+    print("{} documents".format(DOCUMENT_COUNT))
+    results = {}
+    for name, factory in SERIALIZERS.items():
+        try:
+            serializer = factory()
+        except ImportError:
+            print("{:<40} {:>15}".format(name, "not installed"))
+            continue
+        payload = encode(serializer, actions)
+        best = utils.bench(name, lambda: encode(serializer, actions), 10, args.repeat)
+        results[name] = best
+        print(
+            "  {:.1f} MB/s, {:.0f} documents/s".format(
+                len(payload.encode("utf-8")) / best / 1e6, DOCUMENT_COUNT / best
+            )
+        )
+    if len(results) > 1:
+        baseline = results.pop("default")
+        for name, best in results.items():
+            print("{} speedup: {:.1f}x".format(name, baseline / best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measure the time to import elasticsearch_metrics and to run its
+``AppConfig.ready()``. Each run uses a new Python process.
+
+Usage:
+
+    python benchmarks/bench_startup.py
+"""
+import json
+import subprocess
+import sys
+
+import utils
+
+CHILD = """
+import json
+import time
+
+# Import dependencies first, so that only elasticsearch_metrics is measured
+import django
+import django.db
+import elasticsearch_dsl
+import elasticsearch.helpers
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=["elasticsearch_metrics"],
+    ELASTICSEARCH_DSL={"default": {"hosts": "localhost:9200"}},
+)
+timings = {}
+start = time.perf_counter()
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.apps import ElasticsearchMetricsConfig
+timings["import elasticsearch_metrics.metrics"] = time.perf_counter() - start
+
+ready = ElasticsearchMetricsConfig.ready
+
+
+def timed_ready(self):
+    start = time.perf_counter()
+    ready(self)
+    timings["AppConfig.ready()"] = time.perf_counter() - start
+
+
+ElasticsearchMetricsConfig.ready = timed_ready
+django.setup()
+start = time.perf_counter()
+metrics.Keyword
+timings["first field access"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def run():
+    output = subprocess.check_output([sys.executable, "-c", CHILD])
+    return json.loads(output.decode("utf-8"))
+
+
+def main():
+    args = utils.get_parser(__doc__).parse_args()
+    # Warm up the bytecode cache
+    run()
+    runs = [run() for _ in range(args.repeat)]
+    for name in runs[0]:
+        best = min(result[name] for result in runs)
+        print("{:<40} {:>12.2f} ms".format(name, best * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure checking the index templates of many metrics, with and without
+the per-class template cache.
+
+Usage:
+
+    python benchmarks/bench_templates.py
+"""
+import utils
+
+utils.setup()
+
+from elasticsearch_metrics import metrics  # noqa: E402
+
+NUMBER = 10
+METRIC_COUNT = 300
+
+
+def make_metrics(count):
+    base = type(
+        "BaseView",
+        (metrics.Metric,),
+        {
+            "__module__": __name__,
+            "user_id": metrics.Keyword(),
+            "Meta": type("Meta", (), {"abstract": True}),
+            "Index": type("Index", (), {"settings": {"number_of_shards": 1}}),
+        },
+    )
+    return [
+        type(
+            "View{}".format(i),
+            (base,),
+            {
+                "__module__": __name__,
+                "page_id": metrics.Keyword(),
+                "duration": metrics.Integer(),
+                "Meta": type("Meta", (), {"app_label": "benchmarks"}),
+            },
+        )
+        for i in range(count)
+    ]
+
+
+METRICS = make_metrics(METRIC_COUNT)
+# Current index templates, as returned by Elasticsearch
+TEMPLATES = {}
+for metric in METRICS:
+    template = metric.get_index_template().to_dict()
+    template["settings"] = {"index": {"number_of_shards": "1"}}
+    TEMPLATES[metric] = template
+
+
+def uncached():
+    # Equivalent to check_metrics before templates were cached
+    for metric in METRICS:
+        template = metric.get_index_template()
+        template.document(metric)
+        template_data = template.to_dict()
+        metrics._get_fingerprint(template_data)
+        assert TEMPLATES[metric]["mappings"] == template_data["mappings"]
+
+
+def cached():
+    for metric in METRICS:
+        metric.compare_index_template(TEMPLATES[metric])
+
+
+def main():
+    args = utils.get_parser(__doc__).parse_args()
+    print("{} metrics".format(METRIC_COUNT))
+    baseline = utils.bench("uncached", uncached, NUMBER, args.repeat)
+    best = utils.bench("cached", cached, NUMBER, args.repeat)
+    print("  speedup: {:.1f}x".format(baseline / best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Benchmark suite for the write and read hot paths. Runs offline against
+`utils.StubConnection`.
+
+Usage:
+
+    # Run all benchmarks and save the results
+    python benchmarks/run_suite.py --output results.json
+
+    # Compare against results from a previous run
+    python benchmarks/run_suite.py --compare results.json
+
+    # Only run benchmarks whose name contains "bulk"
+    python benchmarks/run_suite.py -k bulk
+"""
+import datetime as dt
+import itertools
+import json
+import platform
+
+import utils
+
+utils.setup()
+
+import django  # noqa: E402
+import elasticsearch_dsl  # noqa: E402
+
+import elasticsearch_metrics  # noqa: E402
+from elasticsearch_metrics import metrics, signals  # noqa: E402
+from elasticsearch_metrics.buffer import MetricBuffer  # noqa: E402
+from elasticsearch_metrics.bulk import BulkRecorder  # noqa: E402
+from elasticsearch_metrics.counters import CounterAccumulator  # noqa: E402
+
+BATCH_SIZE = 1000
+TIMESTAMP = dt.datetime(2020, 2, 14, 12, 30)
+
+
+class PageView(metrics.Metric):
+    user_id = metrics.Integer()
+    page_id = metrics.Keyword()
+    referrer = metrics.Keyword()
+    duration = metrics.Float()
+
+    class Index:
+        settings = {"number_of_shards": 2, "refresh_interval": "5s"}
+
+    class Meta:
+        app_label = "benchmarks"
+
+
+class PageViewCount(metrics.CounterMetric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "benchmarks"
+
+
+FIELDS = {"user_id": 42, "page_id": "home", "referrer": "search", "duration": 1.5}
+INSTANCE = PageView(timestamp=TIMESTAMP, **FIELDS)
+
+
+def make_documents():
+    return [dict(FIELDS, timestamp=TIMESTAMP) for _ in range(BATCH_SIZE)]
+
+
+def make_current_template(fingerprint=False):
+    """Return the index template as Elasticsearch would return it."""
+    template = PageView.get_index_template().to_dict()
+    template["settings"] = {
+        "index": {"number_of_shards": "2", "refresh_interval": "5s"}
+    }
+    if fingerprint:
+        template["mappings"]["doc"]["_meta"] = {
+            "fingerprint": PageView._get_index_template_fingerprint()
+        }
+    return template
+
+
+CURRENT_TEMPLATE = make_current_template()
+CURRENT_TEMPLATE_WITH_FINGERPRINT = make_current_template(fingerprint=True)
+
+_class_counter = itertools.count()
+
+
+def record():
+    PageView.record(timestamp=TIMESTAMP, **FIELDS)
+
+
+def record_fast_validation():
+    PageView.record(timestamp=TIMESTAMP, validate="fast", **FIELDS)
+
+
+def save():
+    PageView(timestamp=TIMESTAMP, **FIELDS).save()
+
+
+def _receiver(sender, **kwargs):
+    pass
+
+
+def save_with_receivers():
+    signals.pre_save.connect(_receiver)
+    signals.post_save.connect(_receiver)
+    try:
+        save()
+    finally:
+        signals.pre_save.disconnect(_receiver)
+        signals.post_save.disconnect(_receiver)
+
+
+def to_dict():
+    INSTANCE.to_dict()
+
+
+def full_clean():
+    INSTANCE.full_clean()
+
+
+def full_clean_fast():
+    INSTANCE.full_clean(fast=True)
+
+
+def get_index_name():
+    PageView.get_index_name(TIMESTAMP)
+
+
+def create_metric_class():
+    # Abstract metrics aren't registered, so names don't conflict
+    type(
+        "Metric{}".format(next(_class_counter)),
+        (metrics.Metric,),
+        {
+            "__module__": __name__,
+            "page_id": metrics.Keyword(),
+            "duration": metrics.Float(),
+            "Meta": type("Meta", (), {"abstract": True, "app_label": "benchmarks"}),
+        },
+    )
+
+
+def compare_index_template():
+    PageView.compare_index_template(CURRENT_TEMPLATE)
+
+
+def compare_index_template_fingerprint():
+    PageView.compare_index_template(CURRENT_TEMPLATE_WITH_FINGERPRINT)
+
+
+def search_date_range():
+    PageView.search(start=dt.date(2019, 11, 15), end=dt.date(2020, 2, 14)).to_dict()
+
+
+def record_many():
+    PageView.record_many(make_documents())
+
+
+def bulk_recorder():
+    with BulkRecorder():
+        for _ in range(BATCH_SIZE):
+            PageView.record(timestamp=TIMESTAMP, **FIELDS)
+
+
+def buffer():
+    metric_buffer = MetricBuffer(max_size=BATCH_SIZE * 2, flush_size=BATCH_SIZE * 2)
+    for _ in range(BATCH_SIZE):
+        metric_buffer.put(PageView(timestamp=TIMESTAMP, **FIELDS))
+    metric_buffer.close()
+
+
+def counter():
+    accumulator = CounterAccumulator()
+    for i in range(BATCH_SIZE):
+        accumulator.add(
+            PageViewCount, {"page_id": "page{}".format(i % 10)}, timestamp=TIMESTAMP
+        )
+    accumulator.close()
+
+
+# (name, function, number of calls per run, documents per call)
+BENCHMARKS = [
+    ("record", record, 1000, 1),
+    ("record (validate='fast')", record_fast_validation, 1000, 1),
+    ("save", save, 1000, 1),
+    ("save with signal receivers", save_with_receivers, 1000, 1),
+    ("to_dict", to_dict, 10000, 1),
+    ("full_clean", full_clean, 10000, 1),
+    ("full_clean (fast)", full_clean_fast, 10000, 1),
+    ("get_index_name", get_index_name, 100000, 1),
+    ("MetricMeta class creation", create_metric_class, 200, 1),
+    ("compare_index_template (diff)", compare_index_template, 1000, 1),
+    (
+        "compare_index_template (fingerprint)",
+        compare_index_template_fingerprint,
+        10000,
+        1,
+    ),
+    ("search with date range", search_date_range, 1000, 1),
+    ("record_many", record_many, 5, BATCH_SIZE),
+    ("BulkRecorder", bulk_recorder, 5, BATCH_SIZE),
+    ("MetricBuffer", buffer, 5, BATCH_SIZE),
+    ("CounterAccumulator", counter, 5, BATCH_SIZE),
+]
+
+
+def get_environment():
+    return {
+        "elasticsearch_metrics": elasticsearch_metrics.__version__,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "elasticsearch_dsl": elasticsearch_dsl.__versionstr__,
+        "platform": platform.platform(),
+    }
+
+
+def main():
+    parser = utils.get_parser(__doc__)
+    parser.add_argument(
+        "-k", dest="keyword", help="Only run benchmarks whose name contains this."
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--compare", help="Compare the results with a JSON file from a previous run."
+    )
+    args = parser.parse_args()
+    utils.StubConnection.latency = args.latency / 1000
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)["results"]
+
+    results = {}
+    for name, func, number, documents in BENCHMARKS:
+        if args.keyword and args.keyword.lower() not in name.lower():
+            continue
+        best = utils.bench(name, func, number, args.repeat)
+        results[name] = {"seconds": best, "per_document": best / documents}
+        if name in baseline:
+            print("  {:.2f}x baseline".format(best / baseline[name]["seconds"]))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(
+                {
+                    "environment": get_environment(),
+                    "latency_ms": args.latency,
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                fp,
+                indent=2,
+                sort_keys=True,
+            )
+        print("Wrote results to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Helpers for running benchmarks offline, without an Elasticsearch cluster."""
+import argparse
+import timeit
+
+import django
+from django.conf import settings
+
+from elasticsearch_metrics.testing import InMemoryCluster, InMemoryConnection
+
+
+class StubConnection(InMemoryConnection):
+    """In-memory connection that doesn't keep indexed documents.
+
+    Set ``latency`` to simulate the round trip time (in seconds) of each request.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("cluster", InMemoryCluster(store_documents=False))
+        super(StubConnection, self).__init__(**kwargs)
+
+
+def setup(**extra_settings):
+    """Configure Django to use `StubConnection` for the default connection."""
+    settings.configure(
+        INSTALLED_APPS=["elasticsearch_metrics"],
+        TIME_ZONE="UTC",
+        ELASTICSEARCH_DSL={
+            "default": {"hosts": "localhost:9200", "connection_class": StubConnection}
+        },
+        **extra_settings
+    )
+    django.setup()
+
+
+def get_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Simulated round trip time of each request, in milliseconds.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of times to repeat each run."
+    )
+    return parser
+
+
+def bench(name, func, number, repeat=5):
+    """Time ``func`` and print the best time per call."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print("{:<40} {:>12.2f} us".format(name, best * 1e6))
+    return best
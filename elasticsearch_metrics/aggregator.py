@@ -0,0 +1,438 @@
+"""Aggregation of metrics from many processes into large ``_bulk`` requests.
+
+An `Aggregator` receives serialized metrics over a Unix datagram socket and
+sends them to Elasticsearch from a single process. Worker processes forward
+their metrics to it with an `AggregatorClient`, which is enabled for
+buffered recording with the ``socket`` option of ``ELASTICSEARCH_METRICS_BUFFER``:
+
+.. code-block:: python
+
+    ELASTICSEARCH_METRICS_BUFFER = {"socket": "/run/myapp/metrics.sock"}
+
+With gunicorn and ``preload_app = True``, the aggregator can run in the
+master process:
+
+.. code-block:: python
+
+    # gunicorn.conf.py
+    def when_ready(server):
+        from elasticsearch_metrics.aggregator import Aggregator
+
+        Aggregator("/run/myapp/metrics.sock").start()
+
+Metrics that can't be forwarded (e.g. because the aggregator isn't running
+or its socket is full) are queued and sent by the worker's own buffer.
+
+The aggregator can also run as a separate daemon with the ``ship_metrics``
+management command. With the ``ELASTICSEARCH_METRICS_SHIPPER`` setting,
+`Metric.save <elasticsearch_metrics.metrics.Metric.save>` and
+`Metric.record <elasticsearch_metrics.metrics.Metric.record>` send metrics
+to the daemon's socket, without buffering:
+
+.. code-block:: python
+
+    ELASTICSEARCH_METRICS_SHIPPER = {"socket": "/run/myapp/metrics.sock"}
+"""
+import atexit
+from collections import deque
+import errno
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import socket
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from elasticsearch.exceptions import SerializationError
+from elasticsearch_dsl import connections
+
+from elasticsearch_metrics import bulk
+from elasticsearch_metrics.serializer import get_serializer
+from elasticsearch_metrics.spool import get_spool, is_retryable
+
+# Largest datagram sent to an aggregator. Larger metrics are sent by the worker.
+# Kept well below Linux's default socket send buffer (net.core.wmem_default,
+# 208 KiB), which limits the size of Unix datagrams.
+MAX_DATAGRAM_SIZE = 64 * 1024
+# Number of seconds between checks of whether the aggregator was closed
+_RECEIVE_TIMEOUT = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+class AggregatorClient(object):
+    """Forwards metrics to an `Aggregator` without blocking.
+
+    :param str path: Path of the aggregator's socket.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._socket = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def send(self, using, action):
+        """Send a ``_bulk`` action to the aggregator.
+
+        :return: `False` if the action couldn't be sent, e.g. because the
+            aggregator isn't running or its socket is full.
+        """
+        data = get_serializer().dumps({"using": using, "action": action})
+        data = data.encode("utf-8")
+        if len(data) > MAX_DATAGRAM_SIZE:
+            return False
+        sock = self._socket
+        # Forked children connect their own socket
+        if sock is None or self._pid != os.getpid():
+            sock = self._connect()
+            if sock is None:
+                return False
+        try:
+            sock.send(data)
+        except BlockingIOError:
+            # The aggregator's socket is full
+            return False
+        except OSError as error:
+            if error.errno in (errno.EMSGSIZE, errno.ENOBUFS):
+                # The metric is larger than the socket's buffer allows
+                return False
+            # The aggregator was stopped or restarted
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        with self._lock:
+            sock, self._socket = self._socket, None
+        if sock is not None and self._pid == os.getpid():
+            sock.close()
+
+    def _connect(self):
+        with self._lock:
+            if self._socket is not None and self._pid == os.getpid():
+                return self._socket
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                return None
+            self._socket = sock
+            self._pid = os.getpid()
+            return sock
+
+
+class Aggregator(object):
+    """Receives metrics from `AggregatorClient` instances over a Unix datagram
+    socket and sends them to Elasticsearch with the ``_bulk`` API.
+
+    Received metrics are sent when ``flush_size`` metrics are pending or when
+    the oldest pending metric has waited ``flush_interval`` seconds, with one
+    ``_bulk`` request per connection and index. Metrics that fail because
+    Elasticsearch is unavailable are written to the spool, if one is configured.
+
+    :param str path: Path of the socket. An existing file at the path is replaced.
+    :param int flush_size: Number of pending metrics that triggers a flush.
+    :param float flush_interval: Maximum number of seconds a metric waits to be sent.
+    :param int max_size: Maximum number of pending metrics. Metrics received
+        while the aggregator is full are dropped.
+    :param int chunk_size: Number of documents in each ``_bulk`` request.
+    :param int concurrency: Maximum number of concurrent ``_bulk`` requests.
+        The requests share each connection's client, so at most this many
+        HTTP connections are opened per cluster.
+    """
+
+    def __init__(
+        self,
+        path,
+        flush_size=5000,
+        flush_interval=1.0,
+        max_size=100000,
+        chunk_size=bulk.DEFAULT_CHUNK_SIZE,
+        concurrency=1,
+    ):
+        self.path = path
+        self.flush_size = min(flush_size, max_size)
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        # Number of metrics received from clients
+        self.received = 0
+        # Number of metrics that were sent and indexed
+        self.indexed = 0
+        # Number of metrics that were written to the spool
+        self.spooled = 0
+        # Number of metrics that failed to index
+        self.failed = 0
+        # Number of metrics discarded because the aggregator was full or malformed
+        self.dropped = 0
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._done = threading.Condition(self._lock)
+        self._oldest = None
+        self._processed = 0
+        self._flush_requested = False
+        self._receiving = False
+        self._closed = False
+        self._socket = None
+        self._pid = None
+        self._threads = []
+        self._executor = None
+
+    def stats(self):
+        return {
+            "depth": len(self._pending),
+            "received": self.received,
+            "indexed": self.indexed,
+            "spooled": self.spooled,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    def start(self):
+        """Bind the socket and start the receiving and sending threads."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._socket.settimeout(_RECEIVE_TIMEOUT)
+        self._pid = os.getpid()
+        self._receiving = True
+        if self.concurrency > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency,
+                thread_name_prefix="elasticsearch-metrics-aggregator",
+            )
+        for target, name in (
+            (self._receive, "elasticsearch-metrics-aggregator-receiver"),
+            (self._run, "elasticsearch-metrics-aggregator-sender"),
+        ):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        _aggregators.add(self)
+        return self
+
+    def flush(self, timeout=None):
+        """Send all received metrics and wait until they have been sent.
+
+        :return: `False` if ``timeout`` expired before the metrics were sent.
+        """
+        with self._lock:
+            target = self.received - self.dropped
+            self._flush_requested = True
+            self._ready.notify()
+            return self._done.wait_for(lambda: self._processed >= target, timeout)
+
+    def close(self, timeout=None):
+        """Stop receiving metrics, send the pending metrics and remove the socket."""
+        if self._closed:
+            return
+        # Stop receiving before the last flush, so that no metric is left behind
+        self._receiving = False
+        receiver, sender = self._threads or (None, None)
+        if receiver is not None:
+            receiver.join(timeout)
+        with self._lock:
+            self._closed = True
+            self._ready.notify()
+        if sender is not None:
+            sender.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._socket is not None:
+            self._socket.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        _aggregators.discard(self)
+
+    def _detach(self):
+        """Close the socket inherited by a forked child, without removing it."""
+        self._receiving = False
+        self._closed = True
+        self._threads = []
+        self._executor = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _receive(self):
+        serializer = get_serializer()
+        buf = bytearray(MAX_DATAGRAM_SIZE)
+        view = memoryview(buf)
+        draining = False
+        while True:
+            if not draining and not self._receiving:
+                # Read the metrics that clients already sent, then stop
+                draining = True
+                self._socket.setblocking(False)
+            try:
+                size = self._socket.recv_into(buf)
+            except socket.timeout:
+                continue
+            except BlockingIOError:
+                return
+            try:
+                entry = serializer.loads(bytes(view[:size]).decode("utf-8"))
+                entry = (entry["using"], entry["action"])
+            except (SerializationError, UnicodeDecodeError, KeyError, TypeError):
+                logger.warning("Dropping malformed metric received by aggregator.")
+                with self._lock:
+                    self.received += 1
+                    self.dropped += 1
+                continue
+            with self._lock:
+                self.received += 1
+                if len(self._pending) >= self.max_size:
+                    self.dropped += 1
+                    continue
+                if not self._pending:
+                    self._oldest = time.monotonic()
+                self._pending.append(entry)
+                if len(self._pending) >= self.flush_size:
+                    self._ready.notify()
+
+    def _should_flush(self):
+        if self._closed or self._flush_requested:
+            return True
+        if len(self._pending) >= self.flush_size:
+            return True
+        return bool(self._pending) and (
+            time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._should_flush():
+                    timeout = None
+                    if self._pending:
+                        timeout = self._oldest + self.flush_interval - time.monotonic()
+                    self._ready.wait(timeout)
+                entries = list(self._pending)
+                self._pending.clear()
+                self._flush_requested = False
+                closed = self._closed
+            counts = self._send(entries)
+            with self._lock:
+                for key, value in counts.items():
+                    setattr(self, key, getattr(self, key) + value)
+                self._processed += len(entries)
+                self._done.notify_all()
+            if closed:
+                return
+
+    def _send(self, entries):
+        """Send ``(using, action)`` entries with one ``_bulk`` request per
+        connection and index, and return the number of metrics that were
+        indexed, spooled and failed.
+        """
+        groups = {}
+        for using, action in entries:
+            groups.setdefault((using, action.get("_index")), []).append(action)
+        counts = {"indexed": 0, "spooled": 0, "failed": 0}
+        if self._executor is None or len(groups) == 1:
+            results = map(self._send_group, groups.items())
+        else:
+            results = self._executor.map(self._send_group, groups.items())
+        for group_counts in results:
+            for key, value in group_counts.items():
+                counts[key] += value
+        if counts["failed"]:
+            logger.error("%d aggregated metric(s) failed to index.", counts["failed"])
+        return counts
+
+    def _send_group(self, group):
+        (using, index), actions = group
+        counts = {"indexed": 0, "spooled": 0, "failed": 0}
+        try:
+            client = connections.get_connection(using)
+            results = list(
+                bulk.send_actions(client, actions, chunk_size=self.chunk_size)
+            )
+        except Exception:
+            logger.exception(
+                "Failed to send %d aggregated metric(s) to %s.", len(actions), index
+            )
+            counts["failed"] += len(actions)
+            return counts
+        spool = get_spool()
+        for action, (ok, info) in zip(actions, results):
+            if ok:
+                counts["indexed"] += 1
+                continue
+            _, item = info.popitem()
+            if (
+                spool is not None
+                and is_retryable(item.get("status"))
+                and spool.write(using, action)
+            ):
+                counts["spooled"] += 1
+            else:
+                counts["failed"] += 1
+        return counts
+
+
+_aggregators = weakref.WeakSet()
+
+_UNSET = object()
+_shipper = _UNSET
+_shipper_lock = threading.Lock()
+
+
+def get_shipper():
+    """Return the `AggregatorClient` for the socket configured by the
+    ``ELASTICSEARCH_METRICS_SHIPPER`` setting, or `None` if shipping is disabled.
+    """
+    global _shipper
+    if _shipper is _UNSET:
+        with _shipper_lock:
+            if _shipper is _UNSET:
+                shipper_settings = getattr(
+                    settings, "ELASTICSEARCH_METRICS_SHIPPER", None
+                )
+                _shipper = (
+                    AggregatorClient(shipper_settings["socket"])
+                    if shipper_settings
+                    else None
+                )
+    return _shipper
+
+
+def close_aggregators(timeout=None):
+    """Send the pending metrics of all running aggregators and stop them."""
+    for aggregator in list(_aggregators):
+        if aggregator._pid == os.getpid():
+            aggregator.close(timeout=timeout)
+
+
+def _detach_after_fork():
+    # Children don't inherit the aggregators' threads, and must not remove
+    # the parent's sockets
+    for aggregator in list(_aggregators):
+        aggregator._detach()
+    _aggregators.clear()
+
+
+atexit.register(close_aggregators)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_detach_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_shipper(setting, **kwargs):
+    global _shipper
+    if setting == "ELASTICSEARCH_METRICS_SHIPPER":
+        shipper, _shipper = _shipper, _UNSET
+        if shipper not in (None, _UNSET):
+            shipper.close()
@@ -0,0 +1,306 @@
+"""Asynchronous recording of metrics, for use in async views.
+
+Requires `aiohttp <https://docs.aiohttp.org/>`_.
+
+Metrics saved concurrently on the same event loop are coalesced into a
+single ``_bulk`` request per connection. Batching can be configured with the
+``ELASTICSEARCH_METRICS_ASYNC`` setting, which is a dict of keyword arguments
+passed to `AsyncBatcher`.
+"""
+import asyncio
+import itertools
+import os
+import threading
+import weakref
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from elasticsearch.client import _normalize_hosts
+from elasticsearch.exceptions import (
+    HTTP_EXCEPTIONS,
+    ConnectionError,
+    ConnectionTimeout,
+    TransportError,
+)
+from elasticsearch.helpers import expand_action
+from elasticsearch_dsl.serializer import serializer as default_serializer
+
+from elasticsearch_metrics import bulk
+from elasticsearch_metrics.serializer import get_serializer
+
+DEFAULT_PORT = 9200
+
+
+def raise_for_item(item):
+    """Raise the appropriate `TransportError` if a ``_bulk`` response item failed."""
+    status = item.get("status", 500)
+    if not 200 <= status < 300:
+        error = item.get("error", {})
+        error_type = error.get("type") if isinstance(error, dict) else error
+        raise HTTP_EXCEPTIONS.get(status, TransportError)(status, error_type, item)
+
+
+class AsyncTransport(object):
+    """Sends requests to Elasticsearch over a pool of keep-alive HTTP
+    connections. Accepts the same connection settings as
+    `elasticsearch.Elasticsearch`; unsupported settings are ignored.
+
+    :param hosts: Host or list of hosts. Requests are distributed round-robin.
+    :param int maxsize: Maximum number of open connections.
+    :param float timeout: Request timeout in seconds.
+    """
+
+    def __init__(
+        self,
+        hosts=None,
+        maxsize=10,
+        timeout=10,
+        http_auth=None,
+        use_ssl=False,
+        url_prefix="",
+        serializer=default_serializer,
+        **kwargs
+    ):
+        if aiohttp is None:
+            raise ImproperlyConfigured(
+                "aiohttp must be installed to record metrics asynchronously."
+            )
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.serializer = serializer
+        self.urls = []
+        for host in _normalize_hosts(hosts):
+            ssl = host.get("use_ssl", use_ssl)
+            self.urls.append(
+                "{scheme}://{host}:{port}{prefix}".format(
+                    scheme="https" if ssl else "http",
+                    host=host.get("host", "localhost"),
+                    port=host.get("port", DEFAULT_PORT),
+                    prefix=host.get("url_prefix", url_prefix).rstrip("/"),
+                )
+            )
+            http_auth = host.get("http_auth", http_auth)
+        if isinstance(http_auth, str):
+            http_auth = http_auth.split(":", 1)
+        self.http_auth = aiohttp.BasicAuth(*http_auth) if http_auth else None
+        self._urls = itertools.cycle(self.urls)
+        # Sessions can't be shared across event loops, so each loop has its
+        # own. Mapping of event loop => (session, guard)
+        self._sessions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    async def _get_session(self):
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            entry = self._sessions.get(loop)
+            if entry is not None and not entry[0].closed:
+                return entry[0]
+            # Sessions of closed event loops can't be used again
+            for each in [each for each in self._sessions if each.is_closed()]:
+                del self._sessions[each]
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.maxsize),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                auth=self.http_auth,
+            )
+            guard = _close_on_shutdown(session)
+            self._sessions[loop] = (session, guard)
+        await guard.__anext__()
+        return session
+
+    async def perform_request(self, method, url, params=None, body=None, headers=None):
+        """Send a request and return the deserialized response.
+
+        :raise: `TransportError <elasticsearch.exceptions.TransportError>` if the
+            request failed.
+        """
+        if body is not None and not isinstance(body, (str, bytes)):
+            body = self.serializer.dumps(body)
+        headers = headers or {"content-type": "application/json"}
+        try:
+            session = await self._get_session()
+            async with session.request(
+                method,
+                next(self._urls) + url,
+                params=params,
+                data=body,
+                headers=headers,
+            ) as response:
+                status = response.status
+                raw_data = await response.text()
+        except asyncio.TimeoutError as e:
+            raise ConnectionTimeout("TIMEOUT", str(e), e) from e
+        except aiohttp.ClientError as e:
+            raise ConnectionError("N/A", str(e), e) from e
+
+        data = self.serializer.loads(raw_data) if raw_data else None
+        if not 200 <= status < 300:
+            error = data.get("error", raw_data) if isinstance(data, dict) else raw_data
+            if isinstance(error, dict):
+                error = error.get("type")
+            raise HTTP_EXCEPTIONS.get(status, TransportError)(status, error, data)
+        return data
+
+    async def bulk(self, actions):
+        """Send actions with the ``_bulk`` API and return the response."""
+        lines = []
+        for action, data in map(expand_action, actions):
+            lines.append(self.serializer.dumps(action))
+            if data is not None:
+                lines.append(self.serializer.dumps(data))
+        return await self.perform_request(
+            "POST",
+            "/_bulk",
+            body="\n".join(lines) + "\n",
+            headers={"content-type": "application/x-ndjson"},
+        )
+
+    async def close(self):
+        """Close the HTTP session of the running event loop."""
+        with self._lock:
+            entry = self._sessions.pop(asyncio.get_event_loop(), None)
+        if entry is not None:
+            session, guard = entry
+            await guard.aclose()
+            await session.close()
+
+
+async def _close_on_shutdown(session):
+    """Close a session when its event loop shuts down async generators, which
+    `asyncio.run` and ``async_to_sync`` do before closing the loop.
+    """
+    try:
+        yield
+    finally:
+        await session.close()
+
+
+class AsyncBatcher(object):
+    """Coalesces metrics saved concurrently on an event loop into a single
+    ``_bulk`` request per connection.
+
+    Metrics saved during the same iteration of the event loop, or within
+    ``max_delay`` seconds of the first pending metric, are sent together.
+
+    :param int max_batch_size: Maximum number of documents in each ``_bulk`` request.
+    :param float max_delay: Number of seconds to wait for more metrics before sending.
+    """
+
+    def __init__(self, max_batch_size=bulk.DEFAULT_CHUNK_SIZE, max_delay=0):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        # Mapping of connection alias => [(action, future)]
+        self._pending = {}
+        self._handle = None
+        # The event loop only keeps weak references to tasks, so in-flight
+        # requests are referenced here until they complete
+        self._tasks = set()
+
+    async def add(self, using, action):
+        """Add an action to the next ``_bulk`` request for the ``using`` connection.
+
+        :return: The ``_bulk`` response item for the action.
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        entries = self._pending.setdefault(using, [])
+        entries.append((action, future))
+        if len(entries) >= self.max_batch_size:
+            self._send_pending(using)
+        elif self._handle is None:
+            if self.max_delay:
+                self._handle = loop.call_later(self.max_delay, self._flush)
+            else:
+                self._handle = loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self):
+        self._handle = None
+        for using in list(self._pending):
+            self._send_pending(using)
+
+    def _send_pending(self, using):
+        entries = self._pending.pop(using)
+        task = asyncio.ensure_future(self._send(using, entries))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Send pending metrics and wait for in-flight requests to complete."""
+        if self._handle is not None:
+            self._handle.cancel()
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _send(self, using, entries):
+        try:
+            response = await get_transport(using).bulk(action for action, _ in entries)
+        except Exception as e:
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), item in zip(entries, response["items"]):
+            if not future.done():
+                _, info = item.popitem()
+                future.set_result(info)
+
+
+_transports = {}
+_batchers = weakref.WeakKeyDictionary()
+
+
+def get_transport(alias="default"):
+    """Return the `AsyncTransport` for a connection alias configured
+    in the ``ELASTICSEARCH_DSL`` setting.
+    """
+    try:
+        return _transports[alias]
+    except KeyError:
+        pass
+    try:
+        conn_settings = settings.ELASTICSEARCH_DSL[alias]
+    except KeyError:
+        raise KeyError("There is no connection with alias %r." % alias)
+    transport = _transports[alias] = AsyncTransport(
+        **dict({"serializer": get_serializer()}, **conn_settings)
+    )
+    return transport
+
+
+def get_batcher():
+    """Return the `AsyncBatcher` for the running event loop."""
+    loop = asyncio.get_event_loop()
+    try:
+        return _batchers[loop]
+    except KeyError:
+        batcher = _batchers[loop] = AsyncBatcher(
+            **getattr(settings, "ELASTICSEARCH_METRICS_ASYNC", {})
+        )
+        return batcher
+
+
+def _reset_after_fork():
+    # HTTP sessions and event loops can't be shared with forked children
+    _transports.clear()
+    _batchers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs):
+    if setting in ("ELASTICSEARCH_DSL", "ELASTICSEARCH_METRICS_SERIALIZER"):
+        _transports.clear()
+    elif setting == "ELASTICSEARCH_METRICS_ASYNC":
+        _batchers.clear()
@@ -1,12 +1,33 @@
-from django.apps import AppConfig
+import os
+
+from django.apps import AppConfig, apps
 from django.conf import settings
 from elasticsearch_dsl.connections import connections
 from django.utils.module_loading import autodiscover_modules
 
+from elasticsearch_metrics.serializer import get_connection_settings
+
+
+def _reset_connections_after_fork():
+    # Clients configured by ELASTICSEARCH_DSL are created again the next time
+    # they are used, so that children don't share sockets with their parent.
+    # Connections added in code are kept: configure() would remove them, and
+    # remove_connection() would also remove the settings of the alias.
+    if not apps.ready:
+        return
+    for alias in settings.ELASTICSEARCH_DSL:
+        connections._conns.pop(alias, None)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_connections_after_fork)
+
 
 class ElasticsearchMetricsConfig(AppConfig):
     name = "elasticsearch_metrics"
 
     def ready(self):
-        connections.configure(**settings.ELASTICSEARCH_DSL)
+        # Only stores the connection settings. Clients are created the first
+        # time each connection is used.
+        connections.configure(**get_connection_settings(settings.ELASTICSEARCH_DSL))
         autodiscover_modules("metrics")
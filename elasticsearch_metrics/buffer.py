@@ -0,0 +1,303 @@
+"""In-process buffering of metrics, sent to Elasticsearch by a background thread.
+
+Buffering is enabled with the ``ELASTICSEARCH_METRICS_BUFFER`` setting, which
+is a dict of keyword arguments passed to `MetricBuffer`.
+
+.. code-block:: python
+
+    ELASTICSEARCH_METRICS_BUFFER = {
+        "max_size": 10000,
+        "flush_size": 500,
+        "flush_interval": 5,
+        "overflow": "drop_oldest",
+    }
+
+Buffers are fork-safe: queued metrics are sent before the process forks,
+and forked children start with an empty buffer of their own. With the
+``socket`` option, metrics are forwarded to an
+`Aggregator <elasticsearch_metrics.aggregator.Aggregator>` that sends the
+metrics of many processes in large ``_bulk`` requests.
+"""
+import atexit
+from collections import deque
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from elasticsearch_metrics import bulk
+from elasticsearch_metrics.aggregator import AggregatorClient
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+logger = logging.getLogger(__name__)
+
+
+class MetricBuffer(object):
+    """Bounded queue of serialized metrics that a daemon thread sends to
+    Elasticsearch with the ``_bulk`` API.
+
+    The queue is sent when it holds ``flush_size`` metrics or when its oldest
+    metric has waited ``flush_interval`` seconds, whichever comes first.
+    The ``post_save`` signal is sent from the background thread.
+
+    :param int max_size: Maximum number of queued metrics.
+    :param int flush_size: Number of queued metrics that triggers a flush.
+    :param float flush_interval: Maximum number of seconds a metric waits in the queue.
+    :param str overflow: What to do when the queue is full: ``"block"`` waits for
+        the queue to be sent, ``"drop_oldest"`` discards the oldest queued metric and
+        ``"drop_newest"`` discards the metric being recorded.
+    :param int chunk_size: Number of documents in each ``_bulk`` request.
+    :param str socket: Path of the socket of an `Aggregator
+        <elasticsearch_metrics.aggregator.Aggregator>` to forward metrics to.
+        Metrics that can't be forwarded are queued. The ``post_save`` signal
+        isn't sent for forwarded metrics.
+    :param float fork_timeout: Maximum number of seconds to wait for queued
+        metrics to be sent before the process forks.
+    """
+
+    def __init__(
+        self,
+        max_size=10000,
+        flush_size=500,
+        flush_interval=5.0,
+        overflow=OVERFLOW_BLOCK,
+        chunk_size=bulk.DEFAULT_CHUNK_SIZE,
+        socket=None,
+        fork_timeout=5.0,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "Invalid overflow policy {!r}. Must be one of: {}".format(
+                    overflow, ", ".join(OVERFLOW_POLICIES)
+                )
+            )
+        self.max_size = max_size
+        self.flush_size = min(flush_size, max_size)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.chunk_size = chunk_size
+        self.fork_timeout = fork_timeout
+        self._client = AggregatorClient(socket) if socket else None
+        # Number of metrics forwarded to an aggregator
+        self.forwarded = 0
+        # Number of metrics discarded because the queue was full
+        self.dropped = 0
+        # Number of metrics that were sent and indexed
+        self.indexed = 0
+        # Number of metrics that were sent and failed to index
+        self.failed = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._done = threading.Condition(self._lock)
+        self._oldest = None
+        self._enqueued = 0
+        self._processed = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread = None
+
+    @property
+    def depth(self):
+        """Number of metrics waiting to be sent."""
+        return len(self._queue)
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "forwarded": self.forwarded,
+            "dropped": self.dropped,
+            "indexed": self.indexed,
+            "failed": self.failed,
+        }
+
+    def put(self, instance, using=None, index=None, validate=True):
+        """Validate and serialize a metric, then add it to the queue.
+
+        :return: `False` if the metric was dropped, `True` otherwise.
+        """
+        entry = (instance,) + bulk.prepare_metric(
+            instance, using=using, index=index, validate=validate
+        )
+        if self._client is not None and self._client.send(entry[1], entry[3]):
+            with self._lock:
+                self.forwarded += 1
+            return True
+        return self.put_action(*entry)
+
+    def put_action(self, instance, using, index, action):
+        """Add a metric that was already prepared with
+        `prepare_metric <elasticsearch_metrics.bulk.prepare_metric>` to the queue.
+
+        :return: `False` if the metric was dropped, `True` otherwise.
+        """
+        entry = (instance, using, index, action)
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                logger.warning("Metric buffer is closed. Dropping %r.", instance)
+                return False
+            if self._thread is None:
+                self._start()
+            if len(self._queue) >= self.max_size:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                elif self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                    self._processed += 1
+                else:
+                    self._ready.notify()
+                    while len(self._queue) >= self.max_size and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        self.dropped += 1
+                        return False
+            if not self._queue:
+                self._oldest = time.monotonic()
+            self._queue.append(entry)
+            self._enqueued += 1
+            if len(self._queue) >= self.flush_size:
+                self._ready.notify()
+        return True
+
+    def flush(self, timeout=None):
+        """Send all queued metrics and wait until they have been sent.
+
+        :return: `False` if ``timeout`` expired before the metrics were sent.
+        """
+        with self._lock:
+            if self._thread is None:
+                return True
+            target = self._enqueued
+            self._flush_requested = True
+            self._ready.notify()
+            return self._done.wait_for(lambda: self._processed >= target, timeout)
+
+    def close(self, timeout=None):
+        """Send all queued metrics and stop the background thread."""
+        with self._lock:
+            self._closed = True
+            self._ready.notify()
+            self._not_full.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        if self._client is not None:
+            self._client.close()
+
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="elasticsearch-metrics-buffer", daemon=True
+        )
+        self._thread.start()
+
+    def _should_flush(self):
+        if self._closed or self._flush_requested:
+            return True
+        if len(self._queue) >= self.flush_size:
+            return True
+        return bool(self._queue) and (
+            time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._should_flush():
+                    timeout = None
+                    if self._queue:
+                        timeout = self._oldest + self.flush_interval - time.monotonic()
+                    self._ready.wait(timeout)
+                entries = list(self._queue)
+                self._queue.clear()
+                self._flush_requested = False
+                closed = self._closed
+                self._not_full.notify_all()
+            failed = self._send(entries) if entries else 0
+            with self._lock:
+                self.failed += failed
+                self.indexed += len(entries) - failed
+                self._processed += len(entries)
+                self._done.notify_all()
+            if closed:
+                return
+
+    def _send(self, entries):
+        """Send entries with the ``_bulk`` API and return the number of failures."""
+        recorder = bulk.BulkRecorder(chunk_size=self.chunk_size, raise_on_error=False)
+        try:
+            for entry in entries:
+                recorder.add_action(*entry)
+            errors = recorder.flush()
+        except Exception:
+            logger.exception("Failed to send %d buffered metric(s).", len(entries))
+            errors = entries
+        if errors:
+            logger.error("%d buffered metric(s) failed to index.", len(errors))
+        return len(errors)
+
+
+_UNSET = object()
+_buffer = _UNSET
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Return the `MetricBuffer` configured by the ``ELASTICSEARCH_METRICS_BUFFER``
+    setting, or `None` if buffering is disabled.
+    """
+    global _buffer
+    if _buffer is _UNSET:
+        with _buffer_lock:
+            if _buffer is _UNSET:
+                buffer_settings = getattr(
+                    settings, "ELASTICSEARCH_METRICS_BUFFER", None
+                )
+                _buffer = MetricBuffer(**buffer_settings) if buffer_settings else None
+    return _buffer
+
+
+def close_buffer(timeout=None):
+    """Send all buffered metrics and stop the background thread."""
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, _UNSET
+    if buffer not in (None, _UNSET):
+        buffer.close(timeout=timeout)
+
+
+def _flush_before_fork():
+    buffer = _buffer
+    if buffer not in (None, _UNSET):
+        if not buffer.flush(timeout=buffer.fork_timeout):
+            logger.warning("Timed out sending buffered metrics before forking.")
+
+
+def _reset_after_fork():
+    global _buffer, _buffer_lock
+    # The child doesn't inherit the background thread, and the parent still
+    # sends the metrics that were queued when it forked
+    _buffer = _UNSET
+    _buffer_lock = threading.Lock()
+
+
+atexit.register(close_buffer)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_flush_before_fork, after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_buffer(setting, **kwargs):
+    if setting == "ELASTICSEARCH_METRICS_BUFFER":
+        close_buffer()
@@ -0,0 +1,402 @@
+"""Bulk recording of metrics using the Elasticsearch ``_bulk`` API."""
+from collections import Counter, OrderedDict
+import functools
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl import connections
+
+from elasticsearch_metrics import signals
+from elasticsearch_metrics import exceptions
+from elasticsearch_metrics.instrumentation import get_instrumentation
+from elasticsearch_metrics.resilience import (
+    OPEN,
+    fail_fast,
+    get_circuit_breaker,
+    get_retry_policy,
+)
+from elasticsearch_metrics.spool import get_spool, is_retryable
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_MAX_CHUNK_BYTES = 100 * 1024 * 1024
+
+_local = threading.local()
+
+
+def get_current_recorder():
+    """Return the innermost active `BulkRecorder` for the current thread,
+    or `None` if no recorder is active.
+    """
+    recorders = getattr(_local, "recorders", None)
+    return recorders[-1] if recorders else None
+
+
+def prepare_metric(instance, using=None, index=None, validate=True):
+    """Prepare a metric instance to be sent with the ``_bulk`` API.
+
+    Defaults the metric's timestamp to now, sends the ``pre_save`` signal,
+    validates the document and serializes it.
+
+    :return: ``(using, index, action)`` tuple.
+    """
+    using = instance.get_write_using(using, instance=instance)
+    index = instance._prepare_save(index=index)
+    signals.pre_save.send(
+        instance.__class__, instance=instance, using=using, index=index
+    )
+    if validate:
+        instance.full_clean(fast=validate == "fast")
+    return using, index, instance.to_bulk_action(index=index)
+
+
+def send_actions(
+    client,
+    actions,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES,
+    **kwargs
+):
+    """Send bulk actions to Elasticsearch, yielding an ``(ok, info)`` tuple
+    for every action, in the order the actions were given.
+
+    Errors (including connection errors) are reported per item rather than raised.
+    Additional keyword arguments (e.g. ``request_timeout``) are passed to
+    ``client.bulk``.
+    """
+    return streaming_bulk(
+        client,
+        actions,
+        chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False,
+        raise_on_exception=False,
+        **kwargs
+    )
+
+
+class BulkRecorder(object):
+    """Collects metrics and persists them with the Elasticsearch ``_bulk`` API.
+
+    Documents are grouped by connection, and each group is sent in chunks of
+    ``chunk_size`` documents. Every action names its index, so documents for
+    different metrics and indices share the same ``_bulk`` requests.
+    Pending documents are sent when a group reaches ``chunk_size``, when `flush`
+    is called, and when the context manager exits.
+
+    While a recorder is used as a context manager, calls to ``Metric.save``
+    and ``Metric.record`` in the current thread are collected by the
+    recorder instead of being sent one request at a time.
+
+    Example usage:
+
+    .. code-block:: python
+
+        from elasticsearch_metrics.bulk import BulkRecorder
+
+        with BulkRecorder(chunk_size=1000):
+            for user_id in user_ids:
+                PageView.record(user_id=user_id)
+
+    The ``pre_save`` signal is sent when a document is added to the recorder and
+    ``post_save`` is sent once the document has been indexed.
+
+    If a spool is configured with the ``ELASTICSEARCH_METRICS_SPOOL`` setting,
+    documents that fail because Elasticsearch is unavailable are written to the
+    spool instead of being reported as errors.
+
+    Documents that fail because Elasticsearch is unavailable are retried if
+    ``ELASTICSEARCH_METRICS_RETRY`` is set, and aren't sent while the
+    connection's circuit breaker is open. See `elasticsearch_metrics.resilience`.
+
+    :param str using: Connection alias to use for metrics that don't specify one.
+    :param int chunk_size: Number of documents in each ``_bulk`` request.
+    :param int max_chunk_bytes: Maximum size of each ``_bulk`` request in bytes.
+    :param bool raise_on_error: Raise `BulkRecordError <elasticsearch_metrics.exceptions.BulkRecordError>`
+        if any documents fail to index. Otherwise, failures are returned by `flush`
+        and collected in ``errors``.
+    """
+
+    def __init__(
+        self,
+        using=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES,
+        raise_on_error=True,
+    ):
+        self.using = using
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.raise_on_error = raise_on_error
+        self.errors = []
+        # Number of documents written to the spool
+        self.spooled = 0
+        # Number of documents dropped because the connection's circuit breaker was open
+        self.dropped = 0
+        # Mapping of connection alias => [(instance, action)]
+        self._pending = OrderedDict()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._pending.values())
+
+    def __enter__(self):
+        if not hasattr(_local, "recorders"):
+            _local.recorders = []
+        _local.recorders.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.recorders.remove(self)
+        # Don't mask the original exception with indexing errors
+        if exc_type is None:
+            self.flush()
+        else:
+            self._flush(raise_on_error=False)
+
+    def add(self, instance, using=None, index=None, validate=True):
+        """Add a metric instance to the pending documents.
+
+        :param Metric instance: Metric to persist.
+        :param str using: Connection alias. Defaults to the recorder's ``using``, then
+            to the metric's connection.
+        :param str index: Index name. Defaults to the index for the metric's timestamp.
+        :param validate: Whether to validate the document before it is added,
+            or ``"fast"`` to only check that required fields are set.
+        """
+        using, index, action = prepare_metric(
+            instance, using=using or self.using, index=index, validate=validate
+        )
+        self.add_action(instance, using, index, action)
+        return instance
+
+    def add_action(self, instance, using, index, action):
+        """Add a metric that was already prepared with `prepare_metric`."""
+        entries = self._pending.setdefault(using, [])
+        entries.append((instance, action))
+        if len(entries) >= self.chunk_size:
+            del self._pending[using]
+            self._send(using, entries, raise_on_error=self.raise_on_error)
+
+    def record(
+        self, metric_cls, timestamp=None, validate=True, sample_rate=None, **kwargs
+    ):
+        """Same as ``Metric.record``, except the metric is added to the pending
+        documents.
+        """
+        instance = metric_cls._sample(sample_rate, timestamp=timestamp, **kwargs)
+        if instance is None:
+            return None
+        return self.add(instance, validate=validate)
+
+    def flush(self):
+        """Send all pending documents to Elasticsearch.
+
+        :return: List of ``(instance, error_info)`` tuples for documents that failed to index.
+        """
+        return self._flush(raise_on_error=self.raise_on_error)
+
+    def _flush(self, raise_on_error):
+        pending, self._pending = self._pending, OrderedDict()
+        errors = []
+        for using, entries in pending.items():
+            errors.extend(self._send(using, entries, raise_on_error=False))
+        if errors and raise_on_error:
+            raise exceptions.BulkRecordError(
+                "{} metric(s) failed to index.".format(len(errors)), errors=errors
+            )
+        return errors
+
+    def _send(self, using, entries, raise_on_error):
+        instrumentation = get_instrumentation()
+        if instrumentation is None:
+            return self._send_entries(using, entries, raise_on_error)
+        metrics = {instance._template_name for instance, _ in entries}
+        start = time.perf_counter()
+        try:
+            errors = self._send_entries(
+                using, entries, raise_on_error, instrumentation=instrumentation
+            )
+        except Exception:
+            for metric in metrics:
+                instrumentation.increment("bulk.flush.errors", tags={"metric": metric})
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            for metric in metrics:
+                instrumentation.timing("bulk.flush", duration, {"metric": metric})
+        return errors
+
+    def _send_entries(self, using, entries, raise_on_error, instrumentation=None):
+        client = connections.get_connection(using)
+        actions = [action for _, action in entries]
+        if instrumentation is not None:
+            actions = _serialize_sources(client, entries, instrumentation)
+        kwargs = {}
+        write_timeouts = [
+            instance._write_timeout
+            for instance, _ in entries
+            if instance._write_timeout is not None
+        ]
+        if write_timeouts:
+            kwargs["request_timeout"] = max(write_timeouts)
+        breaker = get_circuit_breaker(using)
+        retry = get_retry_policy()
+        errors = []
+        # Number of indexed documents per metric, when instrumented
+        indexed = Counter()
+        # (entry, action to send) pairs
+        pending = list(zip(entries, actions))
+        unavailable = []
+        attempt = 0
+        while pending:
+            if breaker is not None and not breaker.allow_request():
+                self._fail_fast(breaker, using, [entry for entry, _ in pending])
+                break
+            unavailable = self._send_pending(
+                client, using, pending, errors, indexed, instrumentation, **kwargs
+            )
+            if breaker is not None:
+                if unavailable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            pending = []
+            if (
+                unavailable
+                and retry is not None
+                and attempt < retry.max_retries
+                and (breaker is None or breaker.state != OPEN)
+            ):
+                retry.sleep(attempt)
+                attempt += 1
+                pending, unavailable = [pair for pair, _ in unavailable], []
+        spool = get_spool()
+        for ((instance, action), _), item in unavailable:
+            if spool is not None and spool.write(using, action):
+                self.spooled += 1
+            else:
+                errors.append((instance, item))
+        if instrumentation is not None:
+            _count_documents(indexed, errors, instrumentation)
+        self.errors.extend(errors)
+        if errors and raise_on_error:
+            raise exceptions.BulkRecordError(
+                "{} metric(s) failed to index.".format(len(errors)), errors=errors
+            )
+        return errors
+
+    def _send_pending(
+        self, client, using, pending, errors, indexed, instrumentation, **kwargs
+    ):
+        """Send ``(entry, action)`` pairs once. Errors are added to ``errors``.
+
+        :return: List of ``((entry, action), error_info)`` tuples for the
+            documents that failed because Elasticsearch is unavailable.
+        """
+        results = send_actions(
+            client,
+            (action for _, action in pending),
+            chunk_size=self.chunk_size,
+            max_chunk_bytes=self.max_chunk_bytes,
+            **kwargs
+        )
+        unavailable = []
+        for pair, (ok, info) in zip(pending, results):
+            instance, action = pair[0]
+            _, item = info.popitem()
+            if ok:
+                if instrumentation is not None:
+                    indexed[instance._template_name] += 1
+                instance._update_meta_from_bulk_item(item)
+                signals.post_save.send(
+                    instance.__class__,
+                    instance=instance,
+                    using=using,
+                    index=action["_index"],
+                )
+            elif is_retryable(item.get("status")):
+                unavailable.append((pair, item))
+            else:
+                errors.append((instance, item))
+        return unavailable
+
+    def _fail_fast(self, breaker, using, entries):
+        """Spool or drop entries that aren't sent because the circuit breaker is open."""
+        for instance, action in entries:
+            if fail_fast(breaker, instance, using, action):
+                self.spooled += 1
+            else:
+                self.dropped += 1
+
+
+def _serialize_sources(client, entries, instrumentation):
+    """Return the actions of entries with their ``_source`` serialized, and
+    report the serialization time and size. Serialized sources are sent as-is
+    by the ``_bulk`` helpers, so documents are still only serialized once.
+    """
+    serializer = client.transport.serializer
+    actions = []
+    # Serialization time and size per metric
+    durations = Counter()
+    sizes = Counter()
+    for instance, action in entries:
+        start = time.perf_counter()
+        action = dict(action, _source=serializer.dumps(action["_source"]))
+        durations[instance._template_name] += time.perf_counter() - start
+        sizes[instance._template_name] += len(action["_source"].encode("utf-8"))
+        actions.append(action)
+    for metric, duration in durations.items():
+        tags = {"metric": metric}
+        instrumentation.timing("bulk.serialize", duration, tags)
+        instrumentation.increment("bulk.bytes", sizes[metric], tags)
+    return actions
+
+
+def _count_documents(indexed, errors, instrumentation):
+    failed = Counter(instance._template_name for instance, _ in errors)
+    for metric, count in indexed.items():
+        instrumentation.increment("bulk.documents", count, {"metric": metric})
+    for metric, count in failed.items():
+        instrumentation.increment("bulk.errors", count, {"metric": metric})
+
+
+class TransactionBulkRecorder(BulkRecorder):
+    """Same as `BulkRecorder`, except that metrics added inside a database
+    transaction are only added to the pending documents once the transaction
+    commits. Metrics added in a transaction that is rolled back are discarded.
+
+    Metrics are validated and serialized when they are added, regardless of
+    whether a transaction is active.
+
+    :param str db_alias: Database connection to track transactions on.
+    """
+
+    def __init__(self, db_alias=DEFAULT_DB_ALIAS, **kwargs):
+        super(TransactionBulkRecorder, self).__init__(**kwargs)
+        self.db_alias = db_alias
+        self._closed = False
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super(TransactionBulkRecorder, self).__exit__(exc_type, exc_value, traceback)
+        self._closed = True
+
+    def add(self, instance, using=None, index=None, validate=True):
+        using, index, action = prepare_metric(
+            instance, using=using or self.using, index=index, validate=validate
+        )
+        if transaction.get_connection(self.db_alias).in_atomic_block:
+            transaction.on_commit(
+                functools.partial(self._add_committed, instance, using, index, action),
+                using=self.db_alias,
+            )
+        else:
+            self.add_action(instance, using, index, action)
+        return instance
+
+    def _add_committed(self, instance, using, index, action):
+        self.add_action(instance, using, index, action)
+        # The transaction committed after the recorder exited, so nothing else
+        # will send the metric
+        if self._closed:
+            self._flush(raise_on_error=False)
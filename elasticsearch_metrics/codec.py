@@ -0,0 +1,149 @@
+"""Serializers and validators compiled from the fields of metric classes.
+
+`Document.to_dict` and `Document.full_clean` look up the field for every
+value and go through several layers of field methods. For metrics that only
+have scalar fields (i.e. no `Object` or `Nested` fields), `FlatCodec`
+resolves what has to be done for each field once, when the metric class is
+defined, and produces the same results.
+
+Custom fields that override ``clean``, ``serialize`` or ``deserialize``
+aren't compiled, since the codec doesn't call those methods.
+"""
+from elasticsearch_dsl import field as edsl_field
+from elasticsearch_dsl.exceptions import ValidationException
+from elasticsearch_dsl.field import Field, Object
+from elasticsearch_dsl.utils import AttrList
+
+from elasticsearch_metrics.field import Date
+
+_EMPTY = ([], {}, None)
+_LIST_TYPES = (list, AttrList, tuple)
+# Field methods that the codec replaces
+_REPLACED_METHODS = ("clean", "serialize", "deserialize")
+
+_stock_fields = None
+
+
+def _get_stock_fields():
+    """Return the field classes of elasticsearch_dsl and elasticsearch_metrics."""
+    global _stock_fields
+    if _stock_fields is None:
+        _stock_fields = {
+            value
+            for value in vars(edsl_field).values()
+            if isinstance(value, type) and issubclass(value, Field)
+        }
+        _stock_fields.add(Date)
+    return _stock_fields
+
+
+def _is_compilable(field):
+    """Return whether the codec produces the same results as a field's methods,
+    i.e. whether neither the field's class nor any custom base class overrides
+    ``clean``, ``serialize`` or ``deserialize``.
+    """
+    stock_fields = _get_stock_fields()
+    for klass in type(field).__mro__:
+        if klass in stock_fields:
+            return True
+        if any(name in vars(klass) for name in _REPLACED_METHODS):
+            return False
+    return False
+
+
+def _to_list(value):
+    # Same as Field.serialize/deserialize for fields that don't convert values
+    if isinstance(value, _LIST_TYPES):
+        return list(value)
+    return value
+
+
+def _get_serializer(field):
+    """Return the function that `Document.to_dict` applies to a field's values,
+    or `None` if values are left as is.
+    """
+    if not field._coerce:
+        return None
+    if type(field)._serialize is Field._serialize:
+        return _to_list
+    return field.serialize
+
+
+def _get_deserializer(field):
+    """Return the function that `Field.clean` applies to a field's values."""
+    if type(field)._deserialize is Field._deserialize:
+        return _to_list
+    return field.deserialize
+
+
+class FlatCodec(object):
+    """Serializer and validator for documents whose fields are all scalar.
+
+    Use `compile` to create a codec from a document's mapping.
+    """
+
+    def __init__(self, fields):
+        # Mapping of field names => serializer, for fields whose values are converted
+        self.serializers = {}
+        # Tuple of (name, deserializer, required) for each field
+        self.validators = []
+        for name, field in fields:
+            serializer = _get_serializer(field)
+            if serializer is not None:
+                self.serializers[name] = serializer
+            self.validators.append((name, _get_deserializer(field), field._required))
+        self.validators = tuple(self.validators)
+
+    @classmethod
+    def compile(cls, mapping):
+        """Return a codec for the fields of a `Mapping <elasticsearch_dsl.Mapping>`,
+        or `None` if it has object or nested fields, or custom fields that
+        override ``clean``, ``serialize`` or ``deserialize``.
+        """
+        fields = [(name, mapping[name]) for name in mapping]
+        if any(
+            isinstance(field, Object) or not _is_compilable(field)
+            for _, field in fields
+        ):
+            return None
+        return cls(fields)
+
+    def to_dict(self, data, skip_empty=True):
+        """Same as `Document.to_dict` for a document's ``_d_`` dict."""
+        serializers = self.serializers
+        out = {}
+        for name, value in data.items():
+            serializer = serializers.get(name)
+            if serializer is not None:
+                value = serializer(value)
+            elif type(value) is AttrList:
+                value = value._l_
+            if skip_empty and value in _EMPTY:
+                continue
+            out[name] = value
+        return out
+
+    def clean(self, data, fast=False):
+        """Same as `Document.clean_fields` for a document's ``_d_`` dict.
+
+        :param bool fast: Only check that required fields are set, without
+            converting values to the fields' types.
+        """
+        errors = {}
+        for name, deserializer, required in self.validators:
+            value = data.get(name)
+            if value is not None and not fast:
+                try:
+                    value = deserializer(value)
+                except ValidationException as error:
+                    errors.setdefault(name, []).append(error)
+                    continue
+            if required and value in _EMPTY:
+                errors.setdefault(name, []).append(
+                    ValidationException("Value required for this field.")
+                )
+                continue
+            if name in data or value not in _EMPTY:
+                data[name] = value
+        if errors:
+            raise ValidationException(errors)
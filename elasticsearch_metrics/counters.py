@@ -0,0 +1,290 @@
+"""In-process accumulation of counter metrics.
+
+Increments of `CounterMetric <elasticsearch_metrics.metrics.CounterMetric>`
+subclasses are summed in memory, per metric class, time bucket and
+combination of dimension values, and a daemon thread saves one document
+per key with the ``_bulk`` API.
+
+The accumulator is configured with the ``ELASTICSEARCH_METRICS_COUNTERS``
+setting, which is a dict of keyword arguments passed to `CounterAccumulator`.
+
+.. code-block:: python
+
+    ELASTICSEARCH_METRICS_COUNTERS = {
+        "flush_interval": 10,
+        "max_keys": 10000,
+    }
+"""
+import atexit
+import datetime as dt
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from elasticsearch_metrics import bulk
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+
+
+class CounterAccumulator(object):
+    """Thread-safe, process-local totals of counter increments.
+
+    Every ``flush_interval`` seconds, a daemon thread saves the totals of
+    the time buckets that have ended. All totals are saved when the number
+    of keys reaches ``max_keys``, when `flush` is called, before the process
+    forks and when the process exits.
+
+    :param float flush_interval: Number of seconds between flushes of ended buckets.
+    :param int max_keys: Number of keys that triggers a flush of all totals.
+    :param int chunk_size: Number of documents in each ``_bulk`` request.
+    :param float fork_timeout: Maximum number of seconds to wait for the
+        totals to be saved before the process forks.
+    """
+
+    def __init__(
+        self,
+        flush_interval=10.0,
+        max_keys=10000,
+        chunk_size=bulk.DEFAULT_CHUNK_SIZE,
+        fork_timeout=5.0,
+    ):
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.chunk_size = chunk_size
+        self.fork_timeout = fork_timeout
+        # Number of documents that were saved
+        self.indexed = 0
+        # Number of documents that failed to save
+        self.failed = 0
+        # Number of increments discarded because the accumulator was closed
+        self.dropped = 0
+        # Mapping of (metric class, bucket start, dimensions) => [count, sum]
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._done = threading.Condition(self._lock)
+        self._flush_requested = False
+        # Number of flushes requested from, and completed by, the background thread
+        self._requested = 0
+        self._completed = 0
+        self._closed = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._totals)
+
+    def stats(self):
+        return {
+            "keys": len(self),
+            "dropped": self.dropped,
+            "indexed": self.indexed,
+            "failed": self.failed,
+        }
+
+    def add(self, metric_cls, dimensions, value=1, timestamp=None):
+        """Add an increment to the totals of a counter metric.
+
+        :param type metric_cls: `CounterMetric` subclass.
+        :param dict dimensions: Values of the metric's dimension fields.
+        :param value: Amount added to the ``sum`` of the key.
+        :param datetime timestamp: Time of the increment. Defaults to now.
+        :return: `False` if the increment was dropped, `True` otherwise.
+        """
+        bucket = metric_cls.get_bucket(timestamp)
+        key = (
+            metric_cls,
+            bucket,
+            tuple(
+                (name, tuple(value) if isinstance(value, list) else value)
+                for name, value in sorted(dimensions.items())
+            ),
+        )
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                logger.warning(
+                    "Counter accumulator is closed. Dropping increment of %s.",
+                    metric_cls.__name__,
+                )
+                return False
+            if self._thread is None:
+                self._start()
+            totals = self._totals.get(key)
+            if totals is None:
+                self._totals[key] = [1, value]
+                if len(self._totals) >= self.max_keys:
+                    self._flush_requested = True
+                    self._wakeup.notify()
+            else:
+                totals[0] += 1
+                totals[1] += value
+        return True
+
+    def flush(self):
+        """Save all totals in the current thread.
+
+        :return: Number of documents that failed to save.
+        """
+        with self._lock:
+            totals, self._totals = self._totals, {}
+        return self._send(totals)
+
+    def request_flush(self, timeout=None):
+        """Have the background thread save all totals and wait until they
+        have been saved.
+
+        :return: `False` if ``timeout`` expired before the totals were saved.
+        """
+        with self._lock:
+            if self._thread is None or self._closed:
+                return True
+            self._requested += 1
+            target = self._requested
+            self._flush_requested = True
+            self._wakeup.notify()
+            return self._done.wait_for(lambda: self._completed >= target, timeout)
+
+    def close(self, timeout=None):
+        """Save all totals and stop the background thread."""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="elasticsearch-metrics-counters", daemon=True
+        )
+        self._thread.start()
+
+    def _take_ended(self):
+        """Remove and return the totals of the buckets that have ended."""
+        now = dt.datetime.now(dt.timezone.utc)
+        ended = {
+            key: totals
+            for key, totals in self._totals.items()
+            if key[1] + key[0]._bucket_interval <= now
+        }
+        for key in ended:
+            del self._totals[key]
+        return ended
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not (self._closed or self._flush_requested):
+                    self._wakeup.wait(self.flush_interval)
+                closed = self._closed
+                if closed or self._flush_requested:
+                    totals, self._totals = self._totals, {}
+                else:
+                    totals = self._take_ended()
+                self._flush_requested = False
+                requested = self._requested
+            self._send(totals)
+            with self._lock:
+                self._completed = requested
+                self._done.notify_all()
+            if closed:
+                return
+
+    def _send(self, totals):
+        """Save one document per key and return the number of failures."""
+        if not totals:
+            return 0
+        recorder = bulk.BulkRecorder(chunk_size=self.chunk_size, raise_on_error=False)
+        try:
+            for (metric_cls, bucket, dimensions), (count, total) in totals.items():
+                fields = {
+                    name: list(value) if isinstance(value, tuple) else value
+                    for name, value in dimensions
+                }
+                recorder.add(
+                    metric_cls(timestamp=bucket, count=count, sum=total, **fields)
+                )
+            failed = len(recorder.flush())
+        except Exception:
+            logger.exception("Failed to save %d counter metric(s).", len(totals))
+            failed = len(totals)
+        if failed:
+            logger.error("%d counter metric(s) failed to index.", failed)
+        with self._lock:
+            self.failed += failed
+            self.indexed += len(totals) - failed
+        return failed
+
+
+def get_bucket(timestamp, interval):
+    """Return the start of the time bucket of length ``interval`` that
+    contains ``timestamp`` (defaults to now). Buckets are aligned on the Unix
+    epoch in UTC. Naive timestamps are assumed to be in UTC.
+    """
+    if timestamp is None:
+        timestamp = dt.datetime.now(dt.timezone.utc)
+    elif timezone.is_naive(timestamp):
+        timestamp = timestamp.replace(tzinfo=dt.timezone.utc)
+    elapsed = timestamp - _EPOCH
+    return _EPOCH + (elapsed - elapsed % interval)
+
+
+_UNSET = object()
+_accumulator = _UNSET
+_accumulator_lock = threading.Lock()
+
+
+def get_accumulator():
+    """Return the `CounterAccumulator` configured by the
+    ``ELASTICSEARCH_METRICS_COUNTERS`` setting.
+    """
+    global _accumulator
+    if _accumulator is _UNSET:
+        with _accumulator_lock:
+            if _accumulator is _UNSET:
+                _accumulator = CounterAccumulator(
+                    **getattr(settings, "ELASTICSEARCH_METRICS_COUNTERS", {})
+                )
+    return _accumulator
+
+
+def close_accumulator(timeout=None):
+    """Save all counter totals and stop the background thread."""
+    global _accumulator
+    with _accumulator_lock:
+        accumulator, _accumulator = _accumulator, _UNSET
+    if accumulator is not _UNSET:
+        accumulator.close(timeout=timeout)
+
+
+def _flush_before_fork():
+    accumulator = _accumulator
+    if accumulator is not _UNSET:
+        if not accumulator.request_flush(timeout=accumulator.fork_timeout):
+            logger.warning("Timed out saving counter totals before forking.")
+
+
+def _reset_after_fork():
+    global _accumulator, _accumulator_lock
+    # Totals were saved before forking, and the child doesn't inherit the
+    # background thread
+    _accumulator = _UNSET
+    _accumulator_lock = threading.Lock()
+
+
+atexit.register(close_accumulator)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_flush_before_fork, after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_accumulator(setting, **kwargs):
+    if setting == "ELASTICSEARCH_METRICS_COUNTERS":
+        close_accumulator()
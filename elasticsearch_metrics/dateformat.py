@@ -0,0 +1,192 @@
+"""Helpers for the date formats used in metric index names."""
+import datetime as dt
+import re
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULT_DATE_FORMAT = "%Y.%m.%d"
+
+# Date formats for the values of a metric's Meta.index_granularity
+INDEX_GRANULARITIES = {
+    "hourly": "%Y.%m.%d.%H",
+    "daily": DEFAULT_DATE_FORMAT,
+    # ISO 8601 week-numbering year and week
+    "weekly": "%G.W%V",
+    "monthly": "%Y.%m",
+    "yearly": "%Y",
+}
+
+# strftime directives that format a time of day, by the finest unit they use
+_TIME_DIRECTIVES = (
+    ("microsecond", re.compile(r"%[fsz]")),
+    ("second", re.compile(r"%[ScXTr]")),
+    ("minute", re.compile(r"%[MR]")),
+    ("hour", re.compile(r"%[HIpkl]")),
+)
+
+# Formats that start with these directives produce index names that can be
+# matched by a wildcard for a whole year, month or day
+_PREFIXES = (
+    ("year", re.compile(r"^%Y[^%]*")),
+    ("month", re.compile(r"^%Y[^%]*%m[^%]*")),
+    ("day", re.compile(r"^%Y[^%]*%m[^%]*%d[^%]*")),
+)
+
+# Maximum number of patterns returned by get_date_patterns
+MAX_DATE_PATTERNS = 100
+
+# strptime needs a weekday to turn a week number into a date
+_WEEK_DIRECTIVES = re.compile(r"%[GVUW]")
+_WEEKDAY_DIRECTIVES = re.compile(r"%[aAwu]")
+
+_date_format = None
+_resolutions = {}
+
+
+def get_date_format():
+    """Return the ``ELASTICSEARCH_METRICS_DATE_FORMAT`` setting."""
+    global _date_format
+    if _date_format is None:
+        _date_format = getattr(
+            settings, "ELASTICSEARCH_METRICS_DATE_FORMAT", DEFAULT_DATE_FORMAT
+        )
+    return _date_format
+
+
+@receiver(setting_changed)
+def _reset_date_format(setting, **kwargs):
+    global _date_format
+    if setting == "ELASTICSEARCH_METRICS_DATE_FORMAT":
+        _date_format = None
+
+
+def get_resolution(dateformat):
+    """Return the finest unit of time that a date format distinguishes:
+    ``"day"``, ``"hour"``, ``"minute"``, ``"second"`` or ``"microsecond"``.
+    """
+    try:
+        return _resolutions[dateformat]
+    except KeyError:
+        pass
+    resolution = "day"
+    for unit, pattern in _TIME_DIRECTIVES:
+        if pattern.search(dateformat.replace("%%", "")):
+            resolution = unit
+            break
+    _resolutions[dateformat] = resolution
+    return resolution
+
+
+def truncate(date, dateformat):
+    """Truncate a date or datetime to the resolution of a date format, so that
+    dates with the same formatted value compare equal.
+    """
+    if not isinstance(date, dt.datetime):
+        return date
+    resolution = get_resolution(dateformat)
+    if resolution == "day":
+        return date.date()
+    elif resolution == "hour":
+        return date.replace(minute=0, second=0, microsecond=0)
+    elif resolution == "minute":
+        return date.replace(second=0, microsecond=0)
+    elif resolution == "second":
+        return date.replace(microsecond=0)
+    return date
+
+
+def parse_date(value, dateformat):
+    """Parse a date formatted with a date format back into a datetime. For
+    week-based formats, the Monday of the week is returned.
+
+    :return: A naive datetime, or `None` if the value doesn't match the date format.
+    """
+    plain_format = dateformat.replace("%%", "")
+    if _WEEK_DIRECTIVES.search(plain_format) and not _WEEKDAY_DIRECTIVES.search(
+        plain_format
+    ):
+        # Monday is 1 for both %u (ISO weeks) and %w (%U and %W weeks)
+        weekday = "%u" if "%V" in plain_format else "%w"
+        value, dateformat = value + "|1", dateformat + "|" + weekday
+    try:
+        return dt.datetime.strptime(value, dateformat)
+    except ValueError:
+        return None
+
+
+def _to_datetime(date, end=False):
+    """Convert the bound of a date range to a naive datetime. Aware datetimes
+    are converted to UTC, which is the timezone of recorded timestamps.
+    """
+    if not isinstance(date, dt.datetime):
+        date = dt.datetime.combine(date, dt.time.max if end else dt.time.min)
+    elif date.tzinfo is not None:
+        date = date.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def _next(date, unit):
+    if unit == "year":
+        return dt.datetime(date.year + 1, 1, 1)
+    elif unit == "month":
+        if date.month == 12:
+            return dt.datetime(date.year + 1, 1, 1)
+        return dt.datetime(date.year, date.month + 1, 1)
+    elif unit == "day":
+        return dt.datetime(date.year, date.month, date.day) + dt.timedelta(days=1)
+    return date.replace(minute=0, second=0, microsecond=0) + dt.timedelta(hours=1)
+
+
+def _is_start_of(date, unit):
+    if unit == "year" and (date.month, date.day) != (1, 1):
+        return False
+    if unit in ("year", "month") and date.day != 1:
+        return False
+    return date.time() == dt.time.min
+
+
+def get_date_patterns(start, end, dateformat):
+    """Return a list of index name suffixes that match every index between
+    ``start`` and ``end`` (inclusive). Whole years, months or days are matched
+    with a wildcard when the date format allows it, e.g. ``2020.*``.
+
+    Returns `None` if the range can't be expressed with at most
+    `MAX_DATE_PATTERNS` patterns.
+
+    :param start: Start of the range. A date or datetime.
+    :param end: End of the range. A date or datetime.
+    :param str dateformat: Date format used in the index names.
+    """
+    resolution = get_resolution(dateformat)
+    if resolution not in ("day", "hour"):
+        return None
+    # Wildcards that would match the whole date format aren't needed
+    prefixes = []
+    for unit, regex in _PREFIXES:
+        match = regex.match(dateformat)
+        if match and match.group() != dateformat:
+            prefixes.append((unit, match.group()))
+    current = _to_datetime(start)
+    if resolution == "day":
+        current = current.replace(hour=0, minute=0, second=0, microsecond=0)
+    stop = _to_datetime(end, end=True)
+    patterns = []
+    while current <= stop:
+        for unit, prefix in prefixes:
+            next_date = _next(current, unit)
+            if _is_start_of(current, unit) and next_date - stop <= dt.timedelta(
+                microseconds=1
+            ):
+                pattern = current.strftime(prefix) + "*"
+                break
+        else:
+            pattern = current.strftime(dateformat)
+            next_date = _next(current, resolution)
+        if pattern not in patterns:
+            if len(patterns) == MAX_DATE_PATTERNS:
+                return None
+            patterns.append(pattern)
+        current = next_date
+    return patterns
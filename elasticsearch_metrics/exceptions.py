@@ -14,3 +14,10 @@ class IndexTemplateOutOfSyncError(ElasticsearchMetricsError):
         self.patterns_in_sync = patterns_in_sync
         self.settings_in_sync = settings_in_sync
         super(IndexTemplateOutOfSyncError, self).__init__(message)
+
+
+class BulkRecordError(ElasticsearchMetricsError):
+    def __init__(self, message, errors):
+        # List of (instance, error_info) tuples
+        self.errors = errors
+        super(BulkRecordError, self).__init__(message)
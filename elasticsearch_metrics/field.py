@@ -1,21 +1,53 @@
+import sys
+
 from django.conf import settings
 from elasticsearch_dsl import field as edsl_field
 
-__all__ = ["Date"]
 # Expose all fields from elasticsearch_dsl.field
 # We do this instead of 'from elasticsearch_dsl.field import *' because elasticsearch_metrics
-# has its own subclass of Date
-for each in (
-    field_name
-    for field_name in dir(edsl_field)
-    if field_name != "Date" and not field_name.startswith("_")
-):
-    field = getattr(edsl_field, each)
-    is_field_subclass = isinstance(field, type) and issubclass(field, edsl_field.Field)
-    if field is edsl_field.Field or is_field_subclass:
-        globals()[each] = field
-        field.__module__ = __name__
-        __all__.append(each)
+# has its own subclass of Date.
+# Fields are looked up the first time they are accessed, so that importing
+# this module doesn't scan elasticsearch_dsl.field.
+_fields = None
+
+
+def _get_fields():
+    global _fields
+    if _fields is None:
+        fields = {}
+        for each in dir(edsl_field):
+            if each == "Date" or each.startswith("_"):
+                continue
+            field = getattr(edsl_field, each)
+            is_field_subclass = isinstance(field, type) and issubclass(
+                field, edsl_field.Field
+            )
+            if field is edsl_field.Field or is_field_subclass:
+                field.__module__ = __name__
+                fields[each] = field
+        _fields = fields
+    return _fields
+
+
+def __getattr__(name):
+    if name == "__all__":
+        return ["Date"] + list(_get_fields())
+    try:
+        return _get_fields()[name]
+    except KeyError:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        ) from None
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_get_fields()))
+
+
+# Module __getattr__ requires Python 3.7
+if sys.version_info < (3, 7):
+    globals().update(_get_fields())
+    __all__ = ["Date"] + list(_get_fields())
 
 
 class Date(edsl_field.Date):
@@ -0,0 +1,250 @@
+"""Instrumentation of the client-side costs of recording metrics.
+
+The backend is chosen with the ``ELASTICSEARCH_METRICS_INSTRUMENTATION``
+setting, which is either the name or import path of a backend, or a dict
+with a ``"backend"`` key and keyword arguments passed to the backend:
+
+* ``"statsd"``: `StatsdInstrumentation`, which requires
+  `statsd <https://statsd.readthedocs.io/>`_.
+* ``"prometheus"``: `PrometheusInstrumentation`, which requires
+  `prometheus_client <https://github.com/prometheus/client_python>`_.
+* The import path of an `Instrumentation` subclass or instance.
+
+.. code-block:: python
+
+    ELASTICSEARCH_METRICS_INSTRUMENTATION = {
+        "backend": "statsd",
+        "host": "localhost",
+        "port": 8125,
+    }
+
+Instrumentation is disabled by default, which costs a single check per
+instrumented call.
+
+Timings are reported in seconds, with the ``metric`` tag set to the
+metric's template name:
+
+* ``save``, ``save.validate`` and ``save.request``: `Metric.save`, its
+  validation, and its request to Elasticsearch (including serialization).
+* ``record``: `Metric.record`, including `save`.
+* ``bulk.flush`` and ``bulk.serialize``: `BulkRecorder` sending a ``_bulk``
+  request (reported for each metric in the request), and serializing
+  each metric's documents.
+* ``sync_index_template`` and ``check_index_template``.
+
+Counters:
+
+* ``<timing>.errors``: Number of timed calls that raised an exception.
+* ``save.documents`` and ``bulk.documents``: Number of documents indexed.
+* ``bulk.errors``: Number of documents that failed to index.
+* ``bulk.bytes``: Size of the serialized documents sent with the ``_bulk`` API.
+* ``record.dropped``: Number of metrics dropped by sampling.
+* ``save.shipped``: Number of metrics sent to the ``ship_metrics`` daemon.
+* ``circuit_breaker.spooled`` and ``circuit_breaker.dropped``: Number of
+  metrics spooled or dropped because a circuit breaker is open.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class Instrumentation(object):
+    """Instrumentation backend that discards everything. Subclasses
+    override `increment` and `timing`.
+    """
+
+    def increment(self, name, value=1, tags=None):
+        """Add ``value`` to a counter.
+
+        :param str name: Name of the counter, e.g. ``"bulk.documents"``.
+        :param dict tags: Tags of the counter, e.g. ``{"metric": "myapp_pageview"}``.
+        """
+
+    def timing(self, name, seconds, tags=None):
+        """Report the duration of an operation.
+
+        :param str name: Name of the timing, e.g. ``"save"``.
+        :param float seconds: Duration of the operation.
+        :param dict tags: Tags of the timing.
+        """
+
+
+class StatsdInstrumentation(Instrumentation):
+    """Sends counters and timings to statsd. Since statsd doesn't support
+    tags, tag values are appended to the name, e.g.
+    ``elasticsearch_metrics.save.myapp_pageview``.
+
+    :param client: A `statsd.StatsClient`. Defaults to a client created with
+        ``prefix`` and ``kwargs``.
+    :param str prefix: Prefix of the names sent to statsd.
+    """
+
+    def __init__(self, client=None, prefix="elasticsearch_metrics", **kwargs):
+        if client is None:
+            import statsd
+
+            client = statsd.StatsClient(prefix=prefix, **kwargs)
+        self.client = client
+
+    def _get_name(self, name, tags):
+        if not tags:
+            return name
+        return ".".join([name] + [str(tags[key]) for key in sorted(tags)])
+
+    def increment(self, name, value=1, tags=None):
+        self.client.incr(self._get_name(name, tags), value)
+
+    def timing(self, name, seconds, tags=None):
+        # statsd timings are in milliseconds
+        self.client.timing(self._get_name(name, tags), seconds * 1000)
+
+
+class PrometheusInstrumentation(Instrumentation):
+    """Records counters and timings with prometheus_client. Counters are
+    exported as ``<namespace>_<name>_total`` and timings as
+    ``<namespace>_<name>_seconds`` histograms, with dots in names replaced
+    by underscores.
+
+    :param registry: A `prometheus_client.CollectorRegistry`. Defaults to
+        the global registry.
+    :param str namespace: Prefix of the exported names.
+    """
+
+    def __init__(self, registry=None, namespace="elasticsearch_metrics"):
+        import prometheus_client
+
+        self._prometheus = prometheus_client
+        self.registry = registry or prometheus_client.REGISTRY
+        self.namespace = namespace
+        # Mapping of (name, label names) => collector
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get_collector(self, collector_cls, name, tags):
+        labelnames = tuple(sorted(tags)) if tags else ()
+        key = (name, labelnames)
+        try:
+            collector = self._collectors[key]
+        except KeyError:
+            with self._lock:
+                collector = self._collectors.get(key)
+                if collector is None:
+                    collector = self._collectors[key] = collector_cls(
+                        name,
+                        "elasticsearch_metrics {}".format(name),
+                        labelnames=labelnames,
+                        namespace=self.namespace,
+                        registry=self.registry,
+                    )
+        return collector.labels(**tags) if tags else collector
+
+    def increment(self, name, value=1, tags=None):
+        name = name.replace(".", "_")
+        self._get_collector(self._prometheus.Counter, name, tags).inc(value)
+
+    def timing(self, name, seconds, tags=None):
+        name = "{}_seconds".format(name.replace(".", "_"))
+        self._get_collector(self._prometheus.Histogram, name, tags).observe(seconds)
+
+
+BACKENDS = {
+    "statsd": StatsdInstrumentation,
+    "prometheus": PrometheusInstrumentation,
+}
+
+
+class Timer(object):
+    """Context manager that reports the duration of its block, and counts
+    the exceptions raised in it as ``<name>.errors``.
+    """
+
+    __slots__ = ("instrumentation", "name", "tags", "start")
+
+    def __init__(self, instrumentation, name, tags):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.tags = tags
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.timing(
+            self.name, time.perf_counter() - self.start, self.tags
+        )
+        if exc_type is not None:
+            self.instrumentation.increment(self.name + ".errors", tags=self.tags)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_null_timer = _NullTimer()
+
+_UNSET = object()
+_instrumentation = _UNSET
+_instrumentation_lock = threading.Lock()
+
+
+def _create_instrumentation(config):
+    if not config:
+        return None
+    kwargs = {}
+    if isinstance(config, dict):
+        kwargs = dict(config)
+        config = kwargs.pop("backend")
+    if isinstance(config, str):
+        config = BACKENDS[config] if config in BACKENDS else import_string(config)
+    return config(**kwargs) if isinstance(config, type) else config
+
+
+def get_instrumentation():
+    """Return the `Instrumentation` configured by the
+    ``ELASTICSEARCH_METRICS_INSTRUMENTATION`` setting, or `None` if
+    instrumentation is disabled.
+    """
+    global _instrumentation
+    if _instrumentation is _UNSET:
+        with _instrumentation_lock:
+            if _instrumentation is _UNSET:
+                _instrumentation = _create_instrumentation(
+                    getattr(settings, "ELASTICSEARCH_METRICS_INSTRUMENTATION", None)
+                )
+    return _instrumentation
+
+
+def timer(name, **tags):
+    """Return a context manager that reports the duration of its block
+    with the configured instrumentation.
+    """
+    instrumentation = get_instrumentation()
+    if instrumentation is None:
+        return _null_timer
+    return Timer(instrumentation, name, tags)
+
+
+def increment(name, value=1, **tags):
+    """Add ``value`` to a counter of the configured instrumentation."""
+    instrumentation = get_instrumentation()
+    if instrumentation is not None:
+        instrumentation.increment(name, value, tags)
+
+
+@receiver(setting_changed)
+def _reset_instrumentation(setting, **kwargs):
+    global _instrumentation
+    if setting == "ELASTICSEARCH_METRICS_INSTRUMENTATION":
+        _instrumentation = _UNSET
@@ -6,6 +6,7 @@ from django.utils.termcolors import colorize
 
 from elasticsearch_metrics.registry import registry
 from elasticsearch_metrics import exceptions
+from elasticsearch_metrics.metrics import get_index_templates
 from elasticsearch_metrics.management.color import color_style
 
 
@@ -19,7 +20,7 @@ class Command(BaseCommand):
             action="store",
             dest="connection",
             default=None,
-            help='Elasticsearch connection to use. Defaults to the "default" connection.',
+            help="Elasticsearch connection to use. Defaults to each metric's connection for writes.",
         )
 
     def handle(self, *args, **options):
@@ -38,17 +39,21 @@ class Command(BaseCommand):
 
         out_of_sync_count = 0
         self.stdout.write("Checking for outdated index templates...")
-        for app_label in app_labels:
-            metrics = registry.get_metrics(app_label=app_label)
-            for metric in metrics:
-                try:
-                    metric.check_index_template(using=connection)
-                except (
-                    exceptions.IndexTemplateNotFoundError,
-                    exceptions.IndexTemplateOutOfSyncError,
-                ) as error:
-                    self.stdout.write("  " + error.args[0])
-                    out_of_sync_count += 1
+        metrics = [
+            metric
+            for app_label in app_labels
+            for metric in registry.get_metrics(app_label=app_label)
+        ]
+        templates = get_index_templates(metrics, using=connection)
+        for metric in metrics:
+            try:
+                metric.compare_index_template(templates[metric])
+            except (
+                exceptions.IndexTemplateNotFoundError,
+                exceptions.IndexTemplateOutOfSyncError,
+            ) as error:
+                self.stdout.write("  " + error.args[0])
+                out_of_sync_count += 1
 
         if out_of_sync_count:
             self.stdout.write(
@@ -0,0 +1,263 @@
+import csv
+import datetime as dt
+import gzip
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+from elasticsearch.helpers import scan
+from elasticsearch_dsl import Date, Nested, Object, Q, connections
+
+from elasticsearch_metrics.registry import registry
+from elasticsearch_metrics.management.color import color_style
+from elasticsearch_metrics.serializer import get_serializer
+
+FORMATS = ("ndjson", "csv")
+# Field types that don't have doc values by default
+NO_DOC_VALUES_TYPES = ("text", "binary")
+
+
+def parse_date_argument(value):
+    """Parse a ``--start`` or ``--end`` argument as a datetime or a date."""
+    try:
+        # Dates are parsed first, so that --end includes the whole day
+        parsed = parse_date(value) or parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(
+            "Invalid date '{}'. Use YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS.".format(value)
+        )
+    return parsed
+
+
+def parse_query(value):
+    """Parse a ``--query`` argument as JSON query DSL, or as a query string."""
+    try:
+        query = json.loads(value)
+    except ValueError:
+        return Q("query_string", query=value)
+    if not isinstance(query, dict):
+        raise CommandError("Invalid query '{}'. Must be a JSON object.".format(value))
+    return Q(query)
+
+
+def get_docvalue_fields(metric):
+    """Return ``(path, field, multi)`` tuples for the leaf fields of a metric,
+    whose values are fetched with ``docvalue_fields`` when ``_source`` is disabled.
+    """
+
+    def iter_fields(mapping, prefix="", multi=False):
+        for name in mapping:
+            field = mapping[name]
+            path = prefix + name
+            if isinstance(field, Nested):
+                raise CommandError(
+                    "Can't export nested field '{}' of {} because _source "
+                    "is disabled.".format(path, metric.__name__)
+                )
+            if isinstance(field, Object):
+                for each in iter_fields(
+                    field._mapping, path + ".", multi or field._multi
+                ):
+                    yield each
+                continue
+            definition = field.to_dict()
+            if not definition.get(
+                "doc_values", definition.get("type") not in NO_DOC_VALUES_TYPES
+            ):
+                raise CommandError(
+                    "Can't export field '{}' of {} because _source is disabled "
+                    "and the field has no doc values.".format(path, metric.__name__)
+                )
+            yield path, field, multi or field._multi
+
+    return list(iter_fields(metric._doc_type.mapping))
+
+
+def source_enabled(metric):
+    """Return whether the metric's indices store ``_source``."""
+    source = metric._doc_type.mapping._meta.get("_source", {})
+    return source.get("enabled", True)
+
+
+class Command(BaseCommand):
+    help = "Export the documents of a metric as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "metric", help="Metric to export, in the form <app_label>.<MetricName>."
+        )
+        parser.add_argument(
+            "--start",
+            action="store",
+            dest="start",
+            default=None,
+            help="Only export metrics recorded at or after this date or datetime.",
+        )
+        parser.add_argument(
+            "--end",
+            action="store",
+            dest="end",
+            default=None,
+            help="Only export metrics recorded at or before this date or datetime.",
+        )
+        parser.add_argument(
+            "--query",
+            action="store",
+            dest="query",
+            default=None,
+            help="Only export metrics matching this JSON query DSL or query string.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            dest="format",
+            default="ndjson",
+            help="Output format. Defaults to ndjson.",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            action="store",
+            dest="output",
+            default=None,
+            help="File to write to. Defaults to stdout. Compressed with gzip if the name ends with .gz.",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            dest="gzip",
+            default=False,
+            help="Compress the output file with gzip.",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            dest="page_size",
+            default=1000,
+            help="Number of documents fetched in each request.",
+        )
+        parser.add_argument(
+            "--connection",
+            action="store",
+            dest="connection",
+            default=None,
+            help="Elasticsearch connection to use. Defaults to the metric's connection for reads.",
+        )
+
+    def handle(self, *args, **options):
+        # Avoid elasticsearch requests from getting logged
+        logging.getLogger("elasticsearch").setLevel(logging.CRITICAL)
+        style = color_style()
+        try:
+            metric = registry.get_metric(options["metric"])
+        except (LookupError, ValueError):
+            raise CommandError("No metric named '{}'.".format(options["metric"]))
+        start = parse_date_argument(options["start"]) if options["start"] else None
+        end = parse_date_argument(options["end"]) if options["end"] else None
+        output = options["output"]
+        compress = options["gzip"] or (output or "").endswith(".gz")
+        if compress and not output:
+            raise CommandError("--gzip requires --output.")
+
+        search = metric.search(using=options["connection"], start=start, end=end)
+        if options["query"]:
+            search = search.query(parse_query(options["query"]))
+        if source_enabled(metric):
+            fields = None
+        else:
+            fields = get_docvalue_fields(metric)
+            # Field names rather than objects with a format, which require
+            # Elasticsearch 6.4
+            search = search.source(False).extra(
+                docvalue_fields=[path for path, _, _ in fields]
+            )
+        # Unsorted, so that Elasticsearch pages in index order without
+        # sorting or loading any field into memory
+        hits = scan(
+            connections.get_connection(search._using),
+            query=search.to_dict(),
+            index=search._index,
+            size=options["page_size"],
+            **search._params
+        )
+        documents = (self.to_document(hit, fields) for hit in hits)
+
+        if output is None:
+            count = self.write(metric, documents, self.stdout, options["format"])
+            self.stderr.write(
+                "Exported {} metric(s).".format(count), style_func=style.SUCCESS
+            )
+            return
+        if compress:
+            fp = gzip.open(output, "wt", encoding="utf-8", newline="")
+        else:
+            fp = open(output, "w", encoding="utf-8", newline="")
+        with fp:
+            count = self.write(metric, documents, fp, options["format"])
+        self.stdout.write(
+            "Exported {} metric(s) to {}.".format(count, output), style.SUCCESS
+        )
+
+    def to_document(self, hit, fields):
+        """Return the document of a hit, rebuilt from its doc values if
+        ``fields`` is given.
+        """
+        if fields is None:
+            return hit["_source"]
+        document = {}
+        values = hit.get("fields", {})
+        for path, field, multi in fields:
+            if path not in values:
+                continue
+            field_values = values[path]
+            if isinstance(field, Date):
+                field_values = [self.format_date(value) for value in field_values]
+            target = document
+            parts = path.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = field_values if multi else field_values[0]
+        return document
+
+    def format_date(self, value):
+        """Format a date doc value, which Elasticsearch 6 returns as
+        milliseconds since the epoch, like the dates of ``_source``.
+        """
+        if not isinstance(value, (int, float)):
+            return value
+        return dt.datetime.fromtimestamp(value / 1000, tz=dt.timezone.utc).isoformat()
+
+    def write(self, metric, documents, fp, output_format):
+        """Write documents to ``fp`` one at a time and return the number written."""
+        count = 0
+        if output_format == "csv":
+            columns = self.get_columns(metric)
+            writer = csv.writer(fp, lineterminator="\n")
+            writer.writerow(columns)
+            for document in documents:
+                writer.writerow(
+                    [self.format_cell(document.get(column)) for column in columns]
+                )
+                count += 1
+        else:
+            serializer = get_serializer()
+            for document in documents:
+                fp.write(serializer.dumps(document) + "\n")
+                count += 1
+        return count
+
+    def get_columns(self, metric):
+        """Return the metric's field names in definition order, timestamp first."""
+        return ["timestamp"] + [
+            name for name in metric._doc_type.mapping if name != "timestamp"
+        ]
+
+    def format_cell(self, value):
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list)):
+            return get_serializer().dumps(value)
+        return value
@@ -0,0 +1,111 @@
+import logging
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch.exceptions import TransportError
+from elasticsearch_dsl import connections
+
+from elasticsearch_metrics.registry import registry
+from elasticsearch_metrics.management.color import color_style
+
+
+class Command(BaseCommand):
+    help = "Deletes the indices of metrics that are older than their Meta.retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_label", nargs="?", help="App label of an application to prune."
+        )
+        parser.add_argument(
+            "--connection",
+            action="store",
+            dest="connection",
+            default=None,
+            help="Elasticsearch connection to use. Defaults to each metric's connection for writes.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            default=False,
+            help="Only list the indices that would be deleted.",
+        )
+        parser.add_argument(
+            "--max-indices",
+            type=int,
+            dest="max_indices",
+            default=None,
+            help="Maximum number of indices to delete.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            dest="batch_size",
+            default=50,
+            help="Number of indices to delete in each request.",
+        )
+
+    def handle(self, *args, **options):
+        # Avoid elasticsearch requests from getting logged
+        logging.getLogger("elasticsearch").setLevel(logging.CRITICAL)
+        style = color_style()
+        connection = options["connection"]
+        if options["app_label"]:
+            if options["app_label"] not in registry.all_metrics:
+                raise CommandError(
+                    "No metrics found for app '{}'".format(options["app_label"])
+                )
+            metrics = registry.get_metrics(app_label=options["app_label"])
+        else:
+            metrics = registry.get_metrics()
+        if connection:
+            self.stdout.write("Using connection: '{}'".format(connection))
+
+        remaining = options["max_indices"]
+        deleted = 0
+        failed = False
+        for metric in metrics:
+            if metric._retention is None:
+                continue
+            if remaining is not None and remaining <= 0:
+                self.stdout.write(
+                    "Reached the maximum number of indices to delete.", style.WARNING
+                )
+                break
+            metric_name = style.METRIC(metric.__name__)
+            expired = metric.get_expired_indices(using=connection)
+            if remaining is not None:
+                expired = expired[:remaining]
+                remaining -= len(expired)
+            self.stdout.write(
+                "  {} -> {} expired index(es)".format(metric_name, len(expired))
+            )
+            if options["dry_run"]:
+                for index_name in expired:
+                    self.stdout.write("    {}".format(index_name))
+                continue
+            client = connections.get_connection(metric._get_using(connection))
+            batch_size = options["batch_size"]
+            for i in range(0, len(expired), batch_size):
+                batch = expired[i : i + batch_size]
+                try:
+                    client.indices.delete(
+                        index=",".join(batch), ignore_unavailable=True
+                    )
+                except TransportError as error:
+                    failed = True
+                    self.stderr.write(
+                        "    Failed to delete {} index(es): {}".format(
+                            len(batch), error
+                        )
+                    )
+                else:
+                    deleted += len(batch)
+
+        if options["dry_run"]:
+            self.stdout.write("Dry run. No indices were deleted.", style.SUCCESS)
+            return
+        if failed:
+            self.stdout.write("Deleted {} index(es).".format(deleted), style.ERROR)
+            sys.exit(1)
+        self.stdout.write("Deleted {} index(es).".format(deleted), style.SUCCESS)
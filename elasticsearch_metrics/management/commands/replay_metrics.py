@@ -0,0 +1,144 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import itertools
+import logging
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch_dsl import connections
+
+from elasticsearch_metrics import bulk
+from elasticsearch_metrics.management.color import color_style
+from elasticsearch_metrics.spool import get_spool, is_retryable
+
+
+class Command(BaseCommand):
+    help = "Send metrics that were written to the spool to Elasticsearch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--connection",
+            action="store",
+            dest="connection",
+            default=None,
+            help="Elasticsearch connection to use. Defaults to the connection each metric was saved with.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            dest="chunk_size",
+            default=bulk.DEFAULT_CHUNK_SIZE,
+            help="Number of documents in each bulk request.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            dest="concurrency",
+            default=4,
+            help="Maximum number of concurrent bulk requests.",
+        )
+        parser.add_argument(
+            "--include-stale",
+            action="store_true",
+            dest="include_stale",
+            default=False,
+            help="Also replay segments left behind by processes that are no longer running.",
+        )
+
+    def handle(self, *args, **options):
+        # Avoid elasticsearch requests from getting logged
+        logging.getLogger("elasticsearch").setLevel(logging.CRITICAL)
+        style = color_style()
+        spool = get_spool()
+        if spool is None:
+            raise CommandError(
+                "Spooling is not enabled. Set ELASTICSEARCH_METRICS_SPOOL to enable it."
+            )
+        segments = spool.segments(include_stale=options["include_stale"])
+        self.stdout.write(
+            "Replaying {} segment(s) from {}...".format(len(segments), spool.path)
+        )
+        totals = {"indexed": 0, "requeued": 0, "failed": 0}
+        for segment in segments:
+            claimed = spool.claim(segment)
+            if claimed is None:
+                # Another process is replaying this segment
+                continue
+            counts = self.replay_segment(spool, claimed, options)
+            os.remove(claimed)
+            for key, value in counts.items():
+                totals[key] += value
+            self.stdout.write(
+                "  {}: {indexed} indexed, {requeued} requeued, {failed} failed".format(
+                    os.path.basename(segment), **counts
+                )
+            )
+            if counts["requeued"] and not counts["indexed"]:
+                self.stdout.write(
+                    "Elasticsearch is unavailable. Stopping replay.", style.ERROR
+                )
+                break
+        spool.close()
+
+        summary = "Replayed metrics: {indexed} indexed, {requeued} requeued, {failed} failed.".format(
+            **totals
+        )
+        if totals["failed"] or totals["requeued"]:
+            self.stdout.write(summary, style.ERROR)
+            sys.exit(1)
+        self.stdout.write(summary, style.SUCCESS)
+
+    def replay_segment(self, spool, segment_path, options):
+        """Send the metrics in a segment with at most ``concurrency`` bulk
+        requests in flight. Metrics that fail with a retryable error are written
+        back to the spool.
+        """
+        counts = {"indexed": 0, "requeued": 0, "failed": 0}
+        concurrency = options["concurrency"]
+        chunks = self.iter_chunks(spool.read(segment_path), options["chunk_size"])
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            for using, chunk in chunks:
+                if len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.handle_results(spool, future.result(), counts)
+                pending.add(
+                    executor.submit(
+                        self.send_chunk, options["connection"] or using, using, chunk
+                    )
+                )
+            for future in pending:
+                self.handle_results(spool, future.result(), counts)
+        return counts
+
+    def iter_chunks(self, entries, chunk_size):
+        """Yield ``(using, actions)`` tuples with up to ``chunk_size`` actions each."""
+        for using, group in itertools.groupby(entries, key=lambda entry: entry[0]):
+            while True:
+                chunk = [action for _, action in itertools.islice(group, chunk_size)]
+                if not chunk:
+                    break
+                yield using, chunk
+
+    def send_chunk(self, connection, using, chunk):
+        client = connections.get_connection(connection)
+        results = bulk.send_actions(client, chunk, chunk_size=len(chunk))
+        return using, list(zip(chunk, results))
+
+    def handle_results(self, spool, results, counts):
+        using, results = results
+        for action, (ok, info) in results:
+            if ok:
+                counts["indexed"] += 1
+                continue
+            _, item = info.popitem()
+            if is_retryable(item.get("status")) and spool.write(using, action):
+                counts["requeued"] += 1
+            else:
+                counts["failed"] += 1
+                self.stderr.write(
+                    "  Failed to index metric in {}: {}".format(
+                        action.get("_index"), item.get("error")
+                    )
+                )
@@ -0,0 +1,112 @@
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from elasticsearch_metrics import bulk
+from elasticsearch_metrics.aggregator import Aggregator
+from elasticsearch_metrics.management.color import color_style
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the metrics received over a Unix socket to Elasticsearch until stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            action="store",
+            dest="socket",
+            default=None,
+            help="Path of the socket to receive metrics on. Defaults to the socket in ELASTICSEARCH_METRICS_SHIPPER.",
+        )
+        parser.add_argument(
+            "--flush-size",
+            type=int,
+            dest="flush_size",
+            default=5000,
+            help="Number of received metrics that triggers a flush.",
+        )
+        parser.add_argument(
+            "--flush-interval",
+            type=float,
+            dest="flush_interval",
+            default=1.0,
+            help="Maximum number of seconds a metric waits to be sent.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            dest="chunk_size",
+            default=bulk.DEFAULT_CHUNK_SIZE,
+            help="Number of documents in each bulk request.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            dest="concurrency",
+            default=2,
+            help="Maximum number of concurrent bulk requests.",
+        )
+        parser.add_argument(
+            "--stats-interval",
+            type=float,
+            dest="stats_interval",
+            default=60.0,
+            help="Number of seconds between reports of the shipped metrics. 0 disables reports.",
+        )
+
+    def handle(self, *args, **options):
+        # Avoid elasticsearch requests from getting logged
+        logging.getLogger("elasticsearch").setLevel(logging.CRITICAL)
+        style = color_style()
+        path = options["socket"]
+        if path is None:
+            shipper_settings = getattr(settings, "ELASTICSEARCH_METRICS_SHIPPER", None)
+            path = (shipper_settings or {}).get("socket")
+        if not path:
+            raise CommandError(
+                "No socket to receive metrics on. Pass --socket or set ELASTICSEARCH_METRICS_SHIPPER."
+            )
+        aggregator = Aggregator(
+            path,
+            flush_size=options["flush_size"],
+            flush_interval=options["flush_interval"],
+            chunk_size=options["chunk_size"],
+            concurrency=options["concurrency"],
+        )
+        self.stopped = threading.Event()
+        previous_handlers = {
+            signum: signal.signal(signum, self.stop)
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            aggregator.start()
+            self.stdout.write("Shipping metrics received on {}...".format(path))
+            while not self.stopped.wait(options["stats_interval"] or None):
+                self.write_stats(aggregator)
+            self.stdout.write("Stopping. Sending pending metrics...")
+        finally:
+            aggregator.close()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        stats = aggregator.stats()
+        self.write_stats(
+            aggregator,
+            style.ERROR if stats["failed"] or stats["dropped"] else style.SUCCESS,
+        )
+
+    def stop(self, signum, frame):
+        self.stopped.set()
+
+    def write_stats(self, aggregator, style_func=None):
+        self.stdout.write(
+            "Shipped metrics: {received} received, {indexed} indexed, "
+            "{spooled} spooled, {failed} failed, {dropped} dropped.".format(
+                **aggregator.stats()
+            ),
+            style_func,
+        )
@@ -1,7 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+
 from django.core.management.base import BaseCommand, CommandError
+from elasticsearch.exceptions import TransportError
 
 from elasticsearch_metrics.registry import registry
 from elasticsearch_metrics.management.color import color_style
+from elasticsearch_metrics.metrics import get_index_templates
 
 
 class Command(BaseCommand):
@@ -18,7 +23,22 @@ class Command(BaseCommand):
             action="store",
             dest="connection",
             default=None,
-            help='Elasticsearch connection to use. Defaults to the "default" connection.',
+            help="Elasticsearch connection to use. Defaults to each metric's connection for writes.",
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            dest="jobs",
+            default=1,
+            help="Number of index templates to synchronize concurrently.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            dest="force",
+            default=False,
+            help="Synchronize index templates even if they are unchanged.",
         )
 
     def handle(self, *args, **options):
@@ -32,14 +52,21 @@ class Command(BaseCommand):
             app_labels = [options["app_label"]]
         else:
             app_labels = registry.all_metrics.keys()
+        if options["jobs"] < 1:
+            raise CommandError("--jobs must be at least 1.")
         if connection:
             self.stdout.write("Using connection: '{}'".format(connection))
+        failed_count = 0
         for app_label in app_labels:
             self.stdout.write(
                 "Syncing metrics for app: '{}'".format(app_label), style.MIGRATE_HEADING
             )
             metrics = registry.get_metrics(app_label=app_label)
-            for metric in metrics:
+            if not options["force"]:
+                metrics = self.skip_unchanged(metrics, connection, style)
+            for metric, error in self.sync_metrics(
+                metrics, connection, options["jobs"]
+            ):
                 metric_name = style.METRIC(metric.__name__)
                 template_name = metric._template_name
                 template = style.ES_TEMPLATE(metric._template)
@@ -48,6 +75,49 @@ class Command(BaseCommand):
                         **locals()
                     )
                 )
-                metric.sync_index_template(using=connection)
+                if error is not None:
+                    failed_count += 1
+                    self.stdout.write("    Failed: {}".format(error), style.ERROR)
 
+        if failed_count:
+            self.stdout.write(
+                "{} metric(s) failed to synchronize.".format(failed_count), style.ERROR
+            )
+            sys.exit(1)
         self.stdout.write("Synchronized metrics.", style.SUCCESS)
+
+    def skip_unchanged(self, metrics, connection, style):
+        """Return the metrics whose index template has changed since it was
+        last synchronized, fetching all templates in a single request.
+        """
+        templates = get_index_templates(metrics, using=connection)
+        changed = []
+        for metric in metrics:
+            if metric.is_index_template_current(templates[metric]):
+                self.stdout.write(
+                    "  Skipping {} (unchanged)".format(style.METRIC(metric.__name__))
+                )
+            else:
+                changed.append(metric)
+        return changed
+
+    def sync_metrics(self, metrics, connection, jobs):
+        """Synchronize the index templates of metrics using up to ``jobs`` threads.
+        Yields ``(metric, error)`` tuples as each metric is synchronized.
+        """
+
+        def sync(metric):
+            try:
+                metric.sync_index_template(using=connection)
+            except TransportError as error:
+                return metric, error
+            return metric, None
+
+        if jobs == 1:
+            for metric in metrics:
+                yield sync(metric)
+            return
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(sync, metric) for metric in metrics]
+            for future in as_completed(futures):
+                yield future.result()
@@ -1,27 +1,101 @@
 from collections import ChainMap
+import datetime as dt
+import functools
+import hashlib
+import json
 import logging
+import random
+import sys
 
 from django.apps import apps
-from django.conf import settings
 from django.utils import timezone
-from elasticsearch.exceptions import NotFoundError
-from elasticsearch_dsl import Document, connections
+from elasticsearch.exceptions import NotFoundError, TransportError
+from elasticsearch_dsl import Document, Mapping, connections
 from elasticsearch_dsl.document import IndexMeta, MetaField
+from elasticsearch_dsl.field import Double, Float, Long
 from elasticsearch_dsl.index import Index
+from elasticsearch_dsl.utils import DOC_META_FIELDS, META_FIELDS
 
+from elasticsearch_metrics import bulk
+from elasticsearch_metrics.aggregator import get_shipper
+from elasticsearch_metrics.buffer import get_buffer
+from elasticsearch_metrics.codec import FlatCodec
+from elasticsearch_metrics import counters
+from elasticsearch_metrics import instrumentation
+from elasticsearch_metrics import resilience
+from elasticsearch_metrics.dateformat import (  # noqa: F401
+    DEFAULT_DATE_FORMAT,
+    INDEX_GRANULARITIES,
+    get_date_format,
+    get_date_patterns,
+    parse_date,
+    truncate,
+)
 from elasticsearch_metrics import signals
 from elasticsearch_metrics import exceptions
 from elasticsearch_metrics.registry import registry
+from elasticsearch_metrics.routers import router
+from elasticsearch_metrics.spool import get_spool, is_retryable
 
 # Fields should be imported from this module
-from elasticsearch_metrics.field import *  # noqa: F40
+from elasticsearch_metrics import field as _field
 from elasticsearch_metrics.field import Date
 
-DEFAULT_DATE_FORMAT = "%Y.%m.%d"
+# Maximum number of index names cached per metric class
+INDEX_NAME_CACHE_SIZE = 256
+# Maximum length of the comma-separated template names in a get template request
+MAX_TEMPLATE_NAMES_LENGTH = 2048
+# Field that stores the inverse of the sample rate of sampled metrics
+SAMPLE_WEIGHT_FIELD = "sample_weight"
 
 logger = logging.getLogger(__name__)
 
 
+def __getattr__(name):
+    # Fields are resolved lazily from elasticsearch_metrics.field
+    if name == "__all__":
+        # Same names as a module without __all__, plus the fields
+        public = [each for each in globals() if not each.startswith("_")]
+        return public + [each for each in _field._get_fields() if each not in public]
+    try:
+        return _field._get_fields()[name]
+    except KeyError:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        ) from None
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_field._get_fields()))
+
+
+# Module __getattr__ requires Python 3.7
+if sys.version_info < (3, 7):
+    from elasticsearch_metrics.field import *  # noqa: F401,F403
+
+
+def _get_fingerprint(template_data):
+    """Return a stable hash of an index template body."""
+    data = json.dumps(template_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def _split_fingerprint(mappings):
+    """Return the fingerprint stored in an index template's mappings and
+    the mappings without it.
+    """
+    fingerprint = None
+    result = {}
+    for doc_type, mapping in mappings.items():
+        meta = dict(mapping.get("_meta", {}))
+        fingerprint = meta.pop("fingerprint", fingerprint)
+        mapping = {key: value for key, value in mapping.items() if key != "_meta"}
+        if meta:
+            mapping["_meta"] = meta
+        result[doc_type] = mapping
+    return fingerprint, result
+
+
 class ReadonlyAttrMap:
     def __init__(self, inner_obj):
         self.__inner_obj = inner_obj
@@ -36,6 +110,55 @@ class ReadonlyAttrMap:
         return hasattr(self.__inner_obj, key)
 
 
+class IndexNameCache(dict):
+    """Mapping of dates => index names for a metric class. The cache is
+    cleared when the date format changes.
+    """
+
+    def __init__(self, maxsize=INDEX_NAME_CACHE_SIZE):
+        super(IndexNameCache, self).__init__()
+        self.maxsize = maxsize
+        self.dateformat = None
+
+
+class MetricIndex(Index):
+    """Index that caches dicts built from its configuration until it is modified."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache = {}
+
+    def cached(self, key, func):
+        """Return ``func()``, computed once until the index is modified.
+        The result is shared and must not be modified.
+        """
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = func()
+            return value
+
+    def settings(self, **kwargs):
+        self._cache.clear()
+        return super().settings(**kwargs)
+
+    def aliases(self, **kwargs):
+        self._cache.clear()
+        return super().aliases(**kwargs)
+
+    def analyzer(self, *args, **kwargs):
+        self._cache.clear()
+        return super().analyzer(*args, **kwargs)
+
+    def mapping(self, mapping):
+        self._cache.clear()
+        return super().mapping(mapping)
+
+    def document(self, document):
+        self._cache.clear()
+        return super().document(document)
+
+
 class MetricMeta(IndexMeta):
     """Metaclass for the base `Metric` class."""
 
@@ -45,6 +168,13 @@ class MetricMeta(IndexMeta):
         module = attrs.get("__module__")
 
         new_cls = super(MetricMeta, mcls).__new__(mcls, name, bases, attrs)
+        new_cls._index_name_cache = IndexNameCache()
+        sample_rate = mcls.get_sample_rate_option(name, meta)
+        if sample_rate is not None:
+            new_cls._sample_rate = sample_rate
+            new_cls._doc_type.mapping.field(SAMPLE_WEIGHT_FIELD, Float())
+        # Serializer and validator for metrics with only scalar fields
+        new_cls._codec = FlatCodec.compile(new_cls._doc_type.mapping)
         # Also ensure initialization is only performed for subclasses of Metric
         # (excluding Metric class itself).
         if not any(
@@ -55,20 +185,49 @@ class MetricMeta(IndexMeta):
         template_name = getattr(meta, "template_name", None)
         template = getattr(meta, "template", None)
         abstract = getattr(meta, "abstract", False)
+        date_format = mcls.get_date_format_option(name, meta)
+        retention = getattr(meta, "retention", None)
+        write_using = getattr(meta, "write_using", None)
+        read_using = getattr(meta, "read_using", None)
+        bucket_interval = getattr(meta, "bucket_interval", None)
+        write_timeout = getattr(meta, "write_timeout", None)
+        # Metrics without an explicit date format, retention, connection,
+        # bucket interval or write timeout inherit their parent's
+        if date_format is not None:
+            new_cls._date_format = date_format
+        if retention is not None:
+            if not isinstance(retention, dt.timedelta):
+                retention = dt.timedelta(days=retention)
+            new_cls._retention = retention
+        if write_using is not None:
+            new_cls._write_using = write_using
+        if read_using is not None:
+            new_cls._read_using = read_using
+        if bucket_interval is not None:
+            if not isinstance(bucket_interval, dt.timedelta):
+                bucket_interval = dt.timedelta(seconds=bucket_interval)
+            if bucket_interval <= dt.timedelta(0):
+                raise ValueError(
+                    "Invalid bucket_interval for metric class {}: {!r}. Must be "
+                    "positive.".format(name, bucket_interval)
+                )
+            new_cls._bucket_interval = bucket_interval
+        if write_timeout is not None:
+            new_cls._write_timeout = write_timeout
 
         app_label = getattr(meta, "app_label", None)
         # Look for an application configuration to attach the model to.
-        app_config = apps.get_containing_app_config(module)
-        if app_label is None:
+        # Abstract metrics don't need one, so that they can be defined
+        # before the app registry is ready (e.g. CounterMetric).
+        if app_label is None and not abstract:
+            app_config = apps.get_containing_app_config(module)
             if app_config is None:
-                if not abstract:
-                    raise RuntimeError(
-                        "Metric class %s.%s doesn't declare an explicit "
-                        "app_label and isn't in an application in "
-                        "INSTALLED_APPS." % (module, name)
-                    )
-            else:
-                app_label = app_config.label
+                raise RuntimeError(
+                    "Metric class %s.%s doesn't declare an explicit "
+                    "app_label and isn't in an application in "
+                    "INSTALLED_APPS." % (module, name)
+                )
+            app_label = app_config.label
 
         if not template_name or not template:
             metric_name = new_cls.__name__.lower()
@@ -87,20 +246,59 @@ class MetricMeta(IndexMeta):
             registry.register(app_label, new_cls)
         return new_cls
 
+    @staticmethod
+    def get_date_format_option(name, meta):
+        """Return the date format set by ``Meta.date_format`` or
+        ``Meta.index_granularity``, if any.
+        """
+        date_format = getattr(meta, "date_format", None)
+        granularity = getattr(meta, "index_granularity", None)
+        if granularity is None:
+            return date_format
+        if date_format is not None:
+            raise ValueError(
+                "Metric class {} can't set both date_format and "
+                "index_granularity.".format(name)
+            )
+        try:
+            return INDEX_GRANULARITIES[granularity]
+        except KeyError:
+            raise ValueError(
+                "Invalid index_granularity for metric class {}: {!r}. "
+                "Must be one of: {}.".format(
+                    name, granularity, ", ".join(INDEX_GRANULARITIES)
+                )
+            )
+
+    @staticmethod
+    def get_sample_rate_option(name, meta):
+        """Return the sample rate set by ``Meta.sample_rate``, if any."""
+        sample_rate = getattr(meta, "sample_rate", None)
+        if sample_rate is not None and not 0 < sample_rate <= 1:
+            raise ValueError(
+                "Invalid sample_rate for metric class {}: {!r}. Must be greater "
+                "than 0 and at most 1.".format(name, sample_rate)
+            )
+        return sample_rate
+
     # Override IndexMeta.construct_index so that
     # a new Index is created for every metric class
     # and Index attrs are inherited
     @classmethod
     def construct_index(cls, opts, bases):
         parent_configs = [
-            base._index.to_dict() for base in bases if hasattr(base, "_index")
+            base._index.cached("dict", base._index.to_dict)
+            if isinstance(base._index, MetricIndex)
+            else base._index.to_dict()
+            for base in bases
+            if hasattr(base, "_index")
         ]
         if opts:
             index_config = ChainMap(ReadonlyAttrMap(opts), *parent_configs)
         else:
             index_config = ChainMap(*parent_configs)
 
-        i = Index(
+        i = MetricIndex(
             index_config.get("name", "*"),
             using=index_config.get("using", "default"),
         )
@@ -135,14 +333,42 @@ class BaseMetric(metaclass=MetricMeta):
 
     timestamp = Date(doc_values=True, required=True)
 
+    # Date format of index names, or None to use the
+    # ELASTICSEARCH_METRICS_DATE_FORMAT setting
+    _date_format = None
+    # How long to keep indices for, or None to keep them forever
+    _retention = None
+    # Connections set by Meta.write_using and Meta.read_using
+    _write_using = None
+    _read_using = None
+    # Fraction of metrics kept by record, or None to keep all of them
+    _sample_rate = None
+    # Timeout of requests that save metrics, or None to use the connection's
+    _write_timeout = None
+
     class Meta:
         source = MetaField(enabled=False)
 
     @classmethod
     def sync_index_template(cls, using=None):
-        """Sync the index template for this metric in Elasticsearch."""
+        """Sync the index template for this metric in Elasticsearch.
+
+        A fingerprint of the template is stored in the ``_meta`` of its
+        mappings, so that unchanged templates can be detected without
+        comparing their contents.
+        """
+        with instrumentation.timer("sync_index_template", metric=cls._template_name):
+            return cls._sync_index_template(using=using)
+
+    @classmethod
+    def _sync_index_template(cls, using=None):
+        using = cls.get_write_using(using)
         index_template = cls.get_index_template()
-        index_template.document(cls)
+        fingerprint_mapping = Mapping(cls._doc_type.name)
+        fingerprint_mapping.meta(
+            "_meta", {"fingerprint": cls._get_index_template_fingerprint()}
+        )
+        index_template.mapping(fingerprint_mapping)
         signals.pre_index_template_create.send(
             cls, index_template=index_template, using=using
         )
@@ -162,7 +388,12 @@ class BaseMetric(metaclass=MetricMeta):
         :return: True if index template exsits and mappings, settings, and index patterns
             are in sync.
         """
-        client = connections.get_connection(using or "default")
+        with instrumentation.timer("check_index_template", metric=cls._template_name):
+            return cls._check_index_template(using=using)
+
+    @classmethod
+    def _check_index_template(cls, using=None):
+        client = connections.get_connection(cls.get_write_using(using))
         try:
             template = client.indices.get_template(cls._template_name)
         except NotFoundError as client_error:
@@ -172,48 +403,80 @@ class BaseMetric(metaclass=MetricMeta):
                 "{template_name} does not exist for {metric_name}".format(**locals()),
                 client_error=client_error,
             ) from client_error
+        return cls.compare_index_template(list(template.values())[0])
+
+    @classmethod
+    def compare_index_template(cls, current_data):
+        """Check if class is in sync with an index template fetched from Elasticsearch.
+
+        :param dict current_data: The index template, or `None` if it doesn't exist.
+        :raise: IndexTemplateNotFoundError if ``current_data`` is `None`.
+        :raise: IndexTemplateOutOfSyncError if mappings, settings, or index patterns
+            are out of sync.
+        :return: True if mappings, settings, and index patterns are in sync.
+        """
+        if current_data is None:
+            template_name = cls._template_name
+            metric_name = cls.__name__
+            raise exceptions.IndexTemplateNotFoundError(
+                "{template_name} does not exist for {metric_name}".format(**locals()),
+                client_error=None,
+            )
+        template_data = cls._get_index_template_data()
+        fingerprint, current_mappings = _split_fingerprint(current_data["mappings"])
+        if fingerprint == cls._get_index_template_fingerprint():
+            return True
+
+        mappings_in_sync = current_mappings == template_data["mappings"]
+        if "settings" in current_data and "index" in current_data["settings"]:
+            current_settings = current_data["settings"]["index"]
+            template_settings = dict(template_data.get("settings", {}))
+            # ES automatically casts number_of_shards and number_of_replicas to a string
+            # so we need to cast before we compare
+            # TODO: Are there other settings that need to be handled?
+            number_settings = {"number_of_shards", "number_of_replicas"}
+            for setting in number_settings:
+                if setting in template_settings:
+                    template_settings[setting] = str(template_settings[setting])
+            settings_in_sync = current_settings == template_settings
         else:
-            current_data = list(template.values())[0]
-            template_data = cls.get_index_template().to_dict()
-
-            mappings_in_sync = current_data["mappings"] == template_data["mappings"]
-            if "settings" in current_data and "index" in current_data["settings"]:
-                current_settings = current_data["settings"]["index"]
-                template_settings = template_data.get("settings", {})
-                # ES automatically casts number_of_shards and number_of_replicas to a string
-                # so we need to cast before we compare
-                # TODO: Are there other settings that need to be handled?
-                number_settings = {"number_of_shards", "number_of_replicas"}
-                for setting in number_settings:
-                    if setting in template_settings:
-                        template_settings[setting] = str(template_settings[setting])
-                settings_in_sync = current_settings == template_settings
-            else:
-                settings_in_sync = True
-            patterns_in_sync = (
-                current_data["index_patterns"] == template_data["index_patterns"]
+            settings_in_sync = True
+        patterns_in_sync = (
+            current_data["index_patterns"] == template_data["index_patterns"]
+        )
+
+        if not all([mappings_in_sync, settings_in_sync, patterns_in_sync]):
+            template_name = cls._template_name
+            metric_name = cls.__name__
+            word_map = {
+                "mappings": mappings_in_sync,
+                "patterns": patterns_in_sync,
+                "settings": settings_in_sync,
+            }
+            out_of_sync = ", ".join(
+                [key for key, value in word_map.items() if not value]
+            )
+            raise exceptions.IndexTemplateOutOfSyncError(
+                "{template_name} is out of sync with {metric_name} ({out_of_sync})".format(
+                    **locals()
+                ),
+                mappings_in_sync=mappings_in_sync,
+                patterns_in_sync=patterns_in_sync,
+                settings_in_sync=settings_in_sync,
             )
+        return True
 
-            if not all([mappings_in_sync, settings_in_sync, patterns_in_sync]):
-                template_name = cls._template_name
-                metric_name = cls.__name__
-                word_map = {
-                    "mappings": mappings_in_sync,
-                    "patterns": patterns_in_sync,
-                    "settings": settings_in_sync,
-                }
-                out_of_sync = ", ".join(
-                    [key for key, value in word_map.items() if not value]
-                )
-                raise exceptions.IndexTemplateOutOfSyncError(
-                    "{template_name} is out of sync with {metric_name} ({out_of_sync})".format(
-                        **locals()
-                    ),
-                    mappings_in_sync=mappings_in_sync,
-                    patterns_in_sync=patterns_in_sync,
-                    settings_in_sync=settings_in_sync,
-                )
-            return True
+    @classmethod
+    def is_index_template_current(cls, current_data):
+        """Return whether an index template fetched from Elasticsearch was
+        synced from the current version of this metric, using its fingerprint.
+
+        :param dict current_data: The index template, or `None` if it doesn't exist.
+        """
+        if current_data is None:
+            return False
+        fingerprint, _ = _split_fingerprint(current_data.get("mappings", {}))
+        return fingerprint == cls._get_index_template_fingerprint()
 
     @classmethod
     def get_index_template(cls):
@@ -223,53 +486,558 @@ class BaseMetric(metaclass=MetricMeta):
         )
 
     @classmethod
-    def get_index_name(cls, date=None):
-        date = date or timezone.now().date()
-        dateformat = getattr(
-            settings, "ELASTICSEARCH_METRICS_DATE_FORMAT", DEFAULT_DATE_FORMAT
+    def _get_index_template_data(cls):
+        """Return ``get_index_template().to_dict()``, built once per class
+        until the index is modified. Must not be modified.
+        """
+        return cls._index.cached("template", lambda: cls.get_index_template().to_dict())
+
+    @classmethod
+    def _get_index_template_fingerprint(cls):
+        return cls._index.cached(
+            "fingerprint", lambda: _get_fingerprint(cls._get_index_template_data())
         )
-        date_formatted = date.strftime(dateformat)
-        return "{}_{}".format(cls._template_name, date_formatted)
 
     @classmethod
-    def record(cls, timestamp=None, **kwargs):
+    def get_write_using(cls, using=None, **hints):
+        """Return the alias of the connection that metrics are saved to, and
+        that the index template is synchronized with. Defaults to the
+        connection chosen by ``ELASTICSEARCH_METRICS_ROUTERS``, then to
+        ``Meta.write_using``, then to ``Index.using``.
+
+        :param str using: Connection alias that overrides routing, if given.
+        :param hints: Passed to the routers, e.g. the metric ``instance`` being saved.
+        """
+        return (
+            using
+            or router.connection_for_write(cls, **hints)
+            or cls._write_using
+            or cls._index._using
+        )
+
+    @classmethod
+    def get_read_using(cls, using=None):
+        """Return the alias of the connection that metrics are searched on.
+        Defaults to the connection chosen by ``ELASTICSEARCH_METRICS_ROUTERS``,
+        then to ``Meta.read_using``, then to the connection for writes.
+
+        :param str using: Connection alias that overrides routing, if given.
+        """
+        return (
+            using
+            or router.connection_for_read(cls)
+            or cls._read_using
+            or cls.get_write_using()
+        )
+
+    @classmethod
+    def get_index_name(cls, date=None):
+        """Return the name of the index for the given date or datetime
+        (defaults to now). Index names are cached per metric class.
+        """
+        date = date or timezone.now()
+        dateformat = cls.get_date_format()
+        cache = cls._index_name_cache
+        if cache.dateformat is not dateformat:
+            cache.clear()
+            cache.dateformat = dateformat
+        key = truncate(date, dateformat)
+        if isinstance(date, dt.datetime) and date.tzinfo is not None:
+            # Aware datetimes compare equal at the same instant, but format
+            # differently in different timezones
+            key = (key, date.utcoffset())
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        index_name = cls._format_index_name(date, dateformat)
+        if len(cache) >= cache.maxsize:
+            cache.clear()
+        cache[key] = index_name
+        return index_name
+
+    @classmethod
+    def get_date_format(cls):
+        """Return the date format used in this metric's index names. Set per
+        metric with ``Meta.index_granularity`` or ``Meta.date_format``.
+        """
+        return cls._date_format or get_date_format()
+
+    @classmethod
+    def _format_index_name(cls, date, dateformat):
+        return "{}_{}".format(cls._template_name, date.strftime(dateformat))
+
+    @classmethod
+    def get_index_date(cls, index_name):
+        """Return the date at which the period of an index starts, or `None`
+        if the index name wasn't generated by `get_index_name`.
+        """
+        prefix = cls._template_name + "_"
+        if not index_name.startswith(prefix):
+            return None
+        return parse_date(index_name[len(prefix) :], cls.get_date_format())
+
+    @classmethod
+    def get_expired_indices(cls, using=None, now=None):
+        """Return the names of the indices that only contain metrics older than
+        ``Meta.retention``, oldest first.
+
+        :param datetime now: Time to compute the retention period from.
+            Defaults to the current time.
+        """
+        if cls._retention is None:
+            return []
+        dateformat = cls.get_date_format()
+        cutoff = (now or timezone.now()) - cls._retention
+        # Start of the period of the index that cutoff falls in
+        boundary = parse_date(cutoff.strftime(dateformat), dateformat)
+        client = connections.get_connection(cls._get_using(using))
+        indices = client.cat.indices(index=cls._template, format="json", h="index")
+        expired = []
+        for index_name in (index["index"] for index in indices):
+            date = cls.get_index_date(index_name)
+            if date is not None and date < boundary:
+                expired.append((date, index_name))
+        return [index_name for _, index_name in sorted(expired)]
+
+    @classmethod
+    def get_index_names(cls, start, end):
+        """Return the names or wildcard patterns of the indices that contain
+        metrics recorded between ``start`` and ``end`` (inclusive). Falls back
+        to the metric's template pattern if the range spans too many indices.
+        """
+        patterns = get_date_patterns(start, end, cls.get_date_format())
+        if patterns is None:
+            return [cls._template]
+        return ["{}_{}".format(cls._template_name, pattern) for pattern in patterns]
+
+    @classmethod
+    def _sample(cls, sample_rate=None, **kwargs):
+        """Return a metric instance created with ``kwargs``, or `None` if it
+        is dropped by sampling. Sampled metrics store the inverse of the
+        sample rate in their ``sample_weight`` field.
+
+        :param float sample_rate: Fraction of metrics to keep. Defaults to
+            ``Meta.sample_rate``.
+        """
+        if sample_rate is None:
+            sample_rate = cls._sample_rate
+        if sample_rate is None or sample_rate >= 1:
+            return cls(**kwargs)
+        if not sample_rate > 0:
+            raise ValueError("sample_rate must be greater than 0.")
+        if random.random() >= sample_rate:
+            instrumentation.increment("record.dropped", metric=cls._template_name)
+            return None
+        kwargs[SAMPLE_WEIGHT_FIELD] = 1.0 / sample_rate
+        return cls(**kwargs)
+
+    @classmethod
+    def record(cls, timestamp=None, validate=True, sample_rate=None, **kwargs):
         """Persist a metric in Elasticsearch.
 
         :param datetime timestamp: Timestamp for the metric.
+        :param validate: Whether to validate the metric. See `save`.
+        :param float sample_rate: Fraction of metrics to keep. Defaults to
+            ``Meta.sample_rate``.
+        :return: The metric instance, or `None` if it was dropped by sampling.
+        """
+        instance = cls._sample(sample_rate, timestamp=timestamp, **kwargs)
+        if instance is None:
+            return None
+        with instrumentation.timer("record", metric=cls._template_name):
+            index = instance._prepare_save()
+            instance.save(index=index, validate=validate)
+        return instance
+
+    @classmethod
+    async def arecord(cls, timestamp=None, validate=True, sample_rate=None, **kwargs):
+        """Same as `record`, but persists the metric asynchronously.
+        Requires aiohttp.
+
+        :param datetime timestamp: Timestamp for the metric.
+        :param validate: Whether to validate the metric. See `save`.
+        :param float sample_rate: Fraction of metrics to keep. Defaults to
+            ``Meta.sample_rate``.
         """
-        instance = cls(timestamp=timestamp, **kwargs)
-        index = cls.get_index_name(timestamp)
-        instance.save(index=index)
+        instance = cls._sample(sample_rate, timestamp=timestamp, **kwargs)
+        if instance is None:
+            return None
+        index = instance._prepare_save()
+        await instance.asave(index=index, validate=validate)
         return instance
 
+    @classmethod
+    def record_many(
+        cls,
+        iterable,
+        using=None,
+        chunk_size=bulk.DEFAULT_CHUNK_SIZE,
+        raise_on_error=True,
+        validate=True,
+    ):
+        """Persist many metrics in Elasticsearch using the ``_bulk`` API.
+
+        :param iterable: Iterable of dicts of keyword arguments, as would
+            be passed to `record`.
+        :param str using: Connection alias to use.
+        :param int chunk_size: Number of documents in each ``_bulk`` request.
+        :param bool raise_on_error: Raise `BulkRecordError <elasticsearch_metrics.exceptions.BulkRecordError>`
+            if any documents fail to index.
+        :param validate: Whether to validate the metrics. See `save`.
+        :return: List of the metric instances that weren't dropped by sampling.
+        """
+        recorder = bulk.BulkRecorder(
+            using=using, chunk_size=chunk_size, raise_on_error=raise_on_error
+        )
+        instances = [
+            recorder.record(cls, validate=validate, **kwargs) for kwargs in iterable
+        ]
+        recorder.flush()
+        return [instance for instance in instances if instance is not None]
+
 
 class Metric(Document, BaseMetric):
     __doc__ = BaseMetric.__doc__
 
+    def _get_codec(self):
+        # Fields added to the Index mapping are handled by Document
+        return self._codec if self._index._mapping is None else None
+
+    def to_dict(self, include_meta=False, skip_empty=True):
+        """Same as `Document.to_dict`. Metrics with only scalar fields are
+        serialized with a serializer compiled when the class is defined.
+        """
+        codec = self._get_codec()
+        if codec is None or include_meta:
+            return super(Metric, self).to_dict(
+                include_meta=include_meta, skip_empty=skip_empty
+            )
+        return codec.to_dict(self._d_, skip_empty=skip_empty)
+
+    def clean_fields(self, fast=False):
+        """Same as `Document.clean_fields`. Metrics with only scalar fields are
+        validated with a validator compiled when the class is defined.
+
+        :param bool fast: Only check that required fields are set, without
+            converting values to the fields' types. Ignored for metrics with
+            object or nested fields, or custom fields.
+        """
+        codec = self._get_codec()
+        if codec is None:
+            return super(Metric, self).clean_fields()
+        codec.clean(self._d_, fast=fast)
+
+    def full_clean(self, fast=False):
+        self.clean_fields(fast=fast)
+        self.clean()
+
+    @classmethod
+    def _get_using(cls, using=None):
+        # Used by Document for writes (e.g. update and delete)
+        return cls.get_write_using(using)
+
     @classmethod
     def init(cls, index=None, using=None):
         """Create the index and populate the mappings in elasticsearch."""
-        return super(Metric, cls).init(index=index or cls.get_index_name(), using=using)
+        return super(Metric, cls).init(
+            index=index or cls.get_index_name(), using=cls.get_write_using(using)
+        )
+
+    @classmethod
+    def get(cls, id, using=None, index=None, **kwargs):
+        """Same as `Document.get`, using the connection for reads."""
+        return super(Metric, cls).get(
+            id, using=cls.get_read_using(using), index=index, **kwargs
+        )
+
+    @classmethod
+    def mget(cls, docs, using=None, index=None, **kwargs):
+        """Same as `Document.mget`, using the connection for reads."""
+        return super(Metric, cls).mget(
+            docs, using=cls.get_read_using(using), index=index, **kwargs
+        )
 
     def save(self, using=None, index=None, validate=True, **kwargs):
         """Same as `Document.save`, except will save into the index determined
         by the metric's timestamp field.
+
+        If a `BulkRecorder <elasticsearch_metrics.bulk.BulkRecorder>` is active in the
+        current thread, the metric is added to the recorder and `None` is returned.
+        Otherwise, if shipping is enabled with the ``ELASTICSEARCH_METRICS_SHIPPER``
+        setting, the metric is sent to the ``ship_metrics`` daemon, ``post_save`` is
+        sent once the daemon has received it, and `None` is returned. Otherwise, if buffering is enabled with the
+        ``ELASTICSEARCH_METRICS_BUFFER`` setting, the metric is added to the
+        buffer and `None` is returned.
+        Metrics saved with additional keyword arguments are always sent immediately.
+
+        If a spool is configured with the ``ELASTICSEARCH_METRICS_SPOOL`` setting and
+        Elasticsearch is unavailable, the metric is written to the spool and `None`
+        is returned.
+
+        Requests time out after ``Meta.write_timeout`` seconds, if set. If retries
+        or a circuit breaker are configured, failed requests are retried, and the
+        metric is spooled or dropped without sending a request while the
+        connection's circuit breaker is open. See `elasticsearch_metrics.resilience`.
+
+        :param validate: `True` to validate the metric with `full_clean`, ``"fast"``
+            to only check that required fields are set, or `False` to skip validation.
         """
-        self.timestamp = self.timestamp or timezone.now()
-        if not index:
-            index = self.get_index_name(date=self.timestamp)
+        if not kwargs:
+            recorder = bulk.get_current_recorder()
+            if recorder is not None:
+                recorder.add(self, using=using, index=index, validate=validate)
+                return None
+            shipper = get_shipper()
+            if shipper is not None:
+                self._ship(shipper, using=using, index=index, validate=validate)
+                return None
+            buffer = get_buffer()
+            if buffer is not None:
+                buffer.put(self, using=using, index=index, validate=validate)
+                return None
+
+        with instrumentation.timer("save", metric=self._template_name):
+            return self._save(using=using, index=index, validate=validate, **kwargs)
+
+    def _ship(self, shipper, using=None, index=None, validate=True):
+        """Send the metric to the ``ship_metrics`` daemon. If the daemon isn't
+        running, the metric is added to the buffer, or sent from this process.
+
+        ``post_save`` is sent once the daemon has received the metric, before
+        it is indexed.
+        """
+        using, index, action = bulk.prepare_metric(
+            self, using=using, index=index, validate=validate
+        )
+        if shipper.send(using, action):
+            instrumentation.increment("save.shipped", metric=self._template_name)
+            signals.post_save.send(
+                self.__class__, instance=self, using=using, index=index
+            )
+            return
+        buffer = get_buffer()
+        if buffer is not None:
+            buffer.put_action(self, using, index, action)
+            return
+        recorder = bulk.BulkRecorder()
+        recorder.add_action(self, using, index, action)
+        recorder.flush()
 
+    def _save(self, using=None, index=None, validate=True, **kwargs):
+        using = self.get_write_using(using, instance=self)
+        index = self._prepare_save(index=index)
         cls = self.__class__
         signals.pre_save.send(cls, instance=self, using=using, index=index)
-        ret = super(Metric, self).save(
-            using=using, index=index, validate=validate, **kwargs
-        )
+        if validate:
+            with instrumentation.timer("save.validate", metric=cls._template_name):
+                self.full_clean(fast=validate == "fast")
+        if self._write_timeout is not None:
+            kwargs.setdefault("request_timeout", self._write_timeout)
+        breaker = resilience.get_circuit_breaker(using)
+        if breaker is not None and not breaker.allow_request():
+            resilience.fail_fast(breaker, self, using, self.to_bulk_action(index))
+            return None
+        try:
+            with instrumentation.timer("save.request", metric=cls._template_name):
+                ret = resilience.call_with_retry(
+                    functools.partial(
+                        super(Metric, self).save,
+                        using=using,
+                        index=index,
+                        validate=False,
+                        **kwargs
+                    ),
+                    breaker=breaker,
+                    retry=resilience.get_retry_policy(),
+                )
+        except TransportError as error:
+            spool = get_spool()
+            if not is_retryable(error.status_code) or spool is None:
+                raise
+            if not spool.write(self._get_using(using), self.to_bulk_action(index)):
+                raise
+            logger.warning(
+                "Could not save %r (%s). Wrote it to the spool.", self, error
+            )
+            return None
+        instrumentation.increment("save.documents", metric=cls._template_name)
         signals.post_save.send(cls, instance=self, using=using, index=index)
         return ret
 
+    async def asave(self, using=None, index=None, validate=True):
+        """Same as `save`, but persists the metric asynchronously.
+        Metrics saved concurrently are sent in a single ``_bulk`` request.
+        Requires aiohttp.
+        """
+        # Imported here so that aiohttp is only imported when needed
+        from elasticsearch_metrics import aio
+
+        using, index, action = bulk.prepare_metric(
+            self, using=using, index=index, validate=validate
+        )
+        item = await aio.get_batcher().add(using, action)
+        aio.raise_for_item(item)
+        self._update_meta_from_bulk_item(item)
+        signals.post_save.send(self.__class__, instance=self, using=using, index=index)
+        return item.get("result") == "created"
+
+    def _prepare_save(self, index=None):
+        """Default the timestamp to now and return the index to save into."""
+        self.timestamp = self.timestamp or timezone.now()
+        return index or self.get_index_name(date=self.timestamp)
+
+    def to_bulk_action(self, index, skip_empty=True):
+        """Return an action for indexing this metric with the ``_bulk`` API."""
+        action = {
+            "_index": index,
+            "_type": self._doc_type.name,
+            "_source": self.to_dict(skip_empty=skip_empty),
+        }
+        for k in DOC_META_FIELDS:
+            if k in self.meta:
+                action["_" + k] = self.meta[k]
+        return action
+
+    def _update_meta_from_bulk_item(self, item):
+        # Same as the meta handling in Document.save
+        for k in META_FIELDS:
+            if "_" + k in item:
+                setattr(self.meta, k, item["_" + k])
+
+    @classmethod
+    def search(cls, using=None, index=None, start=None, end=None):
+        """Return a `Search <elasticsearch_dsl.Search>` over this metric.
+
+        If ``start`` and ``end`` are given, only the indices for that date
+        range are searched. Either bound also filters on ``timestamp``.
+
+        :param start: Only include metrics recorded at or after this date or datetime.
+        :param end: Only include metrics recorded at or before this date or datetime.
+        """
+        if index is None and start is not None and end is not None:
+            index = cls.get_index_names(start, end)
+            # Not every day in the range necessarily has an index
+            search = (
+                super()
+                .search(using=cls.get_read_using(using), index=index)
+                .params(ignore_unavailable=True)
+            )
+        else:
+            search = super().search(using=cls.get_read_using(using), index=index)
+        if start is None and end is None:
+            return search
+        timestamp_range = {}
+        if start is not None:
+            timestamp_range["gte"] = start
+        if isinstance(end, dt.datetime):
+            timestamp_range["lte"] = end
+        elif end is not None:
+            # Include the whole day
+            timestamp_range["lt"] = end + dt.timedelta(days=1)
+        return search.filter("range", timestamp=timestamp_range)
+
     @classmethod
     def _default_index(cls, index=None):
         """Overrides Document._default_index so that .search, .get, etc.
         use the metric's template pattern as the default index
         """
         return index or cls._template
+
+
+class CounterMetric(Metric):
+    """Base class for metrics that count events. Increments are summed in
+    memory and saved as one document per combination of dimension values
+    per time bucket, with the number of increments in ``count`` and the sum
+    of their values in ``sum``. The other fields of a counter metric are its
+    dimensions.
+
+    The length of the time buckets is set by ``Meta.bucket_interval``, a
+    `timedelta` or a number of seconds. Defaults to one minute.
+
+    Example usage:
+
+    .. code-block:: python
+
+        from elasticsearch_metrics import metrics
+
+
+        class FileDownloads(metrics.CounterMetric):
+            file_id = metrics.Keyword()
+
+            class Meta:
+                bucket_interval = 60
+
+
+        FileDownloads.increment(file_id="abc123")
+    """
+
+    count = Long(required=True)
+    sum = Double()
+
+    # Length of the time buckets that increments are summed in
+    _bucket_interval = dt.timedelta(minutes=1)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def get_bucket(cls, timestamp=None):
+        """Return the start of the time bucket that contains ``timestamp``.
+
+        :param datetime timestamp: Defaults to now.
+        """
+        return counters.get_bucket(timestamp, cls._bucket_interval)
+
+    @classmethod
+    def increment(cls, value=1, timestamp=None, **dimensions):
+        """Add an increment to the counter for the given dimension values.
+        The totals are saved by a background thread. See
+        `elasticsearch_metrics.counters`.
+
+        :param value: Amount added to ``sum``.
+        :param datetime timestamp: Time of the increment. Defaults to now.
+        :return: `False` if the increment was dropped, `True` otherwise.
+        """
+        for name in dimensions:
+            if (
+                name in ("timestamp", "count", "sum")
+                or name not in cls._doc_type.mapping
+            ):
+                raise ValueError(
+                    "{!r} is not a dimension field of {}.".format(name, cls.__name__)
+                )
+        return counters.get_accumulator().add(
+            cls, dimensions, value=value, timestamp=timestamp
+        )
+
+
+def get_index_templates(metric_classes, using=None):
+    """Fetch the index templates of several metrics in a single request per
+    connection.
+
+    :param str using: Connection alias to use instead of each metric's
+        connection for writes.
+    :return: A dict mapping metric classes to their index template, or `None`
+        for metrics whose index template doesn't exist.
+    """
+    # Each metric's template is fetched from its connection for writes
+    metrics_by_using = {}
+    for metric in metric_classes:
+        metrics_by_using.setdefault(metric.get_write_using(using), []).append(metric)
+    result = {}
+    for metric_using, metrics in metrics_by_using.items():
+        client = connections.get_connection(metric_using)
+        names = ",".join(metric._template_name for metric in metrics)
+        try:
+            # Long lists of names are fetched with a request for all templates,
+            # so that the request line stays below Elasticsearch's limit
+            if len(names) <= MAX_TEMPLATE_NAMES_LENGTH:
+                templates = client.indices.get_template(name=names)
+            else:
+                templates = client.indices.get_template()
+        except NotFoundError:
+            templates = {}
+        for metric in metrics:
+            result[metric] = templates.get(metric._template_name)
+    return result
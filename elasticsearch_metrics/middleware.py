@@ -0,0 +1,52 @@
+import logging
+
+from django.conf import settings
+
+from elasticsearch_metrics import bulk
+
+logger = logging.getLogger(__name__)
+
+
+class BulkRecordMiddleware(object):
+    """Middleware that collects the metrics recorded while handling a request
+    and sends them in a single ``_bulk`` request once the response has been
+    generated.
+
+    Configured with the ``ELASTICSEARCH_METRICS_MIDDLEWARE`` setting:
+
+    * ``on_commit``: Only send metrics recorded inside a database transaction
+      if the transaction commits. Default: `False`.
+    * ``db_alias``: Database connection to track transactions on. Default: ``"default"``.
+    * ``chunk_size``: Number of documents in each ``_bulk`` request. Default: 500.
+
+    Metrics that fail to index are logged; they never cause the request to fail.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = dict(getattr(settings, "ELASTICSEARCH_METRICS_MIDDLEWARE", {}))
+        self.on_commit = options.pop("on_commit", False)
+        if not self.on_commit:
+            options.pop("db_alias", None)
+        self.recorder_options = options
+
+    def get_recorder(self):
+        recorder_cls = (
+            bulk.TransactionBulkRecorder if self.on_commit else bulk.BulkRecorder
+        )
+        return recorder_cls(raise_on_error=False, **self.recorder_options)
+
+    def __call__(self, request):
+        recorder = self.get_recorder()
+        try:
+            with recorder:
+                response = self.get_response(request)
+        finally:
+            if recorder.errors:
+                logger.error(
+                    "%d metric(s) recorded during %s %s failed to index.",
+                    len(recorder.errors),
+                    request.method,
+                    request.path,
+                )
+        return response
@@ -0,0 +1,264 @@
+"""Retries and circuit breaking for metric writes, so that an unhealthy
+cluster doesn't take down the application that records metrics.
+
+Retries are enabled with the ``ELASTICSEARCH_METRICS_RETRY`` setting, a dict
+of keyword arguments passed to `RetryPolicy`. Writes that fail with a
+connection error, a timeout, or a 429, 502, 503 or 504 response are retried
+after a random delay between 0 and ``backoff * 2 ** attempt`` seconds
+("full jitter"), capped at ``max_backoff``.
+
+Circuit breaking is enabled with the ``ELASTICSEARCH_METRICS_CIRCUIT_BREAKER``
+setting, a dict of keyword arguments passed to `CircuitBreaker`. Each
+connection has its own breaker, which opens after ``failure_threshold``
+consecutive failed writes. While a breaker is open, metrics are written to
+the spool (if one is configured and ``fallback`` is ``"spool"``) or dropped,
+without sending a request. After ``reset_timeout`` seconds, a single write is
+let through: the breaker closes if it succeeds and opens again if it fails.
+State changes are sent with the ``circuit_breaker_changed`` signal.
+
+.. code-block:: python
+
+    ELASTICSEARCH_METRICS_RETRY = {"max_retries": 2, "backoff": 0.1}
+    ELASTICSEARCH_METRICS_CIRCUIT_BREAKER = {
+        "failure_threshold": 5,
+        "reset_timeout": 30,
+        "fallback": "spool",
+    }
+
+The timeout of writes is set per metric by ``Meta.write_timeout``.
+"""
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from elasticsearch.exceptions import TransportError
+
+from elasticsearch_metrics import instrumentation
+from elasticsearch_metrics import signals
+from elasticsearch_metrics.spool import get_spool, is_retryable
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FALLBACK_SPOOL = "spool"
+FALLBACK_DROP = "drop"
+FALLBACKS = (FALLBACK_SPOOL, FALLBACK_DROP)
+
+
+class RetryPolicy(object):
+    """Number of retries of failed writes, and the delays between them.
+
+    :param int max_retries: Maximum number of retries of a write.
+    :param float backoff: Maximum delay before the first retry, in seconds.
+        Doubles with every retry.
+    :param float max_backoff: Maximum delay before a retry, in seconds.
+    """
+
+    def __init__(self, max_retries=2, backoff=0.1, max_backoff=2.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def get_delay(self, attempt):
+        """Return the delay before retrying a write that failed ``attempt + 1`` times."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def sleep(self, attempt):
+        time.sleep(self.get_delay(attempt))
+
+
+class CircuitBreaker(object):
+    """Stops sending writes to a connection after repeated failures.
+
+    :param str using: Connection alias.
+    :param int failure_threshold: Number of consecutive failures that open the breaker.
+    :param float reset_timeout: Number of seconds the breaker stays open
+        before a write is let through.
+    :param str fallback: What to do with metrics while the breaker is open:
+        ``"spool"`` writes them to the spool if one is configured and drops
+        them otherwise, ``"drop"`` drops them.
+    """
+
+    def __init__(
+        self, using, failure_threshold=5, reset_timeout=30.0, fallback=FALLBACK_SPOOL
+    ):
+        if fallback not in FALLBACKS:
+            raise ValueError(
+                "Invalid circuit breaker fallback {!r}. Must be one of: {}".format(
+                    fallback, ", ".join(FALLBACKS)
+                )
+            )
+        self.using = using
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.fallback = fallback
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return whether a write may be sent to the connection."""
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            # A single write is let through every reset_timeout seconds until
+            # one succeeds
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self._opened_at = now
+            previous = self._set_state(HALF_OPEN)
+        if previous is not None:
+            self._send_changed(previous)
+        return True
+
+    def record_success(self):
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.failures = 0
+            previous = self._set_state(CLOSED)
+        if previous is not None:
+            self._send_changed(previous)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            previous = None
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                previous = self._set_state(OPEN)
+        if previous is not None:
+            self._send_changed(previous)
+
+    def _set_state(self, state):
+        """Change the state and return the previous state, or `None` if unchanged."""
+        previous = self.state
+        if previous == state:
+            return None
+        self.state = state
+        return previous
+
+    def _send_changed(self, previous):
+        signals.circuit_breaker_changed.send(
+            CircuitBreaker,
+            breaker=self,
+            using=self.using,
+            state=self.state,
+            previous_state=previous,
+        )
+
+
+def call_with_retry(func, breaker=None, retry=None):
+    """Call ``func``, retrying retryable `TransportError` exceptions according
+    to ``retry``, and record the outcome with ``breaker``.
+    """
+    attempt = 0
+    while True:
+        try:
+            result = func()
+        except TransportError as error:
+            if not is_retryable(error.status_code):
+                # The cluster responded
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if (
+                retry is None
+                or attempt >= retry.max_retries
+                or (breaker is not None and breaker.state == OPEN)
+            ):
+                raise
+            retry.sleep(attempt)
+            attempt += 1
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+def fail_fast(breaker, instance, using, action):
+    """Spool or drop a metric that isn't sent because ``breaker`` is open.
+
+    :return: `True` if the metric was written to the spool.
+    """
+    if breaker.fallback == FALLBACK_SPOOL:
+        spool = get_spool()
+        if spool is not None and spool.write(using, action):
+            instrumentation.increment(
+                "circuit_breaker.spooled", metric=instance._template_name
+            )
+            return True
+    instrumentation.increment("circuit_breaker.dropped", metric=instance._template_name)
+    return False
+
+
+_UNSET = object()
+_retry_policy = _UNSET
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_retry_policy():
+    """Return the `RetryPolicy` configured by the ``ELASTICSEARCH_METRICS_RETRY``
+    setting, or `None` if retries are disabled.
+    """
+    global _retry_policy
+    if _retry_policy is _UNSET:
+        with _lock:
+            if _retry_policy is _UNSET:
+                retry_settings = getattr(settings, "ELASTICSEARCH_METRICS_RETRY", None)
+                _retry_policy = (
+                    RetryPolicy(**retry_settings) if retry_settings else None
+                )
+    return _retry_policy
+
+
+def get_circuit_breaker(using):
+    """Return the `CircuitBreaker` of a connection, or `None` if circuit
+    breaking is disabled with the ``ELASTICSEARCH_METRICS_CIRCUIT_BREAKER`` setting.
+    """
+    try:
+        return _breakers[using]
+    except KeyError:
+        pass
+    with _lock:
+        if using not in _breakers:
+            breaker_settings = getattr(
+                settings, "ELASTICSEARCH_METRICS_CIRCUIT_BREAKER", None
+            )
+            _breakers[using] = (
+                CircuitBreaker(using, **breaker_settings) if breaker_settings else None
+            )
+        return _breakers[using]
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.Lock()
+    _breakers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_resilience(setting, **kwargs):
+    global _retry_policy
+    if setting == "ELASTICSEARCH_METRICS_RETRY":
+        _retry_policy = _UNSET
+    elif setting == "ELASTICSEARCH_METRICS_CIRCUIT_BREAKER":
+        _breakers.clear()
@@ -0,0 +1,72 @@
+"""Routing of metrics to Elasticsearch connections.
+
+Routers are configured with the ``ELASTICSEARCH_METRICS_ROUTERS`` setting, a
+list of router classes, import paths or instances, similar to Django's
+``DATABASE_ROUTERS``. A router may implement either of these methods, which
+return a connection alias, or `None` to let the next router decide:
+
+* ``connection_for_write(metric_cls, **hints)``: Connection that metrics are
+  saved to, and that index templates are synchronized with and indices are
+  pruned from. ``hints`` may contain the metric ``instance`` being saved.
+* ``connection_for_read(metric_cls, **hints)``: Connection that metrics
+  are searched on.
+
+If no router returns a connection, ``Meta.write_using`` and ``Meta.read_using``
+are used. Reads fall back to the connection for writes, which falls back to
+``Index.using`` (``"default"`` unless set).
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+
+class ConnectionRouter(object):
+    """Chooses the connection for a metric using the routers configured by
+    the ``ELASTICSEARCH_METRICS_ROUTERS`` setting.
+
+    :param list routers: Routers to use instead of the setting.
+    """
+
+    def __init__(self, routers=None):
+        self._routers = routers
+
+    @cached_property
+    def routers(self):
+        configured = self._routers
+        if configured is None:
+            configured = getattr(settings, "ELASTICSEARCH_METRICS_ROUTERS", [])
+        routers = []
+        for router in configured:
+            if isinstance(router, str):
+                router = import_string(router)
+            if isinstance(router, type):
+                router = router()
+            routers.append(router)
+        return routers
+
+    def _route(action):
+        def route(self, metric_cls, **hints):
+            for router in self.routers:
+                method = getattr(router, action, None)
+                if method is None:
+                    continue
+                using = method(metric_cls, **hints)
+                if using:
+                    return using
+            return None
+
+        return route
+
+    connection_for_read = _route("connection_for_read")
+    connection_for_write = _route("connection_for_write")
+
+
+router = ConnectionRouter()
+
+
+@receiver(setting_changed)
+def _reset_router(setting, **kwargs):
+    if setting == "ELASTICSEARCH_METRICS_ROUTERS":
+        router.__dict__.pop("routers", None)
@@ -0,0 +1,62 @@
+"""Aggregations that estimate statistics of sampled metrics.
+
+Metrics recorded with a sample rate store the inverse of the rate in their
+``sample_weight`` field. Each kept metric stands for ``sample_weight``
+recorded metrics, so weighting aggregations by it gives unbiased estimates
+of the statistics of all recorded metrics. Metrics without a weight (e.g.
+recorded before sampling was enabled) count once.
+
+.. code-block:: python
+
+    from elasticsearch_metrics import sampling
+
+    search = PageView.search()
+    search.aggs.bucket("per_day", "date_histogram", field="timestamp", interval="day")
+    search.aggs["per_day"].metric("views", sampling.estimated_count())
+    search.aggs["per_day"].metric("total_time", sampling.estimated_sum("duration"))
+    response = search.execute()
+    for day in response.aggregations.per_day.buckets:
+        print(day.key_as_string, day.views.value, day.total_time.value)
+"""
+from elasticsearch_dsl import A
+
+from elasticsearch_metrics.metrics import SAMPLE_WEIGHT_FIELD
+
+_WEIGHTED_SUM_SCRIPT = (
+    "double weight = doc[params.weight_field].size() == 0 "
+    "? 1 : doc[params.weight_field].value; "
+    "double total = 0; "
+    "for (def value : doc[params.field]) { total += value; } "
+    "return total * weight;"
+)
+
+
+def estimated_count(weight_field=SAMPLE_WEIGHT_FIELD):
+    """Return an aggregation that estimates the number of recorded metrics,
+    including the metrics dropped by sampling.
+    """
+    return A("sum", field=weight_field, missing=1)
+
+
+def estimated_sum(field, weight_field=SAMPLE_WEIGHT_FIELD):
+    """Return an aggregation that estimates the sum of a field over all
+    recorded metrics, including the metrics dropped by sampling.
+    """
+    return A(
+        "sum",
+        script={
+            "source": _WEIGHTED_SUM_SCRIPT,
+            "params": {"field": field, "weight_field": weight_field},
+        },
+    )
+
+
+def estimated_avg(field, weight_field=SAMPLE_WEIGHT_FIELD):
+    """Return an aggregation that estimates the average of a field over all
+    recorded metrics. Requires Elasticsearch 6.4+.
+    """
+    return A(
+        "weighted_avg",
+        value={"field": field},
+        weight={"field": weight_field, "missing": 1},
+    )
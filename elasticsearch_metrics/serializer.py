@@ -0,0 +1,111 @@
+"""JSON serializers for the connections used by metrics.
+
+The serializer is chosen with the ``ELASTICSEARCH_METRICS_SERIALIZER`` setting:
+
+* ``"default"`` (the default): `elasticsearch_dsl.serializer.serializer`.
+* ``"orjson"``: `OrjsonSerializer`, which requires
+  `orjson <https://github.com/ijl/orjson>`_. Falls back to the default
+  serializer if orjson isn't installed.
+* The import path of a serializer class or instance.
+"""
+import logging
+import threading
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from elasticsearch.exceptions import SerializationError
+from elasticsearch_dsl.serializer import AttrJSONSerializer
+from elasticsearch_dsl.serializer import serializer as default_serializer
+
+logger = logging.getLogger(__name__)
+
+
+class OrjsonSerializer(AttrJSONSerializer):
+    """Same as `elasticsearch_dsl.serializer.AttrJSONSerializer`, but encodes
+    and decodes with orjson. Values that orjson can't encode (e.g. integers
+    larger than 64 bits) are encoded with the standard library.
+
+    orjson encodes dates and datetimes in the same format as `datetime.isoformat`,
+    including the UTC offset of timezone-aware datetimes.
+    """
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson must be installed to use OrjsonSerializer.")
+        self._option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, data):
+        # don't serialize strings
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data, default=self.default, option=self._option).decode(
+                "utf-8"
+            )
+        except orjson.JSONEncodeError:
+            return super(OrjsonSerializer, self).dumps(data)
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError as e:
+            raise SerializationError(s, e)
+
+
+SERIALIZERS = {"default": lambda: default_serializer, "orjson": OrjsonSerializer}
+
+_UNSET = object()
+_serializer = _UNSET
+_serializer_lock = threading.Lock()
+
+
+def _create_serializer(name):
+    if name in SERIALIZERS:
+        try:
+            return SERIALIZERS[name]()
+        except ImportError:
+            logger.warning(
+                "%s serializer is not available. Using the default serializer.", name
+            )
+            return default_serializer
+    serializer = import_string(name)
+    return serializer() if isinstance(serializer, type) else serializer
+
+
+def get_serializer():
+    """Return the serializer configured by the ``ELASTICSEARCH_METRICS_SERIALIZER``
+    setting.
+    """
+    global _serializer
+    if _serializer is _UNSET:
+        with _serializer_lock:
+            if _serializer is _UNSET:
+                _serializer = _create_serializer(
+                    getattr(settings, "ELASTICSEARCH_METRICS_SERIALIZER", "default")
+                )
+    return _serializer
+
+
+def get_connection_settings(connection_settings):
+    """Add the configured serializer to connection settings (e.g. the
+    ``ELASTICSEARCH_DSL`` setting) for connections that don't set one.
+    """
+    serializer = get_serializer()
+    return {
+        alias: dict({"serializer": serializer}, **conn_settings)
+        for alias, conn_settings in connection_settings.items()
+    }
+
+
+@receiver(setting_changed)
+def _reset_serializer(setting, **kwargs):
+    global _serializer
+    if setting == "ELASTICSEARCH_METRICS_SERIALIZER":
+        _serializer = _UNSET
@@ -8,3 +8,6 @@ post_index_template_create = Signal()
 pre_save = Signal()
 # Like pre_save, but sent at the end of the save() method
 post_save = Signal()
+# Sent when the circuit breaker of a connection opens, closes or lets a
+# write through after its reset timeout
+circuit_breaker_changed = Signal()
@@ -0,0 +1,292 @@
+"""On-disk spool for metrics that could not be sent to Elasticsearch.
+
+The spool is enabled with the ``ELASTICSEARCH_METRICS_SPOOL`` setting, which
+is a dict of keyword arguments passed to `Spool`.
+
+.. code-block:: python
+
+    ELASTICSEARCH_METRICS_SPOOL = {"path": "/var/spool/metrics"}
+
+Spooled metrics are sent with the ``replay_metrics`` management command.
+
+Each process appends to its own segment file, so that multiple worker
+processes can share a spool directory. Segments are named
+``<timestamp>-<pid>.open`` while they are written and renamed to
+``<timestamp>-<pid>.ndjson`` once they are full, once they have been open
+for ``segment_interval`` seconds, or when the process exits.
+Each line of a segment is a JSON object with the connection alias
+(``using``) and the ``_bulk`` action for a metric.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from elasticsearch.exceptions import SerializationError
+
+from elasticsearch_metrics.serializer import get_serializer
+
+OPEN_SUFFIX = ".open"
+CLOSED_SUFFIX = ".ndjson"
+REPLAY_SUFFIX = ".replay"
+
+# Statuses reported by the bulk helpers for connection errors and timeouts
+_CONNECTION_ERROR_STATUSES = ("N/A", "TIMEOUT")
+# HTTP statuses for requests that may succeed if retried later
+_RETRYABLE_HTTP_STATUSES = (429, 502, 503, 504)
+
+logger = logging.getLogger(__name__)
+
+
+def is_retryable(status):
+    """Return whether a write that failed with the given status may succeed later."""
+    return status in _CONNECTION_ERROR_STATUSES or status in _RETRYABLE_HTTP_STATUSES
+
+
+def _pid_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _segment_pid(filename):
+    """Return the pid of the process that owns a segment."""
+    stem = filename.split(".")[0]
+    try:
+        return int(stem.rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+class Spool(object):
+    """Append-only, segmented log of metrics that failed to send.
+
+    :param str path: Directory to write segments to. Created if it doesn't exist.
+    :param int max_bytes: Maximum total size of the spool directory, including
+        segments written by other processes, which is read again at every
+        fsync. Metrics are dropped once the spool is full.
+    :param int segment_bytes: Size at which a segment is closed and a new one started.
+    :param float segment_interval: Maximum number of seconds a segment is kept
+        open before it is closed, so that it can be replayed.
+    :param float fsync_interval: Maximum number of seconds between calls to fsync.
+    :param int fsync_count: Maximum number of writes between calls to fsync.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=1024**3,
+        segment_bytes=64 * 1024**2,
+        segment_interval=60.0,
+        fsync_interval=1.0,
+        fsync_count=1000,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.segment_interval = segment_interval
+        self.fsync_interval = fsync_interval
+        self.fsync_count = fsync_count
+        # Number of metrics written to the spool
+        self.written = 0
+        # Number of metrics discarded because the spool was full
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_path = None
+        self._timer = None
+        self._pid = None
+        self._total_bytes = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, using, action):
+        """Append a ``_bulk`` action to the spool.
+
+        :return: `False` if the metric was dropped because the spool is full.
+        """
+        line = get_serializer().dumps({"using": using, "action": action}) + "\n"
+        data = line.encode("utf-8")
+        with self._lock:
+            # Each process writes to its own segment, including forked children
+            if self._file is None or self._pid != os.getpid():
+                self._open_segment()
+            now = time.monotonic()
+            sync = (
+                self._unsynced + 1 >= self.fsync_count
+                or now - self._last_sync >= self.fsync_interval
+            )
+            if sync or self._total_bytes + len(data) > self.max_bytes:
+                # Other processes may have written to the spool since the
+                # size was last read, or replayed and removed segments
+                self._total_bytes = self.size()
+            if self._total_bytes + len(data) > self.max_bytes:
+                self.dropped += 1
+                logger.error("Metrics spool at %s is full. Dropping metric.", self.path)
+                return False
+            self._file.write(data)
+            self._file.flush()
+            self._total_bytes += len(data)
+            self._unsynced += 1
+            self.written += 1
+            if sync:
+                self._sync(now)
+            if self._file.tell() >= self.segment_bytes:
+                self._close_segment()
+        return True
+
+    def close(self):
+        """Sync and close the current segment so that it can be replayed."""
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._close_segment()
+
+    def size(self):
+        """Return the total size of the spool directory in bytes."""
+        total = 0
+        for entry in os.scandir(self.path):
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def segments(self, include_stale=False):
+        """Return the paths of segments that are ready to be replayed, oldest first.
+
+        :param bool include_stale: Also return segments left behind by
+            processes that are no longer running.
+        """
+        result = []
+        for filename in sorted(os.listdir(self.path)):
+            if filename.endswith(CLOSED_SUFFIX):
+                result.append(os.path.join(self.path, filename))
+            elif include_stale and filename.endswith((OPEN_SUFFIX, REPLAY_SUFFIX)):
+                pid = _segment_pid(filename)
+                if pid is not None and not _pid_is_alive(pid):
+                    result.append(os.path.join(self.path, filename))
+        return result
+
+    def claim(self, segment_path):
+        """Rename a segment so that no other process replays it.
+
+        :return: The new path of the segment, or `None` if it was claimed by
+            another process.
+        """
+        stem, suffix = os.path.splitext(os.path.basename(segment_path))
+        if suffix == REPLAY_SUFFIX:
+            # Segment claimed by a replay that didn't finish
+            stem = stem.rsplit("-", 1)[0]
+        claimed_path = os.path.join(
+            self.path, "{}-{}{}".format(stem, os.getpid(), REPLAY_SUFFIX)
+        )
+        try:
+            os.rename(segment_path, claimed_path)
+        except FileNotFoundError:
+            return None
+        return claimed_path
+
+    @staticmethod
+    def read(segment_path):
+        """Yield ``(using, action)`` tuples from a segment. Incomplete lines
+        (e.g. from a process that was killed mid-write) are skipped.
+        """
+        serializer = get_serializer()
+        with open(segment_path, "rb") as fp:
+            for line in fp:
+                try:
+                    entry = serializer.loads(line.decode("utf-8"))
+                except (SerializationError, UnicodeDecodeError):
+                    logger.warning("Skipping malformed line in %s", segment_path)
+                    continue
+                yield entry["using"], entry["action"]
+
+    def _open_segment(self):
+        self._pid = os.getpid()
+        filename = "{:020d}-{}{}".format(int(time.time() * 1e6), self._pid, OPEN_SUFFIX)
+        self._file_path = os.path.join(self.path, filename)
+        self._file = open(self._file_path, "ab")
+        self._total_bytes = self.size()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        if self.segment_interval:
+            self._timer = threading.Timer(
+                self.segment_interval, self._rotate, args=(self._file_path,)
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _rotate(self, file_path):
+        """Close a segment that has been open for ``segment_interval`` seconds."""
+        with self._lock:
+            if self._file_path == file_path and self._pid == os.getpid():
+                self._close_segment()
+
+    def _sync(self, now=None):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = now or time.monotonic()
+
+    def _close_segment(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._sync()
+        self._file.close()
+        os.rename(self._file_path, self._file_path[: -len(OPEN_SUFFIX)] + CLOSED_SUFFIX)
+        self._file = None
+        self._file_path = None
+
+
+_UNSET = object()
+_spool = _UNSET
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """Return the `Spool` configured by the ``ELASTICSEARCH_METRICS_SPOOL``
+    setting, or `None` if spooling is disabled.
+    """
+    global _spool
+    if _spool is _UNSET:
+        with _spool_lock:
+            if _spool is _UNSET:
+                spool_settings = getattr(settings, "ELASTICSEARCH_METRICS_SPOOL", None)
+                _spool = Spool(**spool_settings) if spool_settings else None
+    return _spool
+
+
+def close_spool():
+    """Close the current segment of the configured spool."""
+    global _spool
+    with _spool_lock:
+        spool, _spool = _spool, _UNSET
+    if spool not in (None, _UNSET):
+        spool.close()
+
+
+def _reset_after_fork():
+    global _spool, _spool_lock
+    # Children write to segments of their own
+    _spool = _UNSET
+    _spool_lock = threading.Lock()
+
+
+atexit.register(close_spool)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def _reset_spool(setting, **kwargs):
+    if setting == "ELASTICSEARCH_METRICS_SPOOL":
+        close_spool()
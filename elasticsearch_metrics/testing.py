@@ -0,0 +1,834 @@
+"""In-memory stand-in for Elasticsearch, for tests and benchmarks.
+
+Use `InMemoryConnection` as the ``connection_class`` of a connection:
+
+.. code-block:: python
+
+    from elasticsearch_metrics.testing import InMemoryConnection
+
+    ELASTICSEARCH_DSL = {
+        "default": {"hosts": "localhost:9200", "connection_class": InMemoryConnection}
+    }
+
+Connections to the same host share an `InMemoryCluster`, which stores
+documents and index templates in memory. It supports indexing (including
+``_bulk``), index templates, listing and deleting indices, and searches
+(including scrolling, ``search_after`` and ``docvalue_fields``) with basic
+queries and aggregations. As in
+Elasticsearch, documents of indices whose index template disables
+``_source`` are returned without their ``_source``. Requests it doesn't
+support fail with a 400 error.
+"""
+import datetime as dt
+import fnmatch
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote
+
+from dateutil import parser as date_parser
+from elasticsearch import Connection
+from elasticsearch.exceptions import ConnectionTimeout
+from elasticsearch_dsl.serializer import serializer
+
+_EPOCH = dt.datetime(1970, 1, 1)
+
+
+class RequestError(Exception):
+    """Raised by `InMemoryCluster` to respond with an error."""
+
+    def __init__(self, status, error_type, reason):
+        super(RequestError, self).__init__(reason)
+        self.status = status
+        self.error_type = error_type
+        self.reason = reason
+
+    def to_dict(self):
+        return {
+            "error": {"type": self.error_type, "reason": self.reason},
+            "status": self.status,
+        }
+
+
+def _index_not_found(name):
+    return RequestError(
+        404, "index_not_found_exception", "no such index [{}]".format(name)
+    )
+
+
+def _unsupported(what):
+    return RequestError(
+        400, "illegal_argument_exception", "Unsupported {}".format(what)
+    )
+
+
+def _is_true(value):
+    return value in (True, "true", "True", "1", "")
+
+
+def _comparable(value):
+    """Convert ISO 8601 date strings to naive UTC datetimes so that they
+    can be compared with each other.
+    """
+    if isinstance(value, str):
+        try:
+            date = date_parser.isoparse(value)
+        except ValueError:
+            return value
+        if date.tzinfo is not None:
+            date = date.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        return date
+    return value
+
+
+def _get_values(source, field):
+    """Return the values of a (possibly dotted) field in a document."""
+    values = [source]
+    for part in field.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                value = value[part]
+                if isinstance(value, list):
+                    next_values.extend(value)
+                else:
+                    next_values.append(value)
+        values = next_values
+    return [value for value in values if value is not None]
+
+
+class InMemoryCluster(object):
+    """Documents and index templates stored in memory.
+
+    :param bool store_documents: Whether to keep indexed documents. Disable to
+        benchmark writes without growing memory; indices are still created.
+    """
+
+    def __init__(self, store_documents=True):
+        self.store_documents = store_documents
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._scroll_ids = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        """Delete all indices and index templates."""
+        with self._lock:
+            # Mapping of index names => OrderedDict of document ids => sources
+            self.indices = OrderedDict()
+            # Names of the indices created with ``_source`` disabled
+            self.sourceless_indices = set()
+            # Mapping of template names => template bodies
+            self.templates = OrderedDict()
+            # Mapping of scroll ids => [hits, page size, position, options
+            # of _search_response]
+            self.scrolls = {}
+
+    # Indices
+
+    def resolve_indices(self, expression, ignore_unavailable=False):
+        """Return the names of the indices matched by a comma-separated list of
+        index names and wildcard patterns.
+        """
+        if expression in (None, "", "_all"):
+            return list(self.indices)
+        names = []
+        for part in expression.split(","):
+            if "*" in part:
+                names.extend(
+                    name
+                    for name in fnmatch.filter(self.indices, part)
+                    if name not in names
+                )
+            elif part in self.indices:
+                if part not in names:
+                    names.append(part)
+            elif not ignore_unavailable:
+                raise _index_not_found(part)
+        return names
+
+    def index(self, index, source, id=None, op_type="index"):
+        """Store a document and return the response item."""
+        with self._lock:
+            docs = self._create_index(index)
+            if id is None:
+                id = "mem{}".format(next(self._ids))
+            elif op_type == "create" and id in docs:
+                raise RequestError(
+                    409,
+                    "version_conflict_engine_exception",
+                    "[{}]: version conflict, document already exists".format(id),
+                )
+            result = "updated" if id in docs else "created"
+            if self.store_documents:
+                docs[id] = source
+        return {
+            "_index": index,
+            "_type": "doc",
+            "_id": id,
+            "_version": 1,
+            "result": result,
+            "_shards": {"total": 1, "successful": 1, "failed": 0},
+            "_seq_no": 0,
+            "_primary_term": 1,
+            "status": 201 if result == "created" else 200,
+        }
+
+    def create_index(self, index):
+        with self._lock:
+            self._create_index(index)
+        return {"acknowledged": True, "index": index}
+
+    def _create_index(self, index):
+        docs = self.indices.get(index)
+        if docs is None:
+            docs = self.indices[index] = OrderedDict()
+            if not self._source_enabled(index):
+                self.sourceless_indices.add(index)
+        return docs
+
+    def _source_enabled(self, index):
+        """Return whether the index templates matching an index enable ``_source``."""
+        enabled = True
+        templates = sorted(self.templates.values(), key=lambda t: t.get("order", 0))
+        for template in templates:
+            patterns = template.get("index_patterns", template.get("template", []))
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            if not any(fnmatch.fnmatchcase(index, pattern) for pattern in patterns):
+                continue
+            for mapping in template.get("mappings", {}).values():
+                if "enabled" in mapping.get("_source", {}):
+                    enabled = _is_true(mapping["_source"]["enabled"])
+        return enabled
+
+    def get(self, index, id):
+        """Return the response for getting a document."""
+        docs = self.indices.get(index)
+        if docs is None:
+            raise _index_not_found(index)
+        if id not in docs:
+            raise RequestError(404, "not_found", "document missing")
+        response = {
+            "_index": index,
+            "_type": "doc",
+            "_id": id,
+            "_version": 1,
+            "found": True,
+        }
+        if index not in self.sourceless_indices:
+            response["_source"] = docs[id]
+        return response
+
+    def bulk(self, body, default_index=None):
+        lines = [line for line in body.splitlines() if line.strip()]
+        items = []
+        errors = False
+        pos = 0
+        while pos < len(lines):
+            action = json.loads(lines[pos])
+            op_type, meta = next(iter(action.items()))
+            pos += 1
+            index = meta.get("_index", default_index)
+            if op_type == "delete":
+                with self._lock:
+                    docs = self.indices.get(index, {})
+                    found = docs.pop(meta.get("_id"), False) is not False
+                items.append(
+                    {
+                        "delete": {
+                            "_index": index,
+                            "_type": "doc",
+                            "_id": meta.get("_id"),
+                            "result": "deleted" if found else "not_found",
+                            "status": 200 if found else 404,
+                        }
+                    }
+                )
+                continue
+            source = json.loads(lines[pos])
+            pos += 1
+            if op_type not in ("index", "create"):
+                error = _unsupported("bulk operation [{}]".format(op_type))
+            else:
+                try:
+                    item = self.index(
+                        index, source, id=meta.get("_id"), op_type=op_type
+                    )
+                except RequestError as e:
+                    error = e
+                else:
+                    items.append({op_type: item})
+                    continue
+            errors = True
+            items.append(
+                {
+                    op_type: {
+                        "_index": index,
+                        "_type": "doc",
+                        "_id": meta.get("_id"),
+                        "status": error.status,
+                        "error": error.to_dict()["error"],
+                    }
+                }
+            )
+        return {"took": 0, "errors": errors, "items": items}
+
+    def delete_indices(self, expression, ignore_unavailable=False):
+        with self._lock:
+            for name in self.resolve_indices(expression, ignore_unavailable):
+                del self.indices[name]
+                self.sourceless_indices.discard(name)
+        return {"acknowledged": True}
+
+    def cat_indices(self, expression=None, columns=None):
+        rows = []
+        for name in self.resolve_indices(expression, ignore_unavailable=True):
+            row = {
+                "health": "green",
+                "status": "open",
+                "index": name,
+                "docs.count": str(len(self.indices[name])),
+            }
+            if columns:
+                row = {key: row.get(key) for key in columns.split(",")}
+            rows.append(row)
+        return rows
+
+    # Index templates
+
+    def put_template(self, name, body):
+        with self._lock:
+            self.templates[name] = body
+        return {"acknowledged": True}
+
+    def get_templates(self, expression=None):
+        if not expression:
+            return dict(self.templates)
+        result = {}
+        for part in expression.split(","):
+            for name in fnmatch.filter(self.templates, part):
+                result[name] = self.templates[name]
+        if not result:
+            raise RequestError(404, "resource_not_found_exception", expression)
+        return result
+
+    def delete_template(self, name):
+        with self._lock:
+            if self.templates.pop(name, None) is None:
+                raise RequestError(
+                    404,
+                    "index_template_missing_exception",
+                    "index_template [{}] missing".format(name),
+                )
+        return {"acknowledged": True}
+
+    # Search
+
+    def search(
+        self, expression, body, ignore_unavailable=False, size=None, scroll=False
+    ):
+        body = body or {}
+        hits = list(self._iter_matches(expression, body, ignore_unavailable))
+        sorts = body.get("sort", [])
+        if not isinstance(sorts, list):
+            sorts = [sorts]
+        # (field, order) pairs
+        sort_fields = []
+        for sort in sorts:
+            if sort == "_doc":
+                # Index order
+                continue
+            if isinstance(sort, str):
+                field, order = sort, "asc"
+            else:
+                field, options = next(iter(sort.items()))
+                order = (
+                    options.get("order", "asc")
+                    if isinstance(options, dict)
+                    else options
+                )
+            sort_fields.append((field, order))
+        for field, order in reversed(sort_fields):
+            hits.sort(
+                key=lambda hit: _sort_key(_hit_values(hit, field)),
+                reverse=order == "desc",
+            )
+        if "search_after" in body:
+            hits = [
+                hit
+                for hit in hits
+                if _is_after(_sort_values(hit, sort_fields), body["search_after"])
+            ]
+        start = int(body.get("from", 0))
+        size = int(size if size is not None else body.get("size", 10))
+        options = {
+            "sort_fields": sort_fields,
+            "docvalue_fields": body.get("docvalue_fields", ()),
+        }
+        response = self._search_response(hits, start, size, **options)
+        if scroll:
+            with self._lock:
+                scroll_id = str(next(self._scroll_ids))
+                self.scrolls[scroll_id] = [hits, size, start + size, options]
+            response["_scroll_id"] = scroll_id
+        aggs = body.get("aggs", body.get("aggregations"))
+        if aggs:
+            response["aggregations"] = _aggregate(aggs, [hit[2] for hit in hits])
+        return response
+
+    def scroll(self, scroll_id):
+        """Return the next page of a search started with ``scroll``."""
+        with self._lock:
+            try:
+                state = self.scrolls[scroll_id]
+            except KeyError:
+                raise RequestError(
+                    404,
+                    "search_context_missing_exception",
+                    "No search context found for id [{}]".format(scroll_id),
+                )
+            hits, size, start, options = state
+            state[2] = start + size
+        response = self._search_response(hits, start, size, **options)
+        response["_scroll_id"] = scroll_id
+        return response
+
+    def clear_scroll(self, scroll_ids):
+        with self._lock:
+            freed = [
+                scroll_id
+                for scroll_id in scroll_ids
+                if self.scrolls.pop(scroll_id, None) is not None
+            ]
+        return {"succeeded": True, "num_freed": len(freed)}
+
+    def count(self, expression, body, ignore_unavailable=False):
+        hits = self._iter_matches(expression, body or {}, ignore_unavailable)
+        return {"count": sum(1 for _ in hits)}
+
+    def _search_response(self, hits, start, size, sort_fields=(), docvalue_fields=()):
+        page = []
+        for index, id, source in hits[start : start + size]:
+            hit = {"_index": index, "_type": "doc", "_id": id, "_score": 1.0}
+            if index not in self.sourceless_indices:
+                hit["_source"] = source
+            if sort_fields:
+                hit["sort"] = [
+                    value[1] for value in _sort_values((index, id, source), sort_fields)
+                ]
+            fields = {}
+            for field in docvalue_fields:
+                if isinstance(field, dict):
+                    # Values formatted with the mapping's format
+                    field = field["field"]
+                    values = _get_values(source, field)
+                else:
+                    values = [_doc_value(value) for value in _get_values(source, field)]
+                if values:
+                    # Doc values are sorted and deduplicated
+                    fields[field] = sorted(set(values), key=_comparable)
+            if fields:
+                hit["fields"] = fields
+            page.append(hit)
+        return {
+            "took": 0,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": len(hits),
+                "max_score": 1.0 if hits else None,
+                "hits": page,
+            },
+        }
+
+    def _iter_matches(self, expression, body, ignore_unavailable):
+        query = body.get("query", {"match_all": {}})
+        with self._lock:
+            for index in self.resolve_indices(expression, ignore_unavailable):
+                for id, source in list(self.indices[index].items()):
+                    if _matches(query, source, id):
+                        yield index, id, source
+
+
+def _hit_values(hit, field):
+    """Return the values of a field in a ``(index, id, source)`` hit."""
+    if field == "_id":
+        return [hit[1]]
+    return _get_values(hit[2], field)
+
+
+def _sort_values(hit, sort_fields):
+    """Return ``(order, value)`` pairs with the sort values of a hit. As in
+    Elasticsearch, dates are sorted by their number of milliseconds since
+    the epoch.
+    """
+    result = []
+    for field, order in sort_fields:
+        values = _hit_values(hit, field)
+        result.append((order, _doc_value(values[0]) if values else None))
+    return result
+
+
+def _doc_value(value):
+    """Return a value as Elasticsearch 6 returns doc values, with dates as
+    milliseconds since the epoch.
+    """
+    comparable = _comparable(value)
+    if isinstance(comparable, dt.datetime):
+        return int((comparable - _EPOCH).total_seconds() * 1000)
+    return value
+
+
+def _is_after(sort_values, search_after):
+    """Return whether a hit's sort values come after ``search_after``."""
+    for (order, value), after in zip(sort_values, search_after):
+        key = _sort_key([] if value is None else [value])
+        after_key = _sort_key([] if after is None else [after])
+        if key != after_key:
+            return key > after_key if order == "asc" else key < after_key
+    return False
+
+
+def _sort_key(values):
+    if not values:
+        return (1, None)
+    return (0, _comparable(values[0]))
+
+
+def _matches_bool(params, source, id):
+    clauses = {
+        key: value if isinstance(value, list) else [value]
+        for key, value in params.items()
+        if isinstance(value, (list, dict))
+    }
+    for clause in clauses.get("must", []) + clauses.get("filter", []):
+        if not _matches(clause, source, id):
+            return False
+    for clause in clauses.get("must_not", []):
+        if _matches(clause, source, id):
+            return False
+    should = clauses.get("should", [])
+    if not should:
+        return True
+    minimum = params.get("minimum_should_match")
+    if minimum is None:
+        minimum = 0 if clauses.get("must") or clauses.get("filter") else 1
+    return sum(1 for clause in should if _matches(clause, source, id)) >= int(minimum)
+
+
+def _matches(query, source, id):
+    query_type, params = next(iter(query.items()))
+    if query_type == "match_all":
+        return True
+    elif query_type == "match_none":
+        return False
+    elif query_type == "bool":
+        return _matches_bool(params, source, id)
+    elif query_type == "ids":
+        return id in params.get("values", [])
+    field, value = next(iter(params.items()))
+    values = _get_values(source, field)
+    if query_type in ("term", "match"):
+        if isinstance(value, dict):
+            value = value.get("value", value.get("query"))
+        return value in values
+    elif query_type == "terms":
+        return any(item in values for item in value)
+    elif query_type == "exists":
+        return bool(_get_values(source, params["field"]))
+    elif query_type == "prefix":
+        if isinstance(value, dict):
+            value = value["value"]
+        return any(str(item).startswith(value) for item in values)
+    elif query_type == "range":
+        return any(_in_range(item, value) for item in values)
+    raise _unsupported("query [{}]".format(query_type))
+
+
+_RANGE_OPERATORS = {
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+def _in_range(value, bounds):
+    value = _comparable(value)
+    for operator, bound in bounds.items():
+        if operator not in _RANGE_OPERATORS:
+            continue
+        try:
+            if not _RANGE_OPERATORS[operator](value, _comparable(bound)):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+_INTERVALS = {
+    "year": "year",
+    "1y": "year",
+    "month": "month",
+    "1M": "month",
+    "week": "week",
+    "1w": "week",
+    "day": "day",
+    "1d": "day",
+    "hour": "hour",
+    "1h": "hour",
+    "minute": "minute",
+    "1m": "minute",
+}
+
+
+def _truncate_date(date, interval):
+    if interval == "year":
+        return dt.datetime(date.year, 1, 1)
+    elif interval == "month":
+        return dt.datetime(date.year, date.month, 1)
+    elif interval == "week":
+        day = dt.datetime(date.year, date.month, date.day)
+        return day - dt.timedelta(days=day.weekday())
+    elif interval == "day":
+        return dt.datetime(date.year, date.month, date.day)
+    elif interval == "hour":
+        return date.replace(minute=0, second=0, microsecond=0)
+    return date.replace(second=0, microsecond=0)
+
+
+def _aggregate(aggs, sources):
+    result = {}
+    for name, agg in aggs.items():
+        sub_aggs = agg.get("aggs", agg.get("aggregations"))
+        agg_type, params = next(
+            (key, value)
+            for key, value in agg.items()
+            if key not in ("aggs", "aggregations")
+        )
+        if agg_type in ("terms", "date_histogram"):
+            groups = OrderedDict()
+            for source in sources:
+                for value in _get_values(source, params["field"]):
+                    if agg_type == "date_histogram":
+                        interval = params.get(
+                            "interval", params.get("calendar_interval")
+                        )
+                        if interval not in _INTERVALS:
+                            raise _unsupported("interval [{}]".format(interval))
+                        value = _truncate_date(_comparable(value), _INTERVALS[interval])
+                    groups.setdefault(value, []).append(source)
+            if agg_type == "terms":
+                keys = sorted(groups, key=lambda key: (-len(groups[key]), key))
+                keys = keys[: int(params.get("size", 10))]
+            else:
+                keys = sorted(groups)
+            buckets = []
+            for key in keys:
+                bucket = {"key": key, "doc_count": len(groups[key])}
+                if agg_type == "date_histogram":
+                    bucket["key_as_string"] = key.isoformat()
+                    bucket["key"] = int((key - _EPOCH).total_seconds() * 1000)
+                if sub_aggs:
+                    bucket.update(_aggregate(sub_aggs, groups[key]))
+                buckets.append(bucket)
+            result[name] = {"buckets": buckets}
+            if agg_type == "terms":
+                other = sum(len(group) for group in groups.values()) - sum(
+                    bucket["doc_count"] for bucket in buckets
+                )
+                result[name].update(
+                    doc_count_error_upper_bound=0, sum_other_doc_count=other
+                )
+        elif agg_type == "filter":
+            matching = [source for source in sources if _matches(params, source, None)]
+            result[name] = {"doc_count": len(matching)}
+            if sub_aggs:
+                result[name].update(_aggregate(sub_aggs, matching))
+        elif agg_type == "weighted_avg":
+            result[name] = {"value": _weighted_avg(params, sources)}
+        else:
+            if "field" not in params:
+                raise _unsupported("[{}] aggregation without a field".format(agg_type))
+            values = [
+                value for source in sources for value in _field_values(source, params)
+            ]
+            result[name] = {"value": _metric(agg_type, values)}
+    return result
+
+
+def _field_values(source, params):
+    values = _get_values(source, params["field"])
+    if not values and "missing" in params:
+        return [params["missing"]]
+    return values
+
+
+def _weighted_avg(params, sources):
+    total = total_weight = 0.0
+    for source in sources:
+        values = _field_values(source, params["value"])
+        weights = _field_values(source, params["weight"])
+        if not values or not weights:
+            continue
+        for value in values:
+            total += value * weights[0]
+            total_weight += weights[0]
+    return total / total_weight if total_weight else None
+
+
+def _metric(agg_type, values):
+    if agg_type == "value_count":
+        return len(values)
+    elif agg_type == "cardinality":
+        return len({json.dumps(value, sort_keys=True) for value in values})
+    elif agg_type == "sum":
+        return float(sum(values))
+    elif agg_type in ("avg", "min", "max"):
+        if not values:
+            return None
+        if agg_type == "avg":
+            return float(sum(values)) / len(values)
+        return float(min(values) if agg_type == "min" else max(values))
+    raise _unsupported("aggregation [{}]".format(agg_type))
+
+
+_clusters = {}
+_clusters_lock = threading.Lock()
+
+
+def get_cluster(host="localhost", port=9200):
+    """Return the `InMemoryCluster` used by connections to a host."""
+    key = (host, port)
+    with _clusters_lock:
+        if key not in _clusters:
+            _clusters[key] = InMemoryCluster()
+        return _clusters[key]
+
+
+def reset():
+    """Delete the data of all in-memory clusters."""
+    with _clusters_lock:
+        for cluster in _clusters.values():
+            cluster.reset()
+
+
+class InMemoryConnection(Connection):
+    """Connection that serves requests from an `InMemoryCluster` without
+    performing any network I/O.
+
+    :param float latency: Seconds to sleep for each request, to simulate the
+        round trip time to a cluster. Requests with a shorter timeout raise
+        `ConnectionTimeout <elasticsearch.exceptions.ConnectionTimeout>`.
+    :param InMemoryCluster cluster: Cluster to use. Defaults to the cluster
+        shared by connections to the same host.
+    """
+
+    latency = 0
+
+    def __init__(
+        self, host="localhost", port=None, latency=None, cluster=None, **kwargs
+    ):
+        super(InMemoryConnection, self).__init__(host=host, port=port, **kwargs)
+        self.cluster = cluster or get_cluster(host, port or 9200)
+        if latency is not None:
+            self.latency = latency
+
+    def perform_request(
+        self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None
+    ):
+        start = time.time()
+        if self.latency:
+            if timeout is not None and self.latency > timeout:
+                time.sleep(timeout)
+                raise ConnectionTimeout("TIMEOUT", "Read timed out", None)
+            time.sleep(self.latency)
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        try:
+            params = {
+                key: value.decode("utf-8") if isinstance(value, bytes) else value
+                for key, value in (params or {}).items()
+            }
+            status, response = 200, self.handle(method, url, params, body)
+        except RequestError as error:
+            status, response = error.status, error.to_dict()
+        data = serializer.dumps(response) if response is not None else ""
+        duration = time.time() - start
+        if not (200 <= status < 300) and status not in ignore:
+            self.log_request_fail(method, url, url, body, duration, status, data)
+            self._raise_error(status, data)
+        self.log_request_success(method, url, url, body, status, data, duration)
+        return status, {"content-type": "application/json"}, data
+
+    def handle_template(self, method, name, body):
+        if method == "PUT" or (method == "POST" and name):
+            return self.cluster.put_template(name, json.loads(body))
+        elif method == "DELETE":
+            return self.cluster.delete_template(name)
+        elif method == "HEAD":
+            self.cluster.get_templates(name)
+            return None
+        return self.cluster.get_templates(name)
+
+    def handle(self, method, url, params, body):
+        """Dispatch a request to the cluster and return the response body."""
+        cluster = self.cluster
+        path = [
+            unquote(part) for part in url.split("?")[0].strip("/").split("/") if part
+        ]
+        ignore_unavailable = _is_true(params.get("ignore_unavailable", "false"))
+        if not path:
+            return {"name": "in-memory", "version": {"number": "6.8.0"}}
+        if path[0] == "_bulk" or path[-1] == "_bulk":
+            default_index = path[0] if path[0] != "_bulk" else None
+            return cluster.bulk(body or "", default_index=default_index)
+        if path[0] == "_template":
+            return self.handle_template(
+                method, path[1] if len(path) > 1 else None, body
+            )
+        if path[0] == "_cat" and path[1:2] == ["indices"]:
+            expression = path[2] if len(path) > 2 else None
+            return cluster.cat_indices(expression, params.get("h"))
+        if path == ["_search", "scroll"]:
+            scroll = json.loads(body) if body else {}
+            scroll_id = params.get("scroll_id", scroll.get("scroll_id"))
+            if method == "DELETE":
+                if not isinstance(scroll_id, list):
+                    scroll_id = scroll_id.split(",")
+                return cluster.clear_scroll(scroll_id)
+            return cluster.scroll(scroll_id)
+        if path[-1] in ("_search", "_count"):
+            expression = path[0] if len(path) > 1 else None
+            query = json.loads(body) if body else {}
+            if path[-1] == "_count":
+                return cluster.count(expression, query, ignore_unavailable)
+            return cluster.search(
+                expression,
+                query,
+                ignore_unavailable,
+                size=params.get("size"),
+                scroll="scroll" in params,
+            )
+        if path[-1] == "_refresh":
+            return {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+        if len(path) == 1:
+            if method == "DELETE":
+                return cluster.delete_indices(path[0], ignore_unavailable)
+            elif method == "HEAD":
+                cluster.resolve_indices(path[0])
+                return None
+            elif method == "PUT":
+                return cluster.create_index(path[0])
+        if len(path) in (2, 3) and method in ("POST", "PUT"):
+            id = path[2] if len(path) == 3 else None
+            op_type = params.get("op_type", "index")
+            item = cluster.index(path[0], json.loads(body), id=id, op_type=op_type)
+            item.pop("status")
+            return item
+        if len(path) == 3 and method in ("GET", "HEAD"):
+            return cluster.get(path[0], path[2])
+        raise _unsupported("request [{} {}]".format(method, url))
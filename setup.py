@@ -5,7 +5,20 @@ import os
 from setuptools import setup, find_packages
 
 EXTRAS_REQUIRE = {
-    "tests": ["pytest", "mock", "pytest-django==3.10.0", "factory-boy==2.11.1"],
+    "async": ["aiohttp>=3.0"],
+    "orjson": ["orjson>=3.0"],
+    "statsd": ["statsd>=3.0"],
+    "prometheus": ["prometheus_client>=0.7"],
+    "tests": [
+        "pytest",
+        "mock",
+        "pytest-django==3.10.0",
+        "factory-boy==2.11.1",
+        "aiohttp>=3.0",
+        "orjson>=3.0",
+        "statsd>=3.0",
+        "prometheus_client>=0.7",
+    ],
     "lint": [
         "flake8==5.0.4",
         'flake8-bugbear==18.8.0; python_version >= "3.5"',
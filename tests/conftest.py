@@ -1,8 +1,13 @@
+import json
+import time
+
 import mock
 import pytest
 
 from elasticsearch_dsl import connections
 
+from elasticsearch_metrics.testing import get_cluster
+
 
 @pytest.fixture(scope="function")
 def client():
@@ -28,12 +33,51 @@ def _es_marker(request, client):
         yield
 
 
+def make_bulk_response(body, failed_ids=()):
+    lines = [json.loads(line) for line in body.strip().split("\n")]
+    items = []
+    for i, (action, source) in enumerate(zip(lines[::2], lines[1::2])):
+        op_type, params = action.popitem()
+        item = dict(params, _id=str(i), _version=1)
+        if source.get("page_id") in failed_ids:
+            item.update(status=400, error={"type": "mapper_parsing_exception"})
+        else:
+            item.update(status=201, result="created")
+        items.append({op_type: item})
+    return {"took": 1, "errors": bool(failed_ids), "items": items}
+
+
+def wait_until(predicate, timeout=2):
+    """Wait until ``predicate()`` is true, failing after ``timeout`` seconds."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        time.sleep(0.005)
+
+
+@pytest.fixture()
+def mock_bulk(client):
+    """Mock the client's bulk method to respond as if all documents were indexed."""
+    with mock.patch.object(client, "bulk") as patch:
+        patch.side_effect = lambda body, *args, **kwargs: make_bulk_response(body)
+        yield patch
+
+
 @pytest.fixture()
 def mock_save():
     with mock.patch("elasticsearch_metrics.metrics.Document.save") as patch:
         yield patch
 
 
+@pytest.fixture()
+def cluster():
+    """In-memory cluster of the ``ingest`` connection, emptied after the test."""
+    cluster = get_cluster("ingest")
+    yield cluster
+    cluster.reset()
+
+
 @pytest.fixture()
 def run_mgmt_command(capsys):
     """Function fixture that runs a python manage.py with arguments
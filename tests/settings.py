@@ -1,5 +1,7 @@
 import os
 
+from elasticsearch_metrics.testing import InMemoryConnection
+
 SECRET_KEY = "not so secret in tests"
 DEBUG = True
 ALLOWED_HOSTS = []
@@ -11,5 +13,8 @@ MIDDLEWARE_CLASSES = []
 DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3"}}
 TIME_ZONE = "UTC"
 ELASTICSEARCH_DSL = {
-    "default": {"hosts": os.environ.get("ELASTICSEARCH_HOST", "localhost:9201")}
+    "default": {"hosts": os.environ.get("ELASTICSEARCH_HOST", "localhost:9201")},
+    # Used by routing tests
+    "ingest": {"hosts": "ingest:9200", "connection_class": InMemoryConnection},
+    "replica": {"hosts": "replica:9200", "connection_class": InMemoryConnection},
 }
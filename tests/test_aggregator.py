@@ -0,0 +1,295 @@
+import datetime as dt
+import json
+import os
+import socket
+
+import mock
+import pytest
+from elasticsearch_dsl import connections
+
+from elasticsearch_metrics import metrics, signals
+from elasticsearch_metrics.aggregator import (
+    MAX_DATAGRAM_SIZE,
+    Aggregator,
+    AggregatorClient,
+    close_aggregators,
+    get_shipper,
+)
+from elasticsearch_metrics.buffer import MetricBuffer, get_buffer
+from elasticsearch_metrics.counters import get_accumulator
+from elasticsearch_metrics.testing import InMemoryConnection
+from tests.conftest import wait_until
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "register_at_fork"), reason="requires os.register_at_fork"
+)
+
+
+class AggregatedPageView(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "aggregatorapp"
+        write_using = "ingest"
+
+
+class AggregatedCounter(metrics.CounterMetric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "aggregatorapp"
+        write_using = "ingest"
+
+
+def run_in_child(func):
+    """Call ``func`` in a forked child and return its JSON-serializable result."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            result = {"result": func()}
+        except Exception as e:
+            result = {"error": repr(e)}
+        try:
+            os.write(write_fd, json.dumps(result).encode("utf-8"))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as fp:
+        data = fp.read()
+    os.waitpid(pid, 0)
+    result = json.loads(data.decode("utf-8"))
+    assert "error" not in result, result.get("error")
+    return result["result"]
+
+
+def count_documents(cluster):
+    return sum(
+        len(documents)
+        for name, documents in cluster.indices.items()
+        if name.startswith("aggregatorapp_")
+    )
+
+
+@pytest.fixture()
+def socket_path(tmp_path):
+    return str(tmp_path / "metrics.sock")
+
+
+@pytest.fixture()
+def aggregator(socket_path, cluster):
+    aggregator = Aggregator(socket_path, flush_interval=60).start()
+    yield aggregator
+    aggregator.close(timeout=2)
+
+
+class TestForkSafety:
+    def test_buffer_is_flushed_before_fork(self, settings, cluster):
+        settings.ELASTICSEARCH_METRICS_BUFFER = {"flush_interval": 60}
+        buffer = get_buffer()
+        AggregatedPageView.record(page_id="a")
+        assert buffer.depth == 1
+
+        def child():
+            child_buffer = get_buffer()
+            return [child_buffer is buffer, child_buffer.depth]
+
+        assert run_in_child(child) == [False, 0]
+        assert buffer.depth == 0
+        assert count_documents(cluster) == 1
+
+    def test_counters_are_flushed_before_fork(self, settings, cluster):
+        settings.ELASTICSEARCH_METRICS_COUNTERS = {"flush_interval": 60}
+        accumulator = get_accumulator()
+        AggregatedCounter.increment(page_id="a")
+
+        def child():
+            return [get_accumulator() is accumulator, len(get_accumulator())]
+
+        assert run_in_child(child) == [False, 0]
+        assert len(accumulator) == 0
+        assert count_documents(cluster) == 1
+
+    def test_connections_are_recreated_in_child(self):
+        client = connections.get_connection("ingest")
+
+        def child():
+            return connections.get_connection("ingest") is client
+
+        assert run_in_child(child) is False
+        assert connections.get_connection("ingest") is client
+
+    def test_connections_added_in_code_are_kept_in_child(self):
+        extra = connections.create_connection(
+            "extra", hosts="extra:9200", connection_class=InMemoryConnection
+        )
+        try:
+
+            def child():
+                return connections.get_connection("extra") is extra
+
+            assert run_in_child(child) is True
+        finally:
+            connections.remove_connection("extra")
+
+
+class TestAggregator:
+    def test_receives_and_sends_metrics(self, aggregator, socket_path, cluster):
+        buffer = MetricBuffer(flush_interval=60, socket=socket_path)
+        try:
+            for page_id in ("a", "b"):
+                assert buffer.put(AggregatedPageView(page_id=page_id))
+        finally:
+            buffer.close()
+        assert buffer.forwarded == 2
+        wait_until(lambda: aggregator.received == 2)
+        assert aggregator.flush(timeout=2)
+        assert aggregator.indexed == 2
+        assert count_documents(cluster) == 2
+
+    def test_metrics_from_forked_children(self, aggregator, socket_path, cluster):
+        client = AggregatorClient(socket_path)
+        action = AggregatedPageView(page_id="a").to_bulk_action(
+            AggregatedPageView.get_index_name()
+        )
+        assert client.send("ingest", action)
+
+        def child():
+            return client.send("ingest", action)
+
+        assert run_in_child(child) is True
+        assert run_in_child(child) is True
+        wait_until(lambda: aggregator.received == 3)
+        assert aggregator.flush(timeout=2)
+        assert count_documents(cluster) == 3
+        client.close()
+
+    def test_children_dont_remove_socket(self, aggregator, socket_path):
+        def child():
+            close_aggregators()
+            return os.path.exists(socket_path)
+
+        assert run_in_child(child) is True
+        assert os.path.exists(socket_path)
+
+    def test_buffer_queues_metrics_without_aggregator(self, socket_path, cluster):
+        buffer = MetricBuffer(flush_interval=60, socket=socket_path)
+        try:
+            buffer.put(AggregatedPageView(page_id="a"))
+            assert buffer.forwarded == 0
+            assert buffer.depth == 1
+        finally:
+            buffer.close()
+        assert count_documents(cluster) == 1
+
+    def test_large_metrics(self, aggregator, socket_path, cluster):
+        client = AggregatorClient(socket_path)
+        action = AggregatedPageView(
+            page_id="a" * (MAX_DATAGRAM_SIZE - 1024)
+        ).to_bulk_action(AggregatedPageView.get_index_name())
+        assert client.send("ingest", action)
+        too_large = dict(action, _source={"page_id": "a" * MAX_DATAGRAM_SIZE})
+        assert client.send("ingest", too_large) is False
+        wait_until(lambda: aggregator.received == 1)
+        assert aggregator.flush(timeout=2)
+        assert count_documents(cluster) == 1
+        # Datagrams larger than the socket's buffer are sent by the worker
+        client._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        assert client.send("ingest", action) is False
+        assert client._socket is not None
+        client.close()
+
+    def test_drops_malformed_metrics(self, aggregator, socket_path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.sendto(b"not json", socket_path)
+        finally:
+            sock.close()
+        wait_until(lambda: aggregator.dropped == 1)
+        assert aggregator.flush(timeout=2)
+
+    def test_close_sends_pending_metrics_and_removes_socket(self, socket_path, cluster):
+        aggregator = Aggregator(socket_path, flush_interval=60).start()
+        client = AggregatorClient(socket_path)
+        action = AggregatedPageView(page_id="a").to_bulk_action(
+            AggregatedPageView.get_index_name()
+        )
+        assert client.send("ingest", action)
+        wait_until(lambda: aggregator.received == 1)
+        aggregator.close(timeout=2)
+        assert count_documents(cluster) == 1
+        assert not os.path.exists(socket_path)
+        assert client.send("ingest", action) is False
+
+
+class TestShipper:
+    @pytest.fixture()
+    def shipper_settings(self, settings, socket_path):
+        settings.ELASTICSEARCH_METRICS_SHIPPER = {"socket": socket_path}
+
+    def test_disabled_by_default(self):
+        assert get_shipper() is None
+
+    def test_save_sends_metrics_to_shipper(
+        self, shipper_settings, aggregator, cluster, mock_save
+    ):
+        assert AggregatedPageView.record(page_id="a") is not None
+        assert mock_save.call_count == 0
+        wait_until(lambda: aggregator.received == 1)
+        assert aggregator.flush(timeout=2)
+        assert count_documents(cluster) == 1
+
+    def test_save_sends_signals(self, shipper_settings, aggregator, mock_save):
+        pre_save = mock.Mock()
+        post_save = mock.Mock()
+        signals.pre_save.connect(pre_save, sender=AggregatedPageView)
+        signals.post_save.connect(post_save, sender=AggregatedPageView)
+        try:
+            instance = AggregatedPageView.record(page_id="a")
+        finally:
+            signals.pre_save.disconnect(pre_save, sender=AggregatedPageView)
+            signals.post_save.disconnect(post_save, sender=AggregatedPageView)
+        assert pre_save.call_count == 1
+        assert post_save.call_count == 1
+        assert post_save.call_args[1]["instance"] is instance
+        assert post_save.call_args[1]["using"] == "ingest"
+        assert post_save.call_args[1]["index"] == AggregatedPageView.get_index_name()
+        wait_until(lambda: aggregator.received == 1)
+
+    def test_save_without_shipper_running(self, shipper_settings, cluster):
+        assert AggregatedPageView.record(page_id="a") is not None
+        assert count_documents(cluster) == 1
+
+    def test_save_without_shipper_running_buffers_metrics(
+        self, shipper_settings, settings, cluster
+    ):
+        settings.ELASTICSEARCH_METRICS_BUFFER = {"flush_interval": 60}
+        AggregatedPageView.record(page_id="a")
+        assert get_buffer().depth == 1
+
+    def test_one_bulk_request_per_index(self, aggregator, socket_path, mock_bulk):
+        client = AggregatorClient(socket_path)
+        for day in (1, 2, 1):
+            instance = AggregatedPageView(
+                page_id="a", timestamp=dt.datetime(2020, 1, day)
+            )
+            action = instance.to_bulk_action(
+                AggregatedPageView.get_index_name(instance.timestamp)
+            )
+            assert client.send("default", action)
+        client.close()
+        wait_until(lambda: aggregator.received == 3)
+        assert aggregator.flush(timeout=2)
+        assert aggregator.indexed == 3
+        indices = sorted(
+            {
+                json.loads(line)["index"]["_index"]
+                for line in call[0][0].strip().split("\n")[::2]
+            }
+            for call in mock_bulk.call_args_list
+        )
+        assert indices == [
+            {"aggregatorapp_aggregatedpageview_2020.01.01"},
+            {"aggregatorapp_aggregatedpageview_2020.01.02"},
+        ]
@@ -0,0 +1,225 @@
+import asyncio
+import datetime as dt
+import json
+import time
+
+import mock
+import pytest
+
+from elasticsearch.exceptions import ConnectionError, RequestError
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics import signals
+
+web = pytest.importorskip("aiohttp.web")
+
+
+class AsyncPageView(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "dummyapp"
+
+
+class StubServer(object):
+    """Local HTTP server that responds to ``_bulk`` requests."""
+
+    def __init__(self, delay=0, failed_ids=()):
+        self.delay = delay
+        self.failed_ids = failed_ids
+        self.requests = []
+
+    async def handle_bulk(self, request):
+        body = await request.text()
+        self.requests.append(body)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        lines = [json.loads(line) for line in body.strip().split("\n")]
+        items = []
+        for i, (action, source) in enumerate(zip(lines[::2], lines[1::2])):
+            params = action["index"]
+            item = dict(params, _id=str(i), _version=1)
+            if source.get("page_id") in self.failed_ids:
+                item.update(status=400, error={"type": "mapper_parsing_exception"})
+            else:
+                item.update(status=201, result="created")
+            items.append({"index": item})
+        return web.json_response({"took": 1, "errors": False, "items": items})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/_bulk", self.handle_bulk)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+@pytest.fixture()
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture()
+def stub_server(loop, settings):
+    server = StubServer()
+    loop.run_until_complete(server.start())
+    settings.ELASTICSEARCH_DSL = dict(
+        settings.ELASTICSEARCH_DSL,
+        default={"hosts": "127.0.0.1:{}".format(server.port)},
+    )
+    yield server
+
+    from elasticsearch_metrics import aio
+
+    loop.run_until_complete(aio.get_transport().close())
+    loop.run_until_complete(server.stop())
+
+
+class TestAsave:
+    def test_asave(self, loop, stub_server):
+        metric = AsyncPageView(timestamp=dt.datetime(2020, 2, 14), page_id="a")
+        created = loop.run_until_complete(metric.asave())
+        assert created is True
+        assert metric.meta.id == "0"
+        assert len(stub_server.requests) == 1
+        action = json.loads(stub_server.requests[0].split("\n")[0])
+        assert action == {
+            "index": {"_index": "dummyapp_asyncpageview_2020.02.14", "_type": "doc"}
+        }
+
+    def test_asave_sends_signals(self, loop, stub_server):
+        mock_pre_save_listener = mock.Mock()
+        mock_post_save_listener = mock.Mock()
+        signals.pre_save.connect(mock_pre_save_listener, sender=AsyncPageView)
+        signals.post_save.connect(mock_post_save_listener, sender=AsyncPageView)
+        try:
+            loop.run_until_complete(AsyncPageView(page_id="a").asave())
+        finally:
+            signals.pre_save.disconnect(mock_pre_save_listener, sender=AsyncPageView)
+            signals.post_save.disconnect(mock_post_save_listener, sender=AsyncPageView)
+        assert mock_pre_save_listener.call_count == 1
+        assert mock_post_save_listener.call_count == 1
+
+    def test_asave_raises_for_failed_item(self, loop, stub_server):
+        stub_server.failed_ids = ("a",)
+        with pytest.raises(RequestError):
+            loop.run_until_complete(AsyncPageView(page_id="a").asave())
+
+    def test_asave_raises_connection_error(self, loop, stub_server):
+        loop.run_until_complete(stub_server.stop())
+        with pytest.raises(ConnectionError):
+            loop.run_until_complete(AsyncPageView(page_id="a").asave())
+        loop.run_until_complete(stub_server.start())
+
+
+class TestArecord:
+    def test_arecord(self, loop, stub_server):
+        timestamp = dt.datetime(2020, 2, 14)
+        metric = loop.run_until_complete(
+            AsyncPageView.arecord(timestamp=timestamp, page_id="a")
+        )
+        assert metric.timestamp == timestamp
+        assert metric.page_id == "a"
+        assert metric.meta.id == "0"
+
+    def test_concurrent_calls_are_coalesced(self, loop, stub_server):
+        async def record_all():
+            return await asyncio.gather(
+                *[AsyncPageView.arecord(page_id=str(i)) for i in range(100)]
+            )
+
+        results = loop.run_until_complete(record_all())
+        assert len(results) == 100
+        assert len(stub_server.requests) == 1
+        assert [each.meta.id for each in results] == [str(i) for i in range(100)]
+
+    def test_max_batch_size(self, loop, stub_server, settings):
+        settings.ELASTICSEARCH_METRICS_ASYNC = {"max_batch_size": 30}
+
+        async def record_all():
+            await asyncio.gather(
+                *[AsyncPageView.arecord(page_id=str(i)) for i in range(100)]
+            )
+
+        loop.run_until_complete(record_all())
+        assert len(stub_server.requests) == 4
+
+    def test_does_not_block_event_loop(self, loop, stub_server):
+        stub_server.delay = 0.2
+
+        async def measure_lag():
+            max_lag = 0
+            deadline = time.monotonic() + 0.3
+            while time.monotonic() < deadline:
+                start = time.monotonic()
+                await asyncio.sleep(0.005)
+                max_lag = max(max_lag, time.monotonic() - start - 0.005)
+            return max_lag
+
+        async def run():
+            lag = asyncio.ensure_future(measure_lag())
+            await asyncio.gather(
+                *[AsyncPageView.arecord(page_id=str(i)) for i in range(50)]
+            )
+            return await lag
+
+        max_lag = loop.run_until_complete(run())
+        # The server takes 200ms to respond; the event loop should keep running meanwhile
+        assert max_lag < 0.1
+
+
+class TestAsyncBatcher:
+    def test_close_waits_for_pending_requests(self, loop, stub_server):
+        from elasticsearch_metrics.aio import get_batcher
+
+        stub_server.delay = 0.05
+
+        async def record_and_close():
+            batcher = get_batcher()
+            future = asyncio.ensure_future(AsyncPageView.arecord(page_id="a"))
+            while not batcher._tasks:
+                await asyncio.sleep(0)
+            await batcher.close()
+            assert batcher._tasks == set()
+            return await future
+
+        metric = loop.run_until_complete(record_and_close())
+        assert metric.meta.id == "0"
+        assert len(stub_server.requests) == 1
+
+
+class TestAsyncTransport:
+    def test_session_per_event_loop(self, loop):
+        from elasticsearch_metrics import aio
+
+        transport = aio.AsyncTransport(hosts="127.0.0.1:9200")
+        session = loop.run_until_complete(transport._get_session())
+        other_loop = asyncio.new_event_loop()
+        try:
+            other_session = other_loop.run_until_complete(transport._get_session())
+            assert other_session is not session
+            assert loop.run_until_complete(transport._get_session()) is session
+            other_loop.run_until_complete(transport.close())
+        finally:
+            other_loop.close()
+        assert other_session.closed
+        assert not session.closed
+        loop.run_until_complete(transport.close())
+        assert session.closed
+
+    def test_session_is_closed_with_event_loop(self):
+        from elasticsearch_metrics import aio
+
+        transport = aio.AsyncTransport(hosts="127.0.0.1:9200")
+        # Like async_to_sync, asyncio.run uses a new event loop for each call
+        sessions = [asyncio.run(transport._get_session()) for _ in range(3)]
+        assert all(session.closed for session in sessions)
+        # Only the session of the last event loop is kept
+        assert len(transport._sessions) == 1
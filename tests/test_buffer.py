@@ -0,0 +1,183 @@
+import threading
+import time
+
+import pytest
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.buffer import MetricBuffer, get_buffer
+from tests.conftest import make_bulk_response, wait_until
+
+
+class BufferedPageView(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "dummyapp"
+
+
+@pytest.fixture()
+def buffer():
+    buffer = MetricBuffer(flush_interval=60)
+    yield buffer
+    buffer.close()
+
+
+@pytest.fixture()
+def blocked_bulk(mock_bulk):
+    """Make bulk requests block until ``release`` is set."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def side_effect(body, *args, **kwargs):
+        started.set()
+        release.wait(2)
+        return make_bulk_response(body)
+
+    mock_bulk.side_effect = side_effect
+    mock_bulk.started = started
+    mock_bulk.release = release
+    yield mock_bulk
+    release.set()
+
+
+def page_ids(mock_bulk):
+    return [
+        line.split('"page_id":"')[1].split('"')[0]
+        for call in mock_bulk.call_args_list
+        for line in call[0][0].strip().split("\n")[1::2]
+    ]
+
+
+class TestMetricBuffer:
+    def test_flush(self, buffer, mock_bulk):
+        buffer.put(BufferedPageView(page_id="a"))
+        buffer.put(BufferedPageView(page_id="b"))
+        assert buffer.depth == 2
+        assert mock_bulk.call_count == 0
+        assert buffer.flush(timeout=2) is True
+        assert mock_bulk.call_count == 1
+        assert buffer.stats() == {
+            "depth": 0,
+            "forwarded": 0,
+            "dropped": 0,
+            "indexed": 2,
+            "failed": 0,
+        }
+
+    def test_flushes_when_flush_size_reached(self, mock_bulk):
+        buffer = MetricBuffer(flush_size=2, flush_interval=60)
+        try:
+            buffer.put(BufferedPageView(page_id="a"))
+            time.sleep(0.05)
+            assert mock_bulk.call_count == 0
+            buffer.put(BufferedPageView(page_id="b"))
+            wait_until(lambda: buffer.indexed == 2)
+            assert mock_bulk.call_count == 1
+        finally:
+            buffer.close()
+
+    def test_flushes_when_flush_interval_elapsed(self, mock_bulk):
+        buffer = MetricBuffer(flush_interval=0.05)
+        try:
+            buffer.put(BufferedPageView(page_id="a"))
+            wait_until(lambda: buffer.indexed == 1)
+            assert mock_bulk.call_count == 1
+        finally:
+            buffer.close()
+
+    def test_counts_failures(self, buffer, mock_bulk):
+        mock_bulk.side_effect = lambda body, *args, **kwargs: make_bulk_response(
+            body, failed_ids=("a",)
+        )
+        buffer.put(BufferedPageView(page_id="a"))
+        buffer.put(BufferedPageView(page_id="b"))
+        buffer.flush(timeout=2)
+        assert buffer.failed == 1
+        assert buffer.indexed == 1
+
+    def test_validates_on_put(self, buffer, mock_bulk):
+        with pytest.raises(Exception):
+            buffer.put(BufferedPageView(timestamp="not a date"))
+        assert buffer.depth == 0
+
+    @pytest.mark.parametrize(
+        ("overflow", "expected_ids"),
+        [("drop_newest", ["a", "b", "c"]), ("drop_oldest", ["a", "c", "d"])],
+    )
+    def test_drop_policies(self, blocked_bulk, overflow, expected_ids):
+        buffer = MetricBuffer(
+            max_size=2, flush_size=1, flush_interval=60, overflow=overflow
+        )
+        try:
+            buffer.put(BufferedPageView(page_id="a"))
+            assert blocked_bulk.started.wait(2)
+            buffer.put(BufferedPageView(page_id="b"))
+            buffer.put(BufferedPageView(page_id="c"))
+            assert buffer.put(BufferedPageView(page_id="d")) is (
+                overflow == "drop_oldest"
+            )
+            assert buffer.dropped == 1
+            assert buffer.depth == 2
+            blocked_bulk.release.set()
+            assert buffer.flush(timeout=2)
+        finally:
+            buffer.close()
+        assert page_ids(blocked_bulk) == expected_ids
+
+    def test_block_policy(self, blocked_bulk):
+        buffer = MetricBuffer(max_size=1, flush_size=1, flush_interval=60)
+        try:
+            buffer.put(BufferedPageView(page_id="a"))
+            assert blocked_bulk.started.wait(2)
+            buffer.put(BufferedPageView(page_id="b"))
+            thread = threading.Thread(
+                target=buffer.put, args=(BufferedPageView(page_id="c"),)
+            )
+            thread.start()
+            thread.join(0.05)
+            assert thread.is_alive()
+            blocked_bulk.release.set()
+            thread.join(2)
+            assert not thread.is_alive()
+            assert buffer.flush(timeout=2)
+        finally:
+            buffer.close()
+        assert buffer.dropped == 0
+        assert page_ids(blocked_bulk) == ["a", "b", "c"]
+
+    def test_invalid_overflow_policy(self):
+        with pytest.raises(ValueError):
+            MetricBuffer(overflow="explode")
+
+    def test_close_sends_queued_metrics(self, mock_bulk):
+        buffer = MetricBuffer(flush_interval=60)
+        buffer.put(BufferedPageView(page_id="a"))
+        buffer.close(timeout=2)
+        assert mock_bulk.call_count == 1
+        assert buffer.put(BufferedPageView(page_id="b")) is False
+        assert buffer.dropped == 1
+
+
+class TestBufferedMode:
+    def test_buffer_disabled_by_default(self):
+        assert get_buffer() is None
+
+    def test_record_puts_metric_in_buffer(self, settings, mock_bulk, mock_save):
+        settings.ELASTICSEARCH_METRICS_BUFFER = {"flush_interval": 60}
+        buffer = get_buffer()
+        assert isinstance(buffer, MetricBuffer)
+        assert buffer.flush_interval == 60
+
+        assert BufferedPageView.record(page_id="a") is not None
+        assert mock_save.call_count == 0
+        assert buffer.depth == 1
+        buffer.flush(timeout=2)
+        assert mock_bulk.call_count == 1
+
+    def test_changing_setting_closes_buffer(self, settings, mock_bulk):
+        settings.ELASTICSEARCH_METRICS_BUFFER = {"flush_interval": 60}
+        buffer = get_buffer()
+        BufferedPageView.record(page_id="a")
+        settings.ELASTICSEARCH_METRICS_BUFFER = {"flush_interval": 30}
+        assert mock_bulk.call_count == 1
+        assert get_buffer() is not buffer
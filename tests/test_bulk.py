@@ -0,0 +1,181 @@
+import json
+import datetime as dt
+
+import mock
+import pytest
+from elasticsearch.exceptions import ConnectionError
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics import signals
+from elasticsearch_metrics.bulk import BulkRecorder, get_current_recorder
+from elasticsearch_metrics.exceptions import BulkRecordError
+from tests.conftest import make_bulk_response
+
+
+class BulkPageView(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "dummyapp"
+
+
+def sent_actions(mock_bulk):
+    """Return the action lines sent in each bulk request."""
+    return [
+        [json.loads(line) for line in call[0][0].strip().split("\n")][::2]
+        for call in mock_bulk.call_args_list
+    ]
+
+
+class TestRecordMany:
+    def test_sends_one_request(self, mock_bulk, mock_save):
+        timestamp = dt.datetime(2020, 2, 14)
+        instances = BulkPageView.record_many(
+            {"timestamp": timestamp, "page_id": str(i)} for i in range(3)
+        )
+        assert mock_bulk.call_count == 1
+        assert mock_save.call_count == 0
+        assert len(instances) == 3
+        assert [each.page_id for each in instances] == ["0", "1", "2"]
+        assert instances[0].meta.id == "0"
+        actions = sent_actions(mock_bulk)[0]
+        assert actions[0] == {
+            "index": {"_index": "dummyapp_bulkpageview_2020.02.14", "_type": "doc"}
+        }
+
+    def test_sends_indices_in_one_request(self, mock_bulk):
+        BulkPageView.record_many(
+            [
+                {"timestamp": dt.datetime(2020, 2, 14), "page_id": "a"},
+                {"timestamp": dt.datetime(2020, 2, 15), "page_id": "b"},
+                {"timestamp": dt.datetime(2020, 2, 14), "page_id": "c"},
+            ]
+        )
+        assert mock_bulk.call_count == 1
+        (actions,) = sent_actions(mock_bulk)
+        assert [a["index"]["_index"] for a in actions] == [
+            "dummyapp_bulkpageview_2020.02.14",
+            "dummyapp_bulkpageview_2020.02.15",
+            "dummyapp_bulkpageview_2020.02.14",
+        ]
+
+    def test_sends_chunks(self, mock_bulk):
+        timestamp = dt.datetime(2020, 2, 14)
+        BulkPageView.record_many(
+            ({"timestamp": timestamp, "page_id": str(i)} for i in range(5)),
+            chunk_size=2,
+        )
+        assert [len(actions) for actions in sent_actions(mock_bulk)] == [2, 2, 1]
+
+    def test_defaults_timestamp_to_now(self, mock_bulk):
+        (instance,) = BulkPageView.record_many([{"page_id": "a"}])
+        assert instance.timestamp is not None
+
+    def test_raises_error_with_failed_items(self, mock_bulk):
+        mock_bulk.side_effect = lambda body, *args, **kwargs: make_bulk_response(
+            body, failed_ids=("b",)
+        )
+        with pytest.raises(BulkRecordError) as excinfo:
+            BulkPageView.record_many([{"page_id": "a"}, {"page_id": "b"}])
+        errors = excinfo.value.errors
+        assert len(errors) == 1
+        instance, info = errors[0]
+        assert instance.page_id == "b"
+        assert info["status"] == 400
+
+    def test_connection_errors_are_reported_per_item(self, mock_bulk):
+        mock_bulk.side_effect = ConnectionError("N/A", "Connection refused", None)
+        with pytest.raises(BulkRecordError) as excinfo:
+            BulkPageView.record_many([{"page_id": "a"}, {"page_id": "b"}])
+        assert len(excinfo.value.errors) == 2
+
+
+class TestBulkRecorder:
+    def test_collects_saves_in_context(self, mock_bulk, mock_save):
+        with BulkRecorder() as recorder:
+            assert get_current_recorder() is recorder
+            BulkPageView.record(page_id="a")
+            BulkPageView(page_id="b").save()
+            assert len(recorder) == 2
+            assert mock_bulk.call_count == 0
+        assert get_current_recorder() is None
+        assert mock_bulk.call_count == 1
+        assert mock_save.call_count == 0
+
+    def test_saves_with_kwargs_are_sent_immediately(self, mock_bulk, mock_save):
+        with BulkRecorder() as recorder:
+            BulkPageView(page_id="a").save(refresh=True)
+            assert len(recorder) == 0
+        assert mock_save.call_count == 1
+
+    def test_nested_recorders(self, mock_bulk):
+        with BulkRecorder() as outer:
+            with BulkRecorder() as inner:
+                BulkPageView.record(page_id="a")
+                assert len(inner) == 1
+                assert len(outer) == 0
+            assert get_current_recorder() is outer
+
+    def test_does_not_raise_on_exit_when_exception_raised(self, mock_bulk):
+        mock_bulk.side_effect = lambda body, *args, **kwargs: make_bulk_response(
+            body, failed_ids=("a",)
+        )
+        with pytest.raises(ValueError):
+            with BulkRecorder() as recorder:
+                BulkPageView.record(page_id="a")
+                raise ValueError()
+        assert len(recorder.errors) == 1
+
+    def test_raise_on_error_false(self, mock_bulk):
+        mock_bulk.side_effect = lambda body, *args, **kwargs: make_bulk_response(
+            body, failed_ids=("a",)
+        )
+        recorder = BulkRecorder(raise_on_error=False)
+        recorder.record(BulkPageView, page_id="a")
+        recorder.record(BulkPageView, page_id="b")
+        errors = recorder.flush()
+        assert len(errors) == 1
+        assert errors[0][0].page_id == "a"
+
+    def test_validates_documents(self, mock_bulk):
+        recorder = BulkRecorder()
+        with pytest.raises(Exception):
+            recorder.add(BulkPageView(timestamp="not a date"))
+        assert len(recorder) == 0
+
+    def test_sends_signals(self, mock_bulk):
+        mock_pre_save_listener = mock.Mock()
+        mock_post_save_listener = mock.Mock()
+        signals.pre_save.connect(mock_pre_save_listener, sender=BulkPageView)
+        signals.post_save.connect(mock_post_save_listener, sender=BulkPageView)
+        try:
+            recorder = BulkRecorder()
+            recorder.record(
+                BulkPageView, timestamp=dt.datetime(2020, 2, 14), page_id="a"
+            )
+            assert mock_pre_save_listener.call_count == 1
+            assert mock_post_save_listener.call_count == 0
+            recorder.flush()
+            assert mock_post_save_listener.call_count == 1
+        finally:
+            signals.pre_save.disconnect(mock_pre_save_listener, sender=BulkPageView)
+            signals.post_save.disconnect(mock_post_save_listener, sender=BulkPageView)
+
+        post_save_kwargs = mock_post_save_listener.call_args[1]
+        assert isinstance(post_save_kwargs["instance"], BulkPageView)
+        assert post_save_kwargs["index"] == "dummyapp_bulkpageview_2020.02.14"
+        assert post_save_kwargs["using"] == "default"
+
+    def test_post_save_not_sent_for_failed_items(self, mock_bulk):
+        mock_bulk.side_effect = lambda body, *args, **kwargs: make_bulk_response(
+            body, failed_ids=("a",)
+        )
+        mock_post_save_listener = mock.Mock()
+        signals.post_save.connect(mock_post_save_listener, sender=BulkPageView)
+        try:
+            recorder = BulkRecorder(raise_on_error=False)
+            recorder.record(BulkPageView, page_id="a")
+            recorder.flush()
+        finally:
+            signals.post_save.disconnect(mock_post_save_listener, sender=BulkPageView)
+        assert mock_post_save_listener.call_count == 0
@@ -0,0 +1,160 @@
+import datetime as dt
+
+import pytest
+from elasticsearch_dsl import Document, InnerDoc
+from elasticsearch_dsl.exceptions import ValidationException
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.codec import FlatCodec
+
+
+class FlatMetric(metrics.Metric):
+    page_id = metrics.Keyword(required=True)
+    duration = metrics.Integer()
+    ratio = metrics.Float()
+    tags = metrics.Keyword(multi=True)
+    is_bot = metrics.Boolean()
+    ip = metrics.Ip()
+
+    class Meta:
+        app_label = "codecapp"
+
+
+class Location(InnerDoc):
+    country = metrics.Keyword()
+
+
+class NestedMetric(metrics.Metric):
+    location = metrics.Object(Location)
+
+    class Meta:
+        app_label = "codecapp"
+
+
+class PageIdField(metrics.Keyword):
+    def clean(self, data):
+        data = super(PageIdField, self).clean(data)
+        if data is not None and not data.startswith("page-"):
+            raise ValidationException("Invalid page id.")
+        return data
+
+
+class UpperKeyword(metrics.Keyword):
+    def serialize(self, data):
+        return data.upper() if isinstance(data, str) else data
+
+
+class CustomFieldMetric(metrics.Metric):
+    page_id = PageIdField()
+    source = UpperKeyword()
+
+    class Meta:
+        app_label = "codecapp"
+
+
+class SubclassedFieldMetric(metrics.Metric):
+    # Subclasses that don't override the replaced methods are compiled
+    page_id = type("SubclassedKeyword", (metrics.Keyword,), {})()
+    duration = metrics.Integer()
+
+    class Meta:
+        app_label = "codecapp"
+
+
+def generic_to_dict(metric, **kwargs):
+    return Document.to_dict(metric, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"page_id": "a", "duration": 3, "ratio": 0.5, "is_bot": False},
+        {"page_id": "a", "tags": ("x", "y"), "ip": "127.0.0.1"},
+        {"page_id": "a", "tags": [], "duration": None, "extra": {"b": 1}},
+        {"page_id": "a", "duration": 0, "timestamp": dt.datetime(2020, 1, 1)},
+    ],
+)
+def test_to_dict_matches_document(values):
+    metric = FlatMetric(**values)
+    assert metric.to_dict() == generic_to_dict(metric)
+    assert metric.to_dict(skip_empty=False) == generic_to_dict(metric, skip_empty=False)
+
+
+def test_metrics_with_object_fields_are_not_compiled():
+    assert FlatMetric._codec is not None
+    assert NestedMetric._codec is None
+    metric = NestedMetric(location={"country": "DE"})
+    assert metric.to_dict() == {"location": {"country": "DE"}}
+
+
+def test_metrics_with_custom_fields_are_not_compiled(mock_save):
+    assert CustomFieldMetric._codec is None
+    assert SubclassedFieldMetric._codec is not None
+    metric = CustomFieldMetric(page_id="page-1", source="web")
+    assert metric.to_dict() == generic_to_dict(metric)
+    with pytest.raises(ValidationException):
+        CustomFieldMetric(page_id="1").save()
+    with pytest.raises(ValidationException):
+        CustomFieldMetric.record(page_id="1", validate="fast")
+    assert mock_save.call_count == 0
+    CustomFieldMetric(page_id="page-1").save()
+    assert mock_save.call_count == 1
+
+
+def test_full_clean_matches_document():
+    values = {
+        "page_id": "a",
+        "duration": "3",
+        "ratio": "0.5",
+        "tags": ("x",),
+        "is_bot": "false",
+        "timestamp": "2020-01-01T00:00:00",
+    }
+    metric = FlatMetric(**values)
+    metric.full_clean()
+    expected = FlatMetric(**values)
+    Document.clean_fields(expected)
+    assert metric._d_ == expected._d_
+    assert metric.duration == 3
+    assert metric.timestamp == dt.datetime(2020, 1, 1)
+
+
+def test_full_clean_reports_errors():
+    metric = FlatMetric(duration=3, timestamp="not a date")
+    with pytest.raises(ValidationException) as excinfo:
+        metric.full_clean()
+    errors = excinfo.value.args[0]
+    assert set(errors) == {"page_id", "timestamp"}
+
+
+def test_fast_validation_only_checks_required_fields():
+    metric = FlatMetric(page_id="a", duration="3", timestamp=dt.datetime(2020, 1, 1))
+    metric.full_clean(fast=True)
+    assert metric.duration == "3"
+    with pytest.raises(ValidationException):
+        FlatMetric(timestamp=dt.datetime(2020, 1, 1)).full_clean(fast=True)
+
+
+def test_save_with_fast_validation(mock_save):
+    metric = FlatMetric.record(
+        page_id="a", duration="3", timestamp=dt.datetime(2020, 1, 1), validate="fast"
+    )
+    assert mock_save.call_count == 1
+    assert mock_save.call_args[1]["validate"] is False
+    assert metric.duration == "3"
+    with pytest.raises(ValidationException):
+        FlatMetric.record(timestamp=dt.datetime(2020, 1, 1), validate="fast")
+
+
+def test_record_many_with_fast_validation(mock_bulk):
+    instances = FlatMetric.record_many(
+        [{"page_id": "a", "duration": "3"}], validate="fast"
+    )
+    assert instances[0].duration == "3"
+
+
+def test_compile():
+    codec = FlatCodec.compile(FlatMetric._doc_type.mapping)
+    assert set(codec.serializers) == {"duration", "ratio", "is_bot", "ip", "timestamp"}
+    required = {name for name, _, required in codec.validators if required}
+    assert required == {"timestamp", "page_id"}
@@ -0,0 +1,191 @@
+import datetime as dt
+import threading
+import time
+
+import pytest
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.counters import CounterAccumulator, get_accumulator
+
+
+class FileDownloads(metrics.CounterMetric):
+    file_id = metrics.Keyword()
+    tags = metrics.Keyword(multi=True)
+
+    class Meta:
+        app_label = "countersapp"
+        write_using = "ingest"
+
+
+class HourlyFileDownloads(FileDownloads):
+    class Meta:
+        app_label = "countersapp"
+        bucket_interval = dt.timedelta(hours=1)
+
+
+@pytest.fixture()
+def accumulator():
+    accumulator = CounterAccumulator(flush_interval=60)
+    yield accumulator
+    accumulator.close()
+
+
+def get_documents(cluster):
+    return sorted(
+        (
+            source
+            for documents in cluster.indices.values()
+            for source in documents.values()
+        ),
+        key=lambda source: (source["timestamp"], source.get("file_id")),
+    )
+
+
+def test_bucket_interval():
+    assert FileDownloads._bucket_interval == dt.timedelta(minutes=1)
+    assert HourlyFileDownloads._bucket_interval == dt.timedelta(hours=1)
+    timestamp = dt.datetime(2020, 2, 14, 12, 30, 15, tzinfo=dt.timezone.utc)
+    assert FileDownloads.get_bucket(timestamp) == timestamp.replace(second=0)
+    assert HourlyFileDownloads.get_bucket(timestamp) == timestamp.replace(
+        minute=0, second=0
+    )
+    # Naive timestamps are in UTC
+    assert FileDownloads.get_bucket(
+        timestamp.replace(tzinfo=None)
+    ) == timestamp.replace(second=0)
+
+
+@pytest.mark.parametrize("invalid_interval", [0, -60])
+def test_invalid_bucket_interval(invalid_interval):
+    with pytest.raises(ValueError, match="Invalid bucket_interval"):
+
+        class InvalidCounter(metrics.CounterMetric):
+            class Meta:
+                app_label = "countersapp"
+                bucket_interval = invalid_interval
+
+
+def test_invalid_dimension():
+    with pytest.raises(ValueError, match="not a dimension field"):
+        FileDownloads.increment(user_id=42)
+    with pytest.raises(ValueError, match="not a dimension field"):
+        FileDownloads.increment(count=42)
+
+
+def test_flush_saves_one_document_per_key(cluster, accumulator):
+    timestamp = dt.datetime(2020, 2, 14, 12, 30, 15, tzinfo=dt.timezone.utc)
+    for seconds, file_id, value in [(0, "a", 10), (5, "a", 20), (10, "b", 5)]:
+        accumulator.add(
+            FileDownloads,
+            {"file_id": file_id},
+            value=value,
+            timestamp=timestamp + dt.timedelta(seconds=seconds),
+        )
+    accumulator.add(
+        FileDownloads, {"file_id": "a"}, timestamp=timestamp + dt.timedelta(minutes=1)
+    )
+    assert len(accumulator) == 3
+    assert accumulator.flush() == 0
+    assert len(accumulator) == 0
+    assert accumulator.stats()["indexed"] == 3
+    assert get_documents(cluster) == [
+        {
+            "timestamp": "2020-02-14T12:30:00+00:00",
+            "file_id": "a",
+            "count": 2,
+            "sum": 30,
+        },
+        {
+            "timestamp": "2020-02-14T12:30:00+00:00",
+            "file_id": "b",
+            "count": 1,
+            "sum": 5,
+        },
+        {
+            "timestamp": "2020-02-14T12:31:00+00:00",
+            "file_id": "a",
+            "count": 1,
+            "sum": 1,
+        },
+    ]
+    assert set(cluster.indices) == {FileDownloads.get_index_name(timestamp)}
+
+
+def test_multi_valued_dimensions(cluster, accumulator):
+    accumulator.add(FileDownloads, {"tags": ["x", "y"]})
+    accumulator.add(FileDownloads, {"tags": ["x", "y"]})
+    accumulator.flush()
+    (document,) = get_documents(cluster)
+    assert document["tags"] == ["x", "y"]
+    assert document["count"] == 2
+
+
+def test_max_keys_triggers_flush(cluster):
+    accumulator = CounterAccumulator(flush_interval=60, max_keys=2)
+    accumulator.add(FileDownloads, {"file_id": "a"})
+    accumulator.add(FileDownloads, {"file_id": "b"})
+    accumulator.close(timeout=5)
+    assert len(get_documents(cluster)) == 2
+    assert not accumulator._thread.is_alive()
+
+
+def test_ended_buckets_are_flushed_periodically(cluster):
+    accumulator = CounterAccumulator(flush_interval=0.01)
+    past = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=5)
+    accumulator.add(FileDownloads, {"file_id": "old"}, timestamp=past)
+    accumulator.add(HourlyFileDownloads, {"file_id": "current"})
+    deadline = time.monotonic() + 5
+    while not get_documents(cluster) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        assert [document["file_id"] for document in get_documents(cluster)] == ["old"]
+    finally:
+        accumulator.close(timeout=5)
+    assert len(get_documents(cluster)) == 2
+
+
+def test_request_flush(cluster, accumulator):
+    accumulator.add(FileDownloads, {"file_id": "a"})
+    assert accumulator.request_flush(timeout=5) is True
+    assert len(accumulator) == 0
+    assert len(get_documents(cluster)) == 1
+
+
+def test_request_flush_timeout(cluster, accumulator):
+    sending = threading.Event()
+    release = threading.Event()
+    send = accumulator._send
+
+    def slow_send(totals):
+        if totals:
+            sending.set()
+            release.wait(5)
+        return send(totals)
+
+    accumulator._send = slow_send
+    accumulator.add(FileDownloads, {"file_id": "a"})
+    try:
+        assert accumulator.request_flush(timeout=0.05) is False
+        assert sending.is_set()
+    finally:
+        release.set()
+    assert accumulator.request_flush(timeout=5) is True
+    assert len(get_documents(cluster)) == 1
+
+
+def test_closed_accumulator_drops_increments(accumulator):
+    accumulator.close()
+    assert accumulator.add(FileDownloads, {"file_id": "a"}) is False
+    assert accumulator.stats()["dropped"] == 1
+
+
+def test_increment_uses_configured_accumulator(cluster, settings):
+    settings.ELASTICSEARCH_METRICS_COUNTERS = {"flush_interval": 60}
+    accumulator = get_accumulator()
+    assert accumulator.flush_interval == 60
+    assert FileDownloads.increment(file_id="a") is True
+    assert FileDownloads.increment(value=3, file_id="a") is True
+    assert len(accumulator) == 1
+    accumulator.flush()
+    (document,) = get_documents(cluster)
+    assert (document["count"], document["sum"]) == (2, 4)
@@ -1,7 +1,44 @@
 import pytest
 from dateutil import tz
 
-from elasticsearch_metrics import metrics
+from elasticsearch_dsl import field as edsl_field
+
+from elasticsearch_metrics import field, metrics
+
+
+class TestFieldExports:
+    def test_fields_are_exported(self):
+        assert metrics.Keyword is edsl_field.Keyword
+        assert field.Integer is edsl_field.Integer
+        assert field.Field is edsl_field.Field
+        assert metrics.Date is field.Date
+
+    def test_from_import(self):
+        from elasticsearch_metrics.metrics import Keyword
+
+        assert Keyword is edsl_field.Keyword
+
+    def test_all(self):
+        namespace = {}
+        exec("from elasticsearch_metrics.field import *", namespace)
+        assert namespace["Date"] is field.Date
+        assert namespace["Keyword"] is edsl_field.Keyword
+        assert "settings" not in namespace
+        assert "Keyword" in dir(field)
+
+        namespace = {}
+        exec("from elasticsearch_metrics.metrics import *", namespace)
+        assert namespace["Keyword"] is edsl_field.Keyword
+        assert namespace["Integer"] is edsl_field.Integer
+        assert namespace["Date"] is field.Date
+        assert namespace["Metric"] is metrics.Metric
+        assert "Keyword" in dir(metrics)
+
+    def test_unknown_attribute(self):
+        with pytest.raises(AttributeError):
+            metrics.NotAField
+        with pytest.raises(AttributeError):
+            metrics.edsl_field
 
 
 class TestDate:
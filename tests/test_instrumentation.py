@@ -0,0 +1,158 @@
+from collections import defaultdict
+
+import mock
+import pytest
+from elasticsearch.exceptions import ConnectionError
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.exceptions import IndexTemplateNotFoundError
+from elasticsearch_metrics.instrumentation import (
+    Instrumentation,
+    PrometheusInstrumentation,
+    StatsdInstrumentation,
+    get_instrumentation,
+    timer,
+)
+from tests.conftest import make_bulk_response
+
+
+class InstrumentedMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "instrumentationapp"
+        write_using = "ingest"
+
+
+TAGS = {"metric": "instrumentationapp_instrumentedmetric"}
+
+
+class RecordingInstrumentation(Instrumentation):
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(list)
+
+    def increment(self, name, value=1, tags=None):
+        self.counters[name, tuple(sorted((tags or {}).items()))] += value
+
+    def timing(self, name, seconds, tags=None):
+        self.timings[name, tuple(sorted((tags or {}).items()))].append(seconds)
+
+    def get_counter(self, name, tags=TAGS):
+        return self.counters[name, tuple(sorted(tags.items()))]
+
+    def get_timings(self, name, tags=TAGS):
+        return self.timings[name, tuple(sorted(tags.items()))]
+
+
+@pytest.fixture()
+def recording(settings):
+    instrumentation = RecordingInstrumentation()
+    settings.ELASTICSEARCH_METRICS_INSTRUMENTATION = instrumentation
+    return instrumentation
+
+
+def test_disabled_by_default():
+    assert get_instrumentation() is None
+    with timer("save", metric="foo") as t:
+        pass
+    assert not isinstance(t, Instrumentation)
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        "statsd",
+        {"backend": "statsd", "host": "localhost", "prefix": "myapp"},
+        "elasticsearch_metrics.instrumentation.StatsdInstrumentation",
+    ],
+)
+def test_configure_backend(settings, config):
+    pytest.importorskip("statsd")
+    settings.ELASTICSEARCH_METRICS_INSTRUMENTATION = config
+    assert isinstance(get_instrumentation(), StatsdInstrumentation)
+
+
+def test_save(cluster, recording):
+    InstrumentedMetric(page_id="a").save()
+    for name in ("save", "save.validate", "save.request"):
+        assert len(recording.get_timings(name)) == 1
+    assert recording.get_counter("save.documents") == 1
+    assert not recording.get_counter("save.errors")
+
+
+def test_save_error(recording, mock_save):
+    mock_save.side_effect = ConnectionError("N/A", "Unavailable", None)
+    with pytest.raises(ConnectionError):
+        InstrumentedMetric(page_id="a").save()
+    assert recording.get_counter("save.request.errors") == 1
+    assert recording.get_counter("save.errors") == 1
+    assert not recording.get_counter("save.documents")
+
+
+def test_record(cluster, recording):
+    InstrumentedMetric.record(page_id="a")
+    assert len(recording.get_timings("record")) == 1
+    assert len(recording.get_timings("save")) == 1
+    with mock.patch("elasticsearch_metrics.metrics.random.random", return_value=0.9):
+        assert InstrumentedMetric.record(page_id="a", sample_rate=0.5) is None
+    assert recording.get_counter("record.dropped") == 1
+
+
+def test_bulk(cluster, recording):
+    InstrumentedMetric.record_many({"page_id": str(i)} for i in range(3))
+    assert len(cluster.indices[InstrumentedMetric.get_index_name()]) == 3
+    assert len(recording.get_timings("bulk.flush")) == 1
+    assert len(recording.get_timings("bulk.serialize")) == 1
+    assert recording.get_counter("bulk.documents") == 3
+    assert recording.get_counter("bulk.bytes") > 0
+    assert not recording.get_counter("bulk.errors")
+
+
+def test_bulk_errors(recording, mock_bulk):
+    mock_bulk.side_effect = lambda body, *args, **kwargs: make_bulk_response(
+        body, failed_ids=("b",)
+    )
+    InstrumentedMetric.record_many(
+        [{"page_id": "a"}, {"page_id": "b"}], using="default", raise_on_error=False
+    )
+    assert recording.get_counter("bulk.documents") == 1
+    assert recording.get_counter("bulk.errors") == 1
+
+
+def test_index_templates(cluster, recording):
+    with pytest.raises(IndexTemplateNotFoundError):
+        InstrumentedMetric.check_index_template()
+    assert recording.get_counter("check_index_template.errors") == 1
+    InstrumentedMetric.sync_index_template()
+    assert InstrumentedMetric.check_index_template() is True
+    assert len(recording.get_timings("sync_index_template")) == 1
+    assert len(recording.get_timings("check_index_template")) == 2
+
+
+def test_statsd():
+    client = mock.Mock()
+    instrumentation = StatsdInstrumentation(client=client)
+    instrumentation.increment("bulk.documents", 3, TAGS)
+    client.incr.assert_called_once_with(
+        "bulk.documents.instrumentationapp_instrumentedmetric", 3
+    )
+    instrumentation.timing("save", 0.25)
+    client.timing.assert_called_once_with("save", 250)
+
+
+def test_prometheus():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    instrumentation = PrometheusInstrumentation(registry=registry)
+    instrumentation.increment("bulk.documents", 3, TAGS)
+    instrumentation.increment("bulk.documents", 2, TAGS)
+    instrumentation.timing("save", 0.25, TAGS)
+    assert (
+        registry.get_sample_value("elasticsearch_metrics_bulk_documents_total", TAGS)
+        == 5
+    )
+    assert (
+        registry.get_sample_value("elasticsearch_metrics_save_seconds_sum", TAGS)
+        == 0.25
+    )
@@ -3,26 +3,65 @@ import mock
 
 from elasticsearch_metrics import exceptions
 from elasticsearch_metrics.management.commands.check_metrics import Command
+from elasticsearch_metrics.metrics import get_index_templates
 from elasticsearch_metrics.registry import registry
+from tests.dummyapp.metrics import DummyMetric, DummyMetricWithExplicitTemplateName
 
 
 @pytest.fixture()
-def mock_check_index_template():
+def mock_get_template(client):
+    with mock.patch.object(client.indices, "get_template") as patch:
+        patch.return_value = {}
+        yield patch
+
+
+@pytest.fixture()
+def mock_compare_index_template():
     with mock.patch(
-        "elasticsearch_metrics.metrics.Metric.check_index_template"
+        "elasticsearch_metrics.metrics.Metric.compare_index_template"
     ) as patch:
         yield patch
 
 
-def test_exits_with_error_if_out_of_sync(run_mgmt_command, mock_check_index_template):
-    mock_check_index_template.side_effect = exceptions.IndexTemplateNotFoundError(
+def test_exits_with_error_if_out_of_sync(
+    run_mgmt_command, mock_get_template, mock_compare_index_template
+):
+    mock_compare_index_template.side_effect = exceptions.IndexTemplateNotFoundError(
         "Index template does not exist", client_error=None
     )
     with pytest.raises(SystemExit):
         run_mgmt_command(Command, ["check_metrics"])
 
 
-def test_exits_with_success(run_mgmt_command, mock_check_index_template):
-    mock_check_index_template.return_value = True
+def test_exits_with_success(
+    run_mgmt_command, mock_get_template, mock_compare_index_template
+):
+    mock_compare_index_template.return_value = True
     run_mgmt_command(Command, ["check_metrics"])
-    assert mock_check_index_template.call_count == len(registry.get_metrics())
+    assert mock_compare_index_template.call_count == len(registry.get_metrics())
+
+
+def test_fetches_templates_in_one_request(
+    run_mgmt_command, mock_get_template, mock_compare_index_template
+):
+    run_mgmt_command(Command, ["check_metrics"])
+    assert mock_get_template.call_count == 1
+
+
+def test_get_index_templates(mock_get_template):
+    template = {"index_patterns": ["dummyapp_dummymetric_*"]}
+    mock_get_template.return_value = {"dummyapp_dummymetric": template}
+    templates = get_index_templates([DummyMetric, DummyMetricWithExplicitTemplateName])
+    assert mock_get_template.call_args[1] == {
+        "name": "dummyapp_dummymetric,dummymetric"
+    }
+    assert templates == {
+        DummyMetric: template,
+        DummyMetricWithExplicitTemplateName: None,
+    }
+
+
+def test_get_index_templates_fetches_all_templates_for_long_lists(mock_get_template):
+    with mock.patch("elasticsearch_metrics.metrics.MAX_TEMPLATE_NAMES_LENGTH", 10):
+        get_index_templates([DummyMetric, DummyMetricWithExplicitTemplateName])
+    assert mock_get_template.call_args == mock.call()
@@ -0,0 +1,162 @@
+import csv
+import datetime as dt
+import gzip
+import json
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.management.commands.export_metrics import Command
+
+
+class ExportedPageView(metrics.Metric):
+    page_id = metrics.Keyword()
+    user = metrics.Object(properties={"id": metrics.Integer()})
+    tags = metrics.Keyword(multi=True)
+
+    class Meta:
+        app_label = "exportapp"
+        read_using = "ingest"
+        write_using = "ingest"
+
+
+class SourcePageView(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "exportapp"
+        read_using = "ingest"
+        write_using = "ingest"
+        source = metrics.MetaField(enabled=True)
+
+
+class CommentView(metrics.Metric):
+    comment = metrics.Text()
+
+    class Meta:
+        app_label = "exportapp"
+        read_using = "ingest"
+        write_using = "ingest"
+
+
+@pytest.fixture()
+def cluster(cluster):
+    # Indices created from the template don't store _source
+    ExportedPageView.sync_index_template()
+    for day, page_id in [(3, "c"), (1, "a"), (2, "b"), (2, "d")]:
+        ExportedPageView(
+            page_id=page_id,
+            timestamp=dt.datetime(2020, 1, day, 12, tzinfo=dt.timezone.utc),
+            user={"id": day},
+            tags=["x", "y"] if page_id == "a" else [],
+        ).save()
+    return cluster
+
+
+def read_ndjson(data):
+    # Metrics are exported in index order
+    documents = [json.loads(line) for line in data.strip().split("\n")]
+    return sorted(documents, key=lambda doc: (doc["timestamp"], doc["page_id"]))
+
+
+def test_requires_existing_metric():
+    with pytest.raises(CommandError):
+        call_command(Command(), "exportapp.Missing")
+
+
+def test_export_ndjson(run_mgmt_command, cluster):
+    out, err = run_mgmt_command(
+        Command, ["export_metrics", "exportapp.ExportedPageView", "--page-size", "2"]
+    )
+    documents = read_ndjson(out)
+    assert [doc["page_id"] for doc in documents] == ["a", "b", "d", "c"]
+    assert documents[0] == {
+        "timestamp": "2020-01-01T12:00:00+00:00",
+        "page_id": "a",
+        "user": {"id": 1},
+        "tags": ["x", "y"],
+    }
+    assert "Exported 4 metric(s)." in err
+    assert cluster.scrolls == {}
+
+
+def test_export_source(run_mgmt_command, cluster):
+    SourcePageView.sync_index_template()
+    SourcePageView.record(page_id="a")
+    out, err = run_mgmt_command(Command, ["export_metrics", "exportapp.SourcePageView"])
+    [document] = read_ndjson(out)
+    assert document["page_id"] == "a"
+
+
+def test_field_without_doc_values(cluster):
+    with pytest.raises(CommandError) as excinfo:
+        call_command(Command(), "exportapp.CommentView")
+    assert "Can't export field 'comment' of CommentView" in str(excinfo.value)
+
+
+def test_export_date_range_and_query(run_mgmt_command, cluster):
+    out, err = run_mgmt_command(
+        Command,
+        [
+            "export_metrics",
+            "exportapp.exportedpageview",
+            "--start",
+            "2020-01-02",
+            "--end",
+            "2020-01-03",
+            "--query",
+            '{"terms": {"page_id": ["b", "c"]}}',
+        ],
+    )
+    assert [doc["page_id"] for doc in read_ndjson(out)] == ["b", "c"]
+    out, err = run_mgmt_command(
+        Command,
+        ["export_metrics", "exportapp.ExportedPageView", "--end", "2020-01-01"],
+    )
+    assert [doc["page_id"] for doc in read_ndjson(out)] == ["a"]
+
+
+def test_export_csv(run_mgmt_command, cluster, tmp_path):
+    output = str(tmp_path / "pageviews.csv")
+    out, err = run_mgmt_command(
+        Command,
+        [
+            "export_metrics",
+            "exportapp.ExportedPageView",
+            "--format",
+            "csv",
+            "--output",
+            output,
+        ],
+    )
+    assert "Exported 4 metric(s) to {}.".format(output) in out
+    with open(output, newline="") as fp:
+        header, *rows = csv.reader(fp)
+    rows.sort()
+    assert header == ["timestamp", "page_id", "user", "tags"]
+    assert rows[0] == ["2020-01-01T12:00:00+00:00", "a", '{"id":1}', '["x","y"]']
+    assert len(rows) == 4
+
+
+def test_export_gzip(run_mgmt_command, cluster, tmp_path):
+    output = str(tmp_path / "pageviews.ndjson.gz")
+    run_mgmt_command(
+        Command, ["export_metrics", "exportapp.ExportedPageView", "-o", output]
+    )
+    with gzip.open(output, "rt") as fp:
+        assert len(read_ndjson(fp.read())) == 4
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--start", "yesterday"],
+        ["--query", "[1, 2]"],
+        ["--gzip"],
+    ],
+)
+def test_invalid_arguments(argv):
+    with pytest.raises(CommandError):
+        call_command(Command(), "exportapp.ExportedPageView", *argv)
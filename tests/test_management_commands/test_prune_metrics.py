@@ -0,0 +1,83 @@
+import datetime as dt
+
+import mock
+import pytest
+from django.utils import timezone
+from elasticsearch.exceptions import TransportError
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.management.commands.prune_metrics import Command
+
+
+class PrunedMetric(metrics.Metric):
+    class Meta:
+        app_label = "prunedapp"
+        retention = 30
+
+
+def index_names(days_ago):
+    today = timezone.now().date()
+    return [
+        PrunedMetric.get_index_name(today - dt.timedelta(days=days))
+        for days in days_ago
+    ]
+
+
+@pytest.fixture()
+def mock_cat_indices(client):
+    with mock.patch.object(client.cat, "indices") as patch:
+        names = index_names([0, 1, 29, 31, 32, 100])
+        patch.return_value = [{"index": name} for name in names]
+        yield patch
+
+
+@pytest.fixture()
+def mock_delete(client):
+    with mock.patch.object(client.indices, "delete") as patch:
+        yield patch
+
+
+def test_deletes_expired_indices(run_mgmt_command, mock_cat_indices, mock_delete):
+    out, err = run_mgmt_command(Command, ["prune_metrics", "prunedapp"])
+    assert mock_delete.call_count == 1
+    assert mock_delete.call_args[1]["index"] == ",".join(index_names([100, 32, 31]))
+    assert "Deleted 3 index(es)." in out
+
+
+def test_dry_run(run_mgmt_command, mock_cat_indices, mock_delete):
+    out, err = run_mgmt_command(Command, ["prune_metrics", "prunedapp", "--dry-run"])
+    assert mock_delete.call_count == 0
+    for name in index_names([100, 32, 31]):
+        assert name in out
+
+
+def test_batch_size(run_mgmt_command, mock_cat_indices, mock_delete):
+    run_mgmt_command(Command, ["prune_metrics", "prunedapp", "--batch-size", "2"])
+    assert [call[1]["index"] for call in mock_delete.call_args_list] == [
+        ",".join(index_names([100, 32])),
+        index_names([31])[0],
+    ]
+
+
+def test_max_indices(run_mgmt_command, mock_cat_indices, mock_delete):
+    out, err = run_mgmt_command(
+        Command, ["prune_metrics", "prunedapp", "--max-indices", "2"]
+    )
+    assert mock_delete.call_args[1]["index"] == ",".join(index_names([100, 32]))
+    assert "Deleted 2 index(es)." in out
+
+
+def test_exits_with_error_if_delete_fails(
+    run_mgmt_command, mock_cat_indices, mock_delete
+):
+    mock_delete.side_effect = TransportError(500, "error")
+    with pytest.raises(SystemExit):
+        run_mgmt_command(Command, ["prune_metrics", "prunedapp"])
+
+
+def test_skips_metrics_without_retention(
+    run_mgmt_command, mock_cat_indices, mock_delete
+):
+    out, err = run_mgmt_command(Command, ["prune_metrics", "dummyapp"])
+    assert mock_cat_indices.call_count == 0
+    assert mock_delete.call_count == 0
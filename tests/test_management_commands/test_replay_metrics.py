@@ -0,0 +1,57 @@
+import pytest
+from django.core.management.base import CommandError
+from elasticsearch.exceptions import ConnectionError
+
+from elasticsearch_metrics.management.commands.replay_metrics import Command
+from elasticsearch_metrics.spool import get_spool
+from tests.conftest import make_bulk_response
+
+
+def make_action(page_id):
+    return {"_index": "myindex", "_type": "doc", "_source": {"page_id": page_id}}
+
+
+@pytest.fixture()
+def spool(settings, tmp_path):
+    settings.ELASTICSEARCH_METRICS_SPOOL = {"path": str(tmp_path)}
+    spool = get_spool()
+    for page_id in ("a", "b", "c"):
+        spool.write("default", make_action(page_id))
+    spool.close()
+    return spool
+
+
+def test_requires_spool():
+    with pytest.raises(CommandError):
+        Command().handle(connection=None, include_stale=False)
+
+
+def test_replays_metrics(run_mgmt_command, spool, mock_bulk):
+    out, err = run_mgmt_command(Command, ["replay_metrics", "--chunk-size", "2"])
+    assert mock_bulk.call_count == 2
+    assert "3 indexed, 0 requeued, 0 failed" in out
+    assert spool.segments() == []
+
+
+def test_reports_failed_metrics(run_mgmt_command, spool, mock_bulk):
+    mock_bulk.side_effect = lambda body, *args, **kwargs: make_bulk_response(
+        body, failed_ids=("b",)
+    )
+    with pytest.raises(SystemExit):
+        run_mgmt_command(Command, ["replay_metrics"])
+    assert spool.segments() == []
+
+
+def test_requeues_metrics_when_elasticsearch_is_unavailable(
+    run_mgmt_command, spool, mock_bulk
+):
+    mock_bulk.side_effect = ConnectionError("N/A", "Connection refused", None)
+    with pytest.raises(SystemExit):
+        run_mgmt_command(Command, ["replay_metrics"])
+    spool.close()
+    (segment,) = spool.segments()
+    assert [action["_source"]["page_id"] for _, action in spool.read(segment)] == [
+        "a",
+        "b",
+        "c",
+    ]
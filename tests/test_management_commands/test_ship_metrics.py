@@ -0,0 +1,49 @@
+import os
+import signal
+import threading
+
+import pytest
+from django.core.management.base import CommandError
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.management.commands.ship_metrics import Command
+from tests.conftest import wait_until
+
+
+class ShippedPageView(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "shipapp"
+        write_using = "ingest"
+
+
+@pytest.fixture()
+def socket_path(settings, tmp_path):
+    path = str(tmp_path / "metrics.sock")
+    settings.ELASTICSEARCH_METRICS_SHIPPER = {"socket": path}
+    return path
+
+
+def test_requires_socket():
+    with pytest.raises(CommandError):
+        Command().handle(socket=None)
+
+
+def test_ships_metrics_until_stopped(run_mgmt_command, socket_path, cluster):
+    def record_and_stop():
+        wait_until(lambda: os.path.exists(socket_path))
+        for page_id in ("a", "b", "c"):
+            assert ShippedPageView.record(page_id=page_id) is not None
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    thread = threading.Thread(target=record_and_stop)
+    thread.start()
+    try:
+        out, err = run_mgmt_command(Command, ["ship_metrics", "--flush-interval", "60"])
+    finally:
+        thread.join()
+    assert "Shipping metrics received on {}".format(socket_path) in out
+    assert "3 received, 3 indexed, 0 spooled, 0 failed, 0 dropped" in out
+    assert len(cluster.indices[ShippedPageView.get_index_name()]) == 3
+    assert not os.path.exists(socket_path)
@@ -1,11 +1,21 @@
 import pytest
 import mock
+from elasticsearch.exceptions import ConnectionError
 
 from elasticsearch_metrics.management.commands.sync_metrics import Command
 from elasticsearch_metrics import metrics
 from elasticsearch_metrics.registry import registry
 
 
+@pytest.fixture(autouse=True)
+def mock_get_index_templates():
+    with mock.patch(
+        "elasticsearch_metrics.management.commands.sync_metrics.get_index_templates"
+    ) as patch:
+        patch.side_effect = lambda metrics, using: dict.fromkeys(metrics)
+        yield patch
+
+
 @pytest.fixture()
 def mock_sync_index_template():
     with mock.patch(
@@ -45,3 +55,45 @@ def test_with_connection(run_mgmt_command, mock_sync_index_template, settings):
     call_kwargs = mock_sync_index_template.call_args[1]
     assert call_kwargs["using"] == "alternate"
     assert "Using connection: 'alternate'" in out
+
+
+def test_with_jobs(run_mgmt_command, mock_sync_index_template):
+    out, err = run_mgmt_command(Command, ["sync_metrics", "--jobs", "4"])
+    assert mock_sync_index_template.call_count == len(registry.get_metrics())
+    assert "Synchronized metrics." in out
+
+
+def test_reports_failures(run_mgmt_command, mock_sync_index_template):
+    mock_sync_index_template.side_effect = ConnectionError("N/A", "refused", None)
+    with pytest.raises(SystemExit):
+        run_mgmt_command(Command, ["sync_metrics", "--jobs", "2"])
+    assert mock_sync_index_template.call_count == len(registry.get_metrics())
+
+
+def test_skips_unchanged_templates(
+    run_mgmt_command, mock_get_index_templates, mock_sync_index_template
+):
+    class UnchangedMetric(metrics.Metric):
+        class Meta:
+            app_label = "unchangedapp"
+
+    class ChangedMetric(metrics.Metric):
+        class Meta:
+            app_label = "unchangedapp"
+
+    fingerprint = metrics._get_fingerprint(
+        UnchangedMetric.get_index_template().to_dict()
+    )
+    mock_get_index_templates.side_effect = None
+    mock_get_index_templates.return_value = {
+        UnchangedMetric: {"mappings": {"doc": {"_meta": {"fingerprint": fingerprint}}}},
+        ChangedMetric: {"mappings": {"doc": {"_meta": {"fingerprint": "outdated"}}}},
+    }
+    out, err = run_mgmt_command(Command, ["sync_metrics", "unchangedapp"])
+    assert mock_get_index_templates.call_count == 1
+    assert mock_sync_index_template.call_count == 1
+    assert "Skipping UnchangedMetric (unchanged)" in out
+
+    run_mgmt_command(Command, ["sync_metrics", "unchangedapp", "--force"])
+    assert mock_get_index_templates.call_count == 1
+    assert mock_sync_index_template.call_count == 3
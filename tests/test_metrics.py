@@ -1,6 +1,8 @@
 import mock
 import pytest
 import datetime as dt
+import subprocess
+import sys
 from django.utils import timezone
 from elasticsearch_metrics import metrics
 from elasticsearch_dsl import (
@@ -65,6 +67,344 @@ class TestGetIndexName:
             today_formatted
         )
 
+    def test_get_index_name_is_cached(self):
+        date = dt.date(2020, 2, 14)
+        with mock.patch.object(
+            PreprintView, "_format_index_name", wraps=PreprintView._format_index_name
+        ) as mock_format:
+            PreprintView._index_name_cache.clear()
+            PreprintView.get_index_name(date=date)
+            PreprintView.get_index_name(date=date)
+            PreprintView.get_index_name(date=dt.datetime(2020, 2, 14, 12, 30))
+            assert mock_format.call_count == 1
+
+    def test_get_index_name_cache_is_per_class(self):
+        date = dt.date(2020, 2, 14)
+        assert PreprintView.get_index_name(date=date).startswith("osf_metrics")
+        assert DummyMetric.get_index_name(date=date).startswith("dummyapp")
+
+    def test_get_index_name_cache_is_invalidated_when_date_format_changes(
+        self, settings
+    ):
+        date = dt.date(2020, 2, 14)
+        assert PreprintView.get_index_name(date=date).endswith("2020.02.14")
+        settings.ELASTICSEARCH_METRICS_DATE_FORMAT = "%Y.%m"
+        assert PreprintView.get_index_name(date=date).endswith("2020.02")
+
+    def test_get_index_name_cache_is_bounded(self):
+        cache = PreprintView._index_name_cache
+        for day in range(1, cache.maxsize + 10):
+            PreprintView.get_index_name(
+                date=dt.date(2020, 1, 1) + dt.timedelta(days=day)
+            )
+        assert len(cache) <= cache.maxsize
+
+    def test_get_index_name_with_hourly_date_format(self, settings):
+        settings.ELASTICSEARCH_METRICS_DATE_FORMAT = "%Y.%m.%d.%H"
+        assert (
+            PreprintView.get_index_name(date=dt.datetime(2020, 2, 14, 1, 30))
+            == "osf_metrics_preprintviews_2020.02.14.01"
+        )
+        assert (
+            PreprintView.get_index_name(date=dt.datetime(2020, 2, 14, 2, 30))
+            == "osf_metrics_preprintviews_2020.02.14.02"
+        )
+
+    def test_get_index_name_cache_with_timezones(self, settings):
+        settings.ELASTICSEARCH_METRICS_DATE_FORMAT = "%Y.%m.%d.%H"
+        utc = dt.datetime(2020, 2, 14, 12, 30, tzinfo=dt.timezone.utc)
+        eastern = utc.astimezone(dt.timezone(dt.timedelta(hours=-5)))
+        assert utc == eastern
+        assert PreprintView.get_index_name(date=utc).endswith("2020.02.14.12")
+        assert PreprintView.get_index_name(date=eastern).endswith("2020.02.14.07")
+        assert PreprintView.get_index_name(date=utc).endswith("2020.02.14.12")
+
+
+class AbstractHourlyMetric(metrics.Metric):
+    class Meta:
+        abstract = True
+        index_granularity = "hourly"
+
+
+class HourlyMetric(AbstractHourlyMetric):
+    class Meta:
+        app_label = "dummyapp"
+
+
+class WeeklyMetric(metrics.Metric):
+    class Meta:
+        app_label = "dummyapp"
+        index_granularity = "weekly"
+
+
+class MonthlyMetric(metrics.Metric):
+    class Meta:
+        app_label = "dummyapp"
+        index_granularity = "monthly"
+
+
+class YearlyMetric(metrics.Metric):
+    class Meta:
+        app_label = "dummyapp"
+        index_granularity = "yearly"
+
+
+class CustomDateFormatMetric(metrics.Metric):
+    class Meta:
+        app_label = "dummyapp"
+        date_format = "%Y-%m"
+
+
+class TestIndexGranularity:
+    @pytest.mark.parametrize(
+        ("metric_cls", "expected"),
+        [
+            (HourlyMetric, "dummyapp_hourlymetric_2020.02.14.13"),
+            (WeeklyMetric, "dummyapp_weeklymetric_2020.W07"),
+            (MonthlyMetric, "dummyapp_monthlymetric_2020.02"),
+            (YearlyMetric, "dummyapp_yearlymetric_2020"),
+            (CustomDateFormatMetric, "dummyapp_customdateformatmetric_2020-02"),
+        ],
+    )
+    def test_get_index_name(self, metric_cls, expected):
+        assert metric_cls.get_index_name(dt.datetime(2020, 2, 14, 13, 30)) == expected
+
+    def test_ignores_date_format_setting(self, settings):
+        settings.ELASTICSEARCH_METRICS_DATE_FORMAT = "%Y"
+        date = dt.date(2020, 2, 14)
+        assert MonthlyMetric.get_index_name(date) == "dummyapp_monthlymetric_2020.02"
+        assert PreprintView.get_index_name(date) == "osf_metrics_preprintviews_2020"
+
+    def test_inherited_from_abstract_metric(self):
+        assert HourlyMetric.get_date_format() == "%Y.%m.%d.%H"
+
+    @mock.patch.object(timezone, "now")
+    def test_record_without_timestamp(self, mock_now, mock_save):
+        mock_now.return_value = dt.datetime(2020, 2, 14, 13, 30)
+        metric = HourlyMetric.record()
+        assert metric.timestamp == mock_now.return_value
+        assert mock_save.call_args[1]["index"] == "dummyapp_hourlymetric_2020.02.14.13"
+        assert HourlyMetric.get_index_name() == "dummyapp_hourlymetric_2020.02.14.13"
+
+    def test_invalid_granularity(self):
+        with pytest.raises(ValueError, match="index_granularity"):
+
+            class InvalidMetric(metrics.Metric):
+                class Meta:
+                    app_label = "dummyapp"
+                    index_granularity = "fortnightly"
+
+    def test_search_uses_granularity(self):
+        search = MonthlyMetric.search(
+            start=dt.date(2019, 11, 15), end=dt.date(2020, 12, 31)
+        )
+        assert search._index == [
+            "dummyapp_monthlymetric_2019.11",
+            "dummyapp_monthlymetric_2019.12",
+            "dummyapp_monthlymetric_2020.*",
+        ]
+
+
+class TestRetention:
+    def test_retention_in_days(self):
+        class RetainedMetric(metrics.Metric):
+            class Meta:
+                app_label = "dummyapp"
+                retention = 30
+
+        assert RetainedMetric._retention == dt.timedelta(days=30)
+        assert PreprintView._retention is None
+
+    def test_get_index_date(self):
+        assert HourlyMetric.get_index_date(
+            "dummyapp_hourlymetric_2020.02.14.13"
+        ) == dt.datetime(2020, 2, 14, 13)
+        assert WeeklyMetric.get_index_date(
+            "dummyapp_weeklymetric_2020.W07"
+        ) == dt.datetime(2020, 2, 10)
+        assert HourlyMetric.get_index_date("dummyapp_hourlymetric_2020.02") is None
+        assert HourlyMetric.get_index_date("otherapp_2020.02.14.13") is None
+
+    def test_get_expired_indices(self, client):
+        class MonthlyRetainedMetric(metrics.Metric):
+            class Meta:
+                app_label = "dummyapp"
+                index_granularity = "monthly"
+                retention = dt.timedelta(days=45)
+
+        indices = [
+            "dummyapp_monthlyretainedmetric_2020.03",
+            "dummyapp_monthlyretainedmetric_2020.01",
+            "dummyapp_monthlyretainedmetric_2019.12",
+            "dummyapp_monthlyretainedmetric_2020.02",
+            "dummyapp_monthlyretainedmetric_invalid",
+        ]
+        with mock.patch.object(client.cat, "indices") as mock_cat_indices:
+            mock_cat_indices.return_value = [{"index": name} for name in indices]
+            # The cutoff is 2020-02-01, so January is the newest expired month
+            expired = MonthlyRetainedMetric.get_expired_indices(
+                now=dt.datetime(2020, 3, 17)
+            )
+        assert mock_cat_indices.call_args[1]["index"] == (
+            "dummyapp_monthlyretainedmetric_*"
+        )
+        assert expired == [
+            "dummyapp_monthlyretainedmetric_2019.12",
+            "dummyapp_monthlyretainedmetric_2020.01",
+        ]
+
+
+class TestIndexTemplateFingerprint:
+    def get_synced_template(self, metric_cls, client):
+        with mock.patch.object(client.indices, "put_template") as mock_put_template:
+            metric_cls.sync_index_template()
+        return mock_put_template.call_args[1]["body"]
+
+    def test_sync_stores_fingerprint(self, client):
+        body = self.get_synced_template(PreprintView, client)
+        fingerprint = body["mappings"]["doc"]["_meta"]["fingerprint"]
+        assert fingerprint == metrics._get_fingerprint(
+            PreprintView.get_index_template().to_dict()
+        )
+        assert body == self.get_synced_template(PreprintView, client)
+
+    def test_is_index_template_current(self, client):
+        body = self.get_synced_template(PreprintView, client)
+        assert PreprintView.is_index_template_current(body) is True
+        assert PreprintView.is_index_template_current(None) is False
+        assert DummyMetric.is_index_template_current(body) is False
+
+    def test_compare_index_template_uses_fingerprint(self, client):
+        body = self.get_synced_template(PreprintView, client)
+        # Mappings would differ if they were compared
+        body["mappings"]["doc"]["properties"] = {}
+        assert PreprintView.compare_index_template(body) is True
+
+    def test_compare_index_template_ignores_fingerprint_when_diffing(self, client):
+        body = self.get_synced_template(PreprintView, client)
+        body["mappings"]["doc"]["_meta"]["fingerprint"] = "outdated"
+        body["index_patterns"] = ["outdated-*"]
+        with pytest.raises(IndexTemplateOutOfSyncError) as excinfo:
+            PreprintView.compare_index_template(body)
+        assert excinfo.value.mappings_in_sync is True
+        assert excinfo.value.patterns_in_sync is False
+
+
+class TestIndexTemplateCache:
+    def test_template_data_is_cached(self):
+        data = PreprintView._get_index_template_data()
+        assert data == PreprintView.get_index_template().to_dict()
+        assert PreprintView._get_index_template_data() is data
+
+    def test_cache_is_invalidated_when_index_changes(self):
+        class CachedMetric(metrics.Metric):
+            class Meta:
+                app_label = "dummyapp"
+
+        data = CachedMetric._get_index_template_data()
+        fingerprint = CachedMetric._get_index_template_fingerprint()
+        CachedMetric._index.settings(number_of_shards=3)
+        assert CachedMetric._get_index_template_data()["settings"] == {
+            "number_of_shards": 3
+        }
+        assert CachedMetric._get_index_template_data() is not data
+        assert CachedMetric._get_index_template_fingerprint() != fingerprint
+
+    def test_cache_is_per_class(self):
+        class ParentMetric(metrics.Metric):
+            class Meta:
+                abstract = True
+
+        parent_data = ParentMetric._get_index_template_data()
+
+        class ChildMetric(ParentMetric):
+            my_int = metrics.Integer()
+
+            class Meta:
+                app_label = "dummyapp"
+
+        child_data = ChildMetric._get_index_template_data()
+        assert "my_int" in child_data["mappings"]["doc"]["properties"]
+        assert "my_int" not in parent_data["mappings"]["doc"]["properties"]
+
+
+class TestSearch:
+    def test_search_uses_template_by_default(self):
+        search = PreprintView.search()
+        assert search._index == ["osf_metrics_preprintviews-*"]
+        assert search.to_dict() == {}
+
+    def test_search_between_dates_uses_index_names(self):
+        search = PreprintView.search(
+            start=dt.date(2019, 12, 30), end=dt.date(2020, 2, 29)
+        )
+        assert search._index == [
+            "osf_metrics_preprintviews_2019.12.30",
+            "osf_metrics_preprintviews_2019.12.31",
+            "osf_metrics_preprintviews_2020.01.*",
+            "osf_metrics_preprintviews_2020.02.*",
+        ]
+        assert search._params == {"ignore_unavailable": True}
+        assert search.to_dict()["query"] == {
+            "bool": {
+                "filter": [
+                    {
+                        "range": {
+                            "timestamp": {
+                                "gte": dt.date(2019, 12, 30),
+                                "lt": dt.date(2020, 3, 1),
+                            }
+                        }
+                    }
+                ]
+            }
+        }
+
+    def test_search_between_whole_years(self):
+        search = PreprintView.search(
+            start=dt.date(2018, 1, 1), end=dt.date(2019, 12, 31)
+        )
+        assert search._index == [
+            "osf_metrics_preprintviews_2018.*",
+            "osf_metrics_preprintviews_2019.*",
+        ]
+
+    def test_search_between_datetimes(self):
+        start = dt.datetime(2020, 2, 14, 23, 0, tzinfo=dt.timezone.utc)
+        end = dt.datetime(2020, 2, 15, 1, 0, tzinfo=dt.timezone.utc)
+        search = PreprintView.search(start=start, end=end)
+        assert search._index == [
+            "osf_metrics_preprintviews_2020.02.14",
+            "osf_metrics_preprintviews_2020.02.15",
+        ]
+        assert search.to_dict()["query"]["bool"]["filter"] == [
+            {"range": {"timestamp": {"gte": start, "lte": end}}}
+        ]
+
+    def test_search_with_open_range_uses_template(self):
+        search = PreprintView.search(start=dt.date(2020, 1, 1))
+        assert search._index == ["osf_metrics_preprintviews-*"]
+        assert search.to_dict()["query"]["bool"]["filter"] == [
+            {"range": {"timestamp": {"gte": dt.date(2020, 1, 1)}}}
+        ]
+
+    def test_search_with_hourly_date_format(self, settings):
+        settings.ELASTICSEARCH_METRICS_DATE_FORMAT = "%Y.%m.%d.%H"
+        search = PreprintView.search(
+            start=dt.datetime(2020, 2, 14, 22, 30), end=dt.datetime(2020, 2, 16, 0, 30)
+        )
+        assert search._index == [
+            "osf_metrics_preprintviews_2020.02.14.22",
+            "osf_metrics_preprintviews_2020.02.14.23",
+            "osf_metrics_preprintviews_2020.02.15.*",
+            "osf_metrics_preprintviews_2020.02.16.00",
+        ]
+
+    def test_search_falls_back_to_template_for_long_ranges(self, settings):
+        settings.ELASTICSEARCH_METRICS_DATE_FORMAT = "%d.%m.%Y"
+        search = PreprintView.search(start=dt.date(2019, 1, 1), end=dt.date(2020, 1, 1))
+        assert search._index == ["osf_metrics_preprintviews-*"]
+
 
 class TestGetIndexTemplate:
     def test_get_index_template_returns_template_with_correct_name_and_pattern(self):
@@ -125,6 +465,19 @@ class TestGetIndexTemplate:
                 class Meta:
                     template_name = "osf_metrics_preprintviews"
 
+    def test_import_before_apps_are_ready(self):
+        # Abstract metrics (e.g. CounterMetric) are defined without looking up
+        # their app, so the module can be imported before django.setup()
+        code = (
+            "from django.conf import settings\n"
+            "settings.configure(INSTALLED_APPS=['elasticsearch_metrics'])\n"
+            "from elasticsearch_metrics import metrics\n"
+            "class AbstractMetric(metrics.Metric):\n"
+            "    class Meta:\n"
+            "        abstract = True\n"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True)
+
     def test_get_index_template_default_template_name(self):
         template = DummyMetric.get_index_template()
         assert isinstance(template, IndexTemplate)
@@ -0,0 +1,138 @@
+import pytest
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.bulk import (
+    BulkRecorder,
+    TransactionBulkRecorder,
+    get_current_recorder,
+)
+from elasticsearch_metrics.middleware import BulkRecordMiddleware
+from tests.conftest import make_bulk_response
+
+
+class RequestMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "dummyapp"
+
+
+class OtherRequestMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "dummyapp"
+
+
+def get_response(request):
+    RequestMetric.record(page_id="a")
+    RequestMetric(page_id="b").save()
+    return HttpResponse("OK")
+
+
+@pytest.fixture()
+def request_factory():
+    return RequestFactory()
+
+
+def test_sends_metrics_in_one_request(request_factory, mock_bulk, mock_save):
+    middleware = BulkRecordMiddleware(get_response)
+    response = middleware(request_factory.get("/"))
+    assert response.status_code == 200
+    assert mock_save.call_count == 0
+    assert mock_bulk.call_count == 1
+    body = mock_bulk.call_args[0][0]
+    assert body.count("\n") == 4
+    assert get_current_recorder() is None
+
+
+def test_sends_metrics_of_different_classes_in_one_request(request_factory, mock_bulk):
+    def view(request):
+        RequestMetric.record(page_id="a")
+        OtherRequestMetric.record(page_id="b")
+        return HttpResponse("OK")
+
+    BulkRecordMiddleware(view)(request_factory.get("/"))
+    assert mock_bulk.call_count == 1
+    assert mock_bulk.call_args[0][0].count("\n") == 4
+
+
+def test_sends_metrics_when_view_raises(request_factory, mock_bulk):
+    def raising_view(request):
+        RequestMetric.record(page_id="a")
+        raise ValueError()
+
+    middleware = BulkRecordMiddleware(raising_view)
+    with pytest.raises(ValueError):
+        middleware(request_factory.get("/"))
+    assert mock_bulk.call_count == 1
+
+
+def test_failed_metrics_do_not_fail_request(request_factory, mock_bulk):
+    mock_bulk.side_effect = lambda body, *args, **kwargs: make_bulk_response(
+        body, failed_ids=("a",)
+    )
+    middleware = BulkRecordMiddleware(get_response)
+    response = middleware(request_factory.get("/"))
+    assert response.status_code == 200
+
+
+def test_uses_settings(request_factory, settings):
+    settings.ELASTICSEARCH_METRICS_MIDDLEWARE = {"chunk_size": 10}
+    middleware = BulkRecordMiddleware(get_response)
+    recorder = middleware.get_recorder()
+    assert type(recorder) is BulkRecorder
+    assert recorder.chunk_size == 10
+
+    settings.ELASTICSEARCH_METRICS_MIDDLEWARE = {"on_commit": True}
+    middleware = BulkRecordMiddleware(get_response)
+    assert isinstance(middleware.get_recorder(), TransactionBulkRecorder)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestOnCommit:
+    @pytest.fixture(autouse=True)
+    def on_commit(self, settings):
+        settings.ELASTICSEARCH_METRICS_MIDDLEWARE = {"on_commit": True}
+
+    def test_sends_metrics_recorded_in_committed_transaction(
+        self, request_factory, mock_bulk
+    ):
+        def view(request):
+            with transaction.atomic():
+                RequestMetric.record(page_id="a")
+            RequestMetric.record(page_id="b")
+            return HttpResponse("OK")
+
+        BulkRecordMiddleware(view)(request_factory.get("/"))
+        assert mock_bulk.call_count == 1
+        assert mock_bulk.call_args[0][0].count("\n") == 4
+
+    def test_discards_metrics_recorded_in_rolled_back_transaction(
+        self, request_factory, mock_bulk
+    ):
+        def view(request):
+            try:
+                with transaction.atomic():
+                    RequestMetric.record(page_id="a")
+                    raise ValueError()
+            except ValueError:
+                pass
+            RequestMetric.record(page_id="b")
+            return HttpResponse("OK")
+
+        BulkRecordMiddleware(view)(request_factory.get("/"))
+        assert mock_bulk.call_count == 1
+        body = mock_bulk.call_args[0][0]
+        assert body.count("\n") == 2
+        assert '"page_id":"b"' in body
+
+    def test_transaction_committed_after_recorder_exits(self, mock_bulk):
+        with transaction.atomic():
+            with TransactionBulkRecorder():
+                RequestMetric.record(page_id="a")
+            assert mock_bulk.call_count == 0
+        assert mock_bulk.call_count == 1
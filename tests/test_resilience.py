@@ -0,0 +1,226 @@
+import mock
+import pytest
+from elasticsearch.exceptions import ConnectionError, ConnectionTimeout, TransportError
+from elasticsearch_dsl import connections
+
+from elasticsearch_metrics import metrics, signals
+from elasticsearch_metrics.bulk import BulkRecorder
+from elasticsearch_metrics.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    RetryPolicy,
+    call_with_retry,
+    get_circuit_breaker,
+)
+from elasticsearch_metrics.spool import get_spool
+from elasticsearch_metrics.testing import InMemoryCluster, InMemoryConnection
+from tests.conftest import make_bulk_response
+
+
+class ResilientMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "resilienceapp"
+        write_timeout = 0.5
+
+
+class ChildResilientMetric(ResilientMetric):
+    class Meta:
+        app_label = "resilienceapp"
+
+
+def unavailable():
+    return ConnectionError("N/A", "Connection refused", None)
+
+
+@pytest.fixture()
+def changes():
+    changes = []
+
+    def receiver(sender, breaker, using, state, previous_state, **kwargs):
+        changes.append((using, previous_state, state))
+
+    signals.circuit_breaker_changed.connect(receiver)
+    yield changes
+    signals.circuit_breaker_changed.disconnect(receiver)
+
+
+@pytest.fixture()
+def monotonic():
+    with mock.patch("elasticsearch_metrics.resilience.time.monotonic") as patch:
+        patch.return_value = 100.0
+        yield patch
+
+
+@pytest.fixture()
+def retry_settings(settings):
+    settings.ELASTICSEARCH_METRICS_RETRY = {"max_retries": 2, "backoff": 0}
+
+
+@pytest.fixture()
+def breaker_settings(settings):
+    settings.ELASTICSEARCH_METRICS_CIRCUIT_BREAKER = {
+        "failure_threshold": 2,
+        "reset_timeout": 30,
+    }
+    yield get_circuit_breaker("default")
+
+
+class TestRetryPolicy:
+    def test_delay_is_jittered_and_capped(self):
+        retry = RetryPolicy(backoff=0.1, max_backoff=0.3)
+        with mock.patch("elasticsearch_metrics.resilience.random.uniform") as uniform:
+            retry.get_delay(0)
+            uniform.assert_called_with(0, 0.1)
+            retry.get_delay(1)
+            uniform.assert_called_with(0, 0.2)
+            retry.get_delay(5)
+            uniform.assert_called_with(0, 0.3)
+
+    def test_call_with_retry(self):
+        func = mock.Mock(side_effect=[unavailable(), unavailable(), "ok"])
+        assert call_with_retry(func, retry=RetryPolicy(backoff=0)) == "ok"
+        assert func.call_count == 3
+
+    def test_call_with_retry_gives_up(self):
+        func = mock.Mock(side_effect=unavailable())
+        with pytest.raises(ConnectionError):
+            call_with_retry(func, retry=RetryPolicy(max_retries=1, backoff=0))
+        assert func.call_count == 2
+
+    def test_non_retryable_errors_are_raised(self):
+        func = mock.Mock(side_effect=TransportError(400, "mapper_parsing_exception"))
+        breaker = CircuitBreaker("default", failure_threshold=1)
+        with pytest.raises(TransportError):
+            call_with_retry(func, breaker=breaker, retry=RetryPolicy(backoff=0))
+        assert func.call_count == 1
+        assert breaker.state == CLOSED
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self, changes, monotonic):
+        breaker = CircuitBreaker("default", failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert breaker.allow_request() is False
+        assert changes == [("default", CLOSED, OPEN)]
+
+    def test_half_open_lets_one_request_through(self, changes, monotonic):
+        breaker = CircuitBreaker("default", failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        monotonic.return_value += 30
+        assert breaker.allow_request() is True
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request() is False
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        monotonic.return_value += 30
+        assert breaker.allow_request() is True
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        assert breaker.allow_request() is True
+        assert [change[1:] for change in changes] == [
+            (CLOSED, OPEN),
+            (OPEN, HALF_OPEN),
+            (HALF_OPEN, OPEN),
+            (OPEN, HALF_OPEN),
+            (HALF_OPEN, CLOSED),
+        ]
+
+    def test_invalid_fallback(self):
+        with pytest.raises(ValueError, match="Invalid circuit breaker fallback"):
+            CircuitBreaker("default", fallback="raise")
+
+    def test_disabled_by_default(self):
+        assert get_circuit_breaker("default") is None
+
+
+class TestSave:
+    def test_write_timeout(self, mock_save):
+        assert ChildResilientMetric._write_timeout == 0.5
+        ResilientMetric(page_id="a").save()
+        assert mock_save.call_args[1]["request_timeout"] == 0.5
+        ResilientMetric(page_id="a").save(request_timeout=2)
+        assert mock_save.call_args[1]["request_timeout"] == 2
+
+    def test_write_timeout_expires(self):
+        connections.create_connection(
+            "slow",
+            hosts=["localhost:9200"],
+            connection_class=InMemoryConnection,
+            cluster=InMemoryCluster(),
+            latency=0.05,
+        )
+        try:
+            with pytest.raises(ConnectionTimeout):
+                ChildResilientMetric(page_id="a").save(
+                    using="slow", request_timeout=0.01
+                )
+            assert ChildResilientMetric(page_id="a").save(using="slow") is True
+        finally:
+            connections.remove_connection("slow")
+
+    def test_retries(self, retry_settings, mock_save):
+        mock_save.side_effect = [unavailable(), True]
+        assert ResilientMetric(page_id="a").save() is True
+        assert mock_save.call_count == 2
+
+    def test_open_breaker_drops_metrics(self, breaker_settings, mock_save):
+        mock_save.side_effect = unavailable()
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                ResilientMetric(page_id="a").save()
+        assert breaker_settings.state == OPEN
+        assert ResilientMetric(page_id="a").save() is None
+        assert mock_save.call_count == 2
+
+    def test_open_breaker_spools_metrics(
+        self, breaker_settings, mock_save, settings, tmp_path
+    ):
+        settings.ELASTICSEARCH_METRICS_SPOOL = {"path": str(tmp_path)}
+        mock_save.side_effect = unavailable()
+        for _ in range(3):
+            assert ResilientMetric(page_id="a").save() is None
+        assert mock_save.call_count == 2
+        assert get_spool().written == 3
+
+
+class TestBulkRecorder:
+    def test_write_timeout(self, mock_bulk):
+        ResilientMetric.record_many([{"page_id": "a"}])
+        assert mock_bulk.call_args[1]["request_timeout"] == 0.5
+
+    def test_retries_unavailable_documents(self, retry_settings, mock_bulk):
+        responses = [unavailable()]
+
+        def bulk(body, *args, **kwargs):
+            if responses:
+                raise responses.pop()
+            return make_bulk_response(body)
+
+        mock_bulk.side_effect = bulk
+        with BulkRecorder() as recorder:
+            ResilientMetric.record(page_id="a")
+            ResilientMetric.record(page_id="b")
+        assert mock_bulk.call_count == 2
+        assert recorder.errors == []
+
+    def test_open_breaker_drops_documents(self, breaker_settings, mock_bulk):
+        mock_bulk.side_effect = unavailable()
+        for _ in range(2):
+            recorder = BulkRecorder(raise_on_error=False)
+            recorder.add(ResilientMetric(page_id="a"))
+            assert len(recorder.flush()) == 1
+        assert breaker_settings.state == OPEN
+        recorder = BulkRecorder()
+        recorder.add(ResilientMetric(page_id="a"))
+        assert recorder.flush() == []
+        assert recorder.dropped == 1
+        assert mock_bulk.call_count == 2
@@ -0,0 +1,156 @@
+import pytest
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.bulk import BulkRecorder
+from elasticsearch_metrics.management.commands.check_metrics import (
+    Command as CheckCommand,
+)
+from elasticsearch_metrics.management.commands.sync_metrics import (
+    Command as SyncCommand,
+)
+from elasticsearch_metrics.routers import ConnectionRouter
+from elasticsearch_metrics.testing import get_cluster
+
+
+class IngestMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "routersapp"
+        write_using = "ingest"
+        read_using = "replica"
+
+
+class ChildIngestMetric(IngestMetric):
+    class Meta:
+        app_label = "routersapp"
+
+
+class WriteOnlyMetric(metrics.Metric):
+    class Meta:
+        app_label = "routersapp"
+        write_using = "ingest"
+
+
+class UnroutedMetric(metrics.Metric):
+    class Meta:
+        app_label = "unroutedapp"
+
+
+class Router(object):
+    def connection_for_write(self, metric_cls, **hints):
+        if metric_cls is UnroutedMetric:
+            return "ingest"
+        return None
+
+    def connection_for_read(self, metric_cls, **hints):
+        return None
+
+
+@pytest.fixture()
+def clusters():
+    clusters = {alias: get_cluster(alias) for alias in ("ingest", "replica")}
+    yield clusters
+    for cluster in clusters.values():
+        cluster.reset()
+
+
+class TestMeta:
+    def test_write_and_read_using(self):
+        assert IngestMetric.get_write_using() == "ingest"
+        assert IngestMetric.get_read_using() == "replica"
+        assert IngestMetric.get_write_using("other") == "other"
+        assert IngestMetric.get_read_using("other") == "other"
+
+    def test_inherited(self):
+        assert ChildIngestMetric.get_write_using() == "ingest"
+        assert ChildIngestMetric.get_read_using() == "replica"
+
+    def test_read_falls_back_to_write(self):
+        assert WriteOnlyMetric.get_read_using() == "ingest"
+
+    def test_defaults_to_index_using(self):
+        assert UnroutedMetric.get_write_using() == "default"
+        assert UnroutedMetric.get_read_using() == "default"
+
+    def test_search_uses_read_connection(self):
+        assert IngestMetric.search()._using == "replica"
+        assert IngestMetric.search(using="other")._using == "other"
+
+    def test_save_uses_write_connection(self, clusters):
+        IngestMetric.record(page_id="a")
+        assert len(clusters["ingest"].indices) == 1
+        assert not clusters["replica"].indices
+
+    def test_bulk_uses_write_connection(self, clusters):
+        IngestMetric.record_many([{"page_id": "a"}, {"page_id": "b"}])
+        index = IngestMetric.get_index_name()
+        assert len(clusters["ingest"].indices[index]) == 2
+
+    def test_recorder_using_overrides_routing(self, clusters):
+        with BulkRecorder(using="replica"):
+            IngestMetric.record(page_id="a")
+        assert not clusters["ingest"].indices
+        assert len(clusters["replica"].indices) == 1
+
+    def test_commands_use_write_connection(self, clusters, run_mgmt_command):
+        run_mgmt_command(SyncCommand, ["sync_metrics", "routersapp"])
+        assert set(clusters["ingest"].templates) == {
+            "routersapp_ingestmetric",
+            "routersapp_childingestmetric",
+            "routersapp_writeonlymetric",
+        }
+        assert not clusters["replica"].templates
+        clusters["ingest"].templates.pop("routersapp_writeonlymetric")
+        with pytest.raises(SystemExit):
+            run_mgmt_command(CheckCommand, ["check_metrics", "routersapp"])
+
+
+class TestRouters:
+    @pytest.fixture(autouse=True)
+    def routers(self, settings):
+        settings.ELASTICSEARCH_METRICS_ROUTERS = [
+            "tests.test_routers.Router",
+        ]
+
+    def test_router_chooses_connection(self):
+        assert UnroutedMetric.get_write_using() == "ingest"
+        assert UnroutedMetric.get_read_using() == "ingest"
+        # Routers that return None defer to Meta
+        assert IngestMetric.get_read_using() == "replica"
+
+    def test_routers_take_precedence_over_meta(self, settings):
+        class ReadRouter(object):
+            def connection_for_read(self, metric_cls, **hints):
+                return "dashboards"
+
+        settings.ELASTICSEARCH_METRICS_ROUTERS = [ReadRouter]
+        assert IngestMetric.get_read_using() == "dashboards"
+        assert IngestMetric.get_write_using() == "ingest"
+
+    def test_routers_are_tried_in_order(self):
+        class FirstRouter(object):
+            def connection_for_write(self, metric_cls, **hints):
+                return None
+
+        class SecondRouter(object):
+            def connection_for_write(self, metric_cls, **hints):
+                return "second"
+
+        router = ConnectionRouter([FirstRouter(), SecondRouter, Router])
+        assert router.connection_for_write(UnroutedMetric) == "second"
+        assert router.connection_for_read(UnroutedMetric) is None
+
+    def test_router_receives_instance_hint(self, clusters, settings):
+        instances = []
+
+        class InstanceRouter(object):
+            def connection_for_write(self, metric_cls, instance=None, **hints):
+                instances.append(instance)
+                return "replica"
+
+        settings.ELASTICSEARCH_METRICS_ROUTERS = [InstanceRouter()]
+        metric = IngestMetric(page_id="a")
+        metric.save()
+        assert instances == [metric]
+        assert len(clusters["replica"].indices) == 1
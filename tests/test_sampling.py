@@ -0,0 +1,134 @@
+import mock
+import pytest
+
+from elasticsearch_metrics import metrics, sampling
+from elasticsearch_metrics.bulk import BulkRecorder
+
+
+class SampledMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+    duration = metrics.Integer()
+
+    class Meta:
+        app_label = "samplingapp"
+        sample_rate = 0.25
+
+
+class ChildSampledMetric(SampledMetric):
+    class Meta:
+        app_label = "samplingapp"
+
+
+class UnsampledMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+    duration = metrics.Integer()
+
+    class Meta:
+        app_label = "samplingapp"
+
+
+@pytest.fixture()
+def mock_random():
+    with mock.patch("elasticsearch_metrics.metrics.random.random") as patch:
+        patch.return_value = 0.1
+        yield patch
+
+
+class TestMeta:
+    def test_sample_rate(self):
+        assert SampledMetric._sample_rate == 0.25
+        assert ChildSampledMetric._sample_rate == 0.25
+        assert UnsampledMetric._sample_rate is None
+
+    @pytest.mark.parametrize("invalid_rate", [0, -0.5, 1.5])
+    def test_invalid_sample_rate(self, invalid_rate):
+        with pytest.raises(ValueError, match="Invalid sample_rate"):
+
+            class InvalidSampledMetric(metrics.Metric):
+                class Meta:
+                    app_label = "samplingapp"
+                    sample_rate = invalid_rate
+
+    def test_sample_weight_in_mapping(self):
+        properties = SampledMetric.get_index_template().to_dict()["mappings"]["doc"][
+            "properties"
+        ]
+        assert properties["sample_weight"] == {"type": "float"}
+        assert "sample_weight" not in UnsampledMetric._doc_type.mapping
+
+
+class TestRecord:
+    def test_kept(self, mock_save, mock_random):
+        metric = SampledMetric.record(page_id="a")
+        assert metric.sample_weight == 4.0
+        assert metric.to_dict()["sample_weight"] == 4.0
+        assert mock_save.call_count == 1
+
+    def test_dropped(self, mock_save, mock_random):
+        mock_random.return_value = 0.25
+        assert SampledMetric.record(page_id="a") is None
+        assert mock_save.call_count == 0
+
+    def test_sample_rate_override(self, mock_save, mock_random):
+        mock_random.return_value = 0.4
+        metric = SampledMetric.record(page_id="a", sample_rate=0.5)
+        assert metric.sample_weight == 2.0
+        metric = UnsampledMetric.record(page_id="a", sample_rate=0.5)
+        assert metric.sample_weight == 2.0
+
+    def test_full_sample_rate_keeps_all_metrics(self, mock_save, mock_random):
+        metric = SampledMetric.record(page_id="a", sample_rate=1)
+        assert "sample_weight" not in metric.to_dict()
+        assert mock_random.call_count == 0
+
+    def test_invalid_sample_rate(self, mock_save):
+        with pytest.raises(ValueError):
+            UnsampledMetric.record(page_id="a", sample_rate=0)
+
+    def test_record_many(self, cluster, mock_random):
+        mock_random.side_effect = [0.1, 0.9, 0.2, 0.3]
+        instances = SampledMetric.record_many(
+            ({"page_id": str(i)} for i in range(4)), using="ingest"
+        )
+        assert [instance.page_id for instance in instances] == ["0", "2"]
+        assert len(cluster.indices[SampledMetric.get_index_name()]) == 2
+
+    def test_bulk_recorder(self, cluster, mock_random):
+        mock_random.side_effect = [0.1, 0.9]
+        with BulkRecorder(using="ingest") as recorder:
+            assert recorder.record(SampledMetric, page_id="a") is not None
+            assert recorder.record(SampledMetric, page_id="b") is None
+        assert len(cluster.indices[SampledMetric.get_index_name()]) == 1
+
+
+class TestEstimates:
+    def test_to_dict(self):
+        assert sampling.estimated_count().to_dict() == {
+            "sum": {"field": "sample_weight", "missing": 1}
+        }
+        assert sampling.estimated_avg("duration").to_dict() == {
+            "weighted_avg": {
+                "value": {"field": "duration"},
+                "weight": {"field": "sample_weight", "missing": 1},
+            }
+        }
+        script = sampling.estimated_sum("duration").to_dict()["sum"]["script"]
+        assert script["params"] == {
+            "field": "duration",
+            "weight_field": "sample_weight",
+        }
+
+    def test_estimates(self, cluster):
+        for duration in (10, 20):
+            SampledMetric(page_id="a", duration=duration, sample_weight=4.0).save(
+                using="ingest"
+            )
+        UnsampledMetric(page_id="a", duration=40).save(
+            using="ingest", index=SampledMetric.get_index_name()
+        )
+        search = SampledMetric.search(using="ingest")
+        search.aggs.metric("count", sampling.estimated_count())
+        search.aggs.metric("avg", sampling.estimated_avg("duration"))
+        aggregations = search[:0].execute().aggregations
+        assert aggregations.count.value == 9
+        assert aggregations.avg.value == pytest.approx((4 * 10 + 4 * 20 + 40) / 9)
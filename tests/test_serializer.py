@@ -0,0 +1,96 @@
+import datetime as dt
+import decimal
+import uuid
+
+import mock
+import pytest
+from dateutil import tz
+from elasticsearch.exceptions import SerializationError
+from elasticsearch_dsl.serializer import serializer as default_serializer
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics import serializer as serializer_module
+from elasticsearch_metrics.serializer import (
+    OrjsonSerializer,
+    get_connection_settings,
+    get_serializer,
+)
+
+pytest.importorskip("orjson")
+
+
+class SerializedMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+    tags = metrics.Keyword(multi=True)
+    duration = metrics.Float()
+    day = metrics.Date()
+
+    class Meta:
+        app_label = "serializerapp"
+
+
+@pytest.mark.parametrize(
+    "timestamp",
+    [
+        dt.datetime(2020, 2, 14, 12, 30),
+        dt.datetime(2020, 2, 14, 12, 30, 1, 123456),
+        dt.datetime(2020, 2, 14, 12, 30, tzinfo=dt.timezone.utc),
+        dt.datetime(2020, 2, 14, 12, 30, tzinfo=tz.gettz("America/New_York")),
+        dt.datetime(2020, 2, 14, 12, 30, tzinfo=dt.timezone(dt.timedelta(hours=5.5))),
+    ],
+)
+def test_encodes_metrics_like_default_serializer(timestamp):
+    metric = SerializedMetric(
+        timestamp=timestamp,
+        page_id="ü",
+        tags=["a", "b"],
+        duration=1.5,
+        day=dt.date(2020, 2, 14),
+    )
+    action = metric.to_bulk_action(index="index")
+    assert OrjsonSerializer().dumps(action) == default_serializer.dumps(action)
+
+
+def test_falls_back_to_default_serializer_for_unsupported_values():
+    data = {
+        "big": 2**70,
+        "decimal": decimal.Decimal("1.5"),
+        "uuid": uuid.UUID(int=1),
+        1: "non-string key",
+    }
+    assert OrjsonSerializer().dumps(data) == default_serializer.dumps(data)
+
+
+def test_loads():
+    serializer = OrjsonSerializer()
+    assert serializer.loads('{"a":[1,2]}') == {"a": [1, 2]}
+    assert serializer.dumps("already encoded") == "already encoded"
+    with pytest.raises(SerializationError):
+        serializer.loads("{")
+
+
+def test_get_serializer(settings):
+    assert get_serializer() is default_serializer
+    settings.ELASTICSEARCH_METRICS_SERIALIZER = "orjson"
+    assert isinstance(get_serializer(), OrjsonSerializer)
+    assert get_serializer() is get_serializer()
+    settings.ELASTICSEARCH_METRICS_SERIALIZER = (
+        "elasticsearch_metrics.serializer.OrjsonSerializer"
+    )
+    assert isinstance(get_serializer(), OrjsonSerializer)
+
+
+def test_falls_back_when_orjson_is_not_installed(settings):
+    with mock.patch.object(serializer_module, "orjson", None):
+        settings.ELASTICSEARCH_METRICS_SERIALIZER = "orjson"
+        assert get_serializer() is default_serializer
+
+
+def test_get_connection_settings(settings):
+    settings.ELASTICSEARCH_METRICS_SERIALIZER = "orjson"
+    custom = object()
+    connection_settings = get_connection_settings(
+        {"default": {"hosts": "localhost"}, "other": {"serializer": custom}}
+    )
+    assert isinstance(connection_settings["default"]["serializer"], OrjsonSerializer)
+    assert connection_settings["other"]["serializer"] is custom
@@ -0,0 +1,167 @@
+import os
+
+import mock
+import pytest
+from elasticsearch.exceptions import ConnectionError, TransportError
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.bulk import BulkRecorder
+from elasticsearch_metrics.spool import Spool, get_spool, is_retryable
+
+
+class SpooledPageView(metrics.Metric):
+    page_id = metrics.Keyword()
+
+    class Meta:
+        app_label = "dummyapp"
+
+
+ACTION = {"_index": "myindex", "_type": "doc", "_source": {"page_id": "a"}}
+
+
+@pytest.fixture()
+def spool(tmp_path):
+    spool = Spool(str(tmp_path))
+    yield spool
+    spool.close()
+
+
+@pytest.fixture()
+def spool_settings(settings, tmp_path):
+    settings.ELASTICSEARCH_METRICS_SPOOL = {"path": str(tmp_path)}
+    yield get_spool()
+
+
+@pytest.mark.parametrize(
+    ("status", "expected"),
+    [("N/A", True), ("TIMEOUT", True), (429, True), (503, True), (400, False)],
+)
+def test_is_retryable(status, expected):
+    assert is_retryable(status) is expected
+
+
+class TestSpool:
+    def test_write_and_read(self, spool):
+        assert spool.write("default", ACTION) is True
+        assert spool.segments() == []
+        spool.close()
+        segments = spool.segments()
+        assert len(segments) == 1
+        assert segments[0].endswith(".ndjson")
+        assert list(spool.read(segments[0])) == [("default", ACTION)]
+        assert spool.written == 1
+
+    def test_drops_metrics_when_full(self, tmp_path):
+        spool = Spool(str(tmp_path), max_bytes=200)
+        assert spool.write("default", ACTION) is True
+        assert spool.write("default", ACTION) is True
+        assert spool.write("default", ACTION) is False
+        assert spool.dropped == 1
+        spool.close()
+        assert len(list(spool.read(spool.segments()[0]))) == 2
+
+    def test_accepts_metrics_after_spool_is_emptied(self, tmp_path):
+        spool = Spool(str(tmp_path), max_bytes=200, segment_bytes=1)
+        assert spool.write("default", ACTION) is True
+        assert spool.write("default", ACTION) is True
+        assert spool.write("default", ACTION) is False
+        for segment in spool.segments():
+            os.remove(spool.claim(segment))
+        assert spool.write("default", ACTION) is True
+        spool.close()
+
+    def test_counts_segments_of_other_processes(self, tmp_path):
+        # The size of the spool directory is read again at every fsync
+        spool = Spool(str(tmp_path), max_bytes=200, fsync_count=1)
+        other = Spool(str(tmp_path), max_bytes=200, fsync_count=1)
+        assert spool.write("default", ACTION) is True
+        assert other.write("default", ACTION) is True
+        assert spool.write("default", ACTION) is False
+        spool.close()
+        other.close()
+
+    def test_closes_segments_after_interval(self, tmp_path):
+        spool = Spool(str(tmp_path), segment_interval=0.01)
+        assert spool.write("default", ACTION) is True
+        spool._timer.join(1)
+        assert len(spool.segments()) == 1
+        assert spool.write("default", ACTION) is True
+        spool.close()
+        assert len(spool.segments()) == 2
+
+    def test_rotates_segments(self, tmp_path):
+        spool = Spool(str(tmp_path), segment_bytes=1)
+        spool.write("default", ACTION)
+        spool.write("default", ACTION)
+        assert len(spool.segments()) == 2
+
+    def test_opens_new_segment_after_fork(self, spool):
+        spool.write("default", ACTION)
+        with mock.patch("os.getpid", return_value=os.getpid() + 1):
+            spool.write("default", ACTION)
+        open_segments = [f for f in os.listdir(spool.path) if f.endswith(".open")]
+        assert len(open_segments) == 2
+
+    def test_stale_segments(self, spool):
+        with open(os.path.join(spool.path, "00000000000000000001-999999999.open"), "w"):
+            pass
+        assert spool.segments() == []
+        with mock.patch(
+            "elasticsearch_metrics.spool._pid_is_alive", return_value=False
+        ):
+            assert len(spool.segments(include_stale=True)) == 1
+
+    def test_claim(self, spool):
+        spool.write("default", ACTION)
+        spool.close()
+        segment = spool.segments()[0]
+        claimed = spool.claim(segment)
+        assert claimed.endswith("-{}.replay".format(os.getpid()))
+        assert spool.segments() == []
+        assert spool.claim(segment) is None
+        assert list(spool.read(claimed)) == [("default", ACTION)]
+
+    def test_read_skips_malformed_lines(self, spool):
+        spool.write("default", ACTION)
+        spool.close()
+        segment = spool.segments()[0]
+        with open(segment, "a") as fp:
+            fp.write('{"using": "def')
+        assert list(spool.read(segment)) == [("default", ACTION)]
+
+
+def test_get_spool_disabled_by_default():
+    assert get_spool() is None
+
+
+class TestSave:
+    def test_writes_to_spool_on_connection_error(self, spool_settings, mock_save):
+        mock_save.side_effect = ConnectionError("N/A", "Connection refused", None)
+        assert SpooledPageView(page_id="a").save(index="myindex") is None
+        spool_settings.close()
+        ((using, action),) = spool_settings.read(spool_settings.segments()[0])
+        assert using == "default"
+        assert action["_index"] == "myindex"
+        assert action["_source"]["page_id"] == "a"
+
+    def test_raises_non_retryable_errors(self, spool_settings, mock_save):
+        mock_save.side_effect = TransportError(400, "mapper_parsing_exception")
+        with pytest.raises(TransportError):
+            SpooledPageView(page_id="a").save(index="myindex")
+        assert spool_settings.written == 0
+
+    def test_raises_when_spool_disabled(self, mock_save):
+        mock_save.side_effect = ConnectionError("N/A", "Connection refused", None)
+        with pytest.raises(ConnectionError):
+            SpooledPageView(page_id="a").save(index="myindex")
+
+
+def test_bulk_recorder_writes_to_spool(spool_settings, client):
+    with mock.patch.object(client, "bulk") as mock_bulk:
+        mock_bulk.side_effect = ConnectionError("N/A", "Connection refused", None)
+        with BulkRecorder() as recorder:
+            SpooledPageView.record(page_id="a")
+            SpooledPageView.record(page_id="b")
+    assert recorder.errors == []
+    assert recorder.spooled == 2
+    assert spool_settings.written == 2
@@ -0,0 +1,150 @@
+import datetime as dt
+
+import pytest
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl import connections
+
+from elasticsearch_metrics import metrics
+from elasticsearch_metrics.exceptions import IndexTemplateNotFoundError
+from elasticsearch_metrics.management.commands.check_metrics import (
+    Command as CheckCommand,
+)
+from elasticsearch_metrics.management.commands.prune_metrics import (
+    Command as PruneCommand,
+)
+from elasticsearch_metrics.management.commands.sync_metrics import (
+    Command as SyncCommand,
+)
+from elasticsearch_metrics.testing import InMemoryCluster, InMemoryConnection
+
+
+class InMemoryMetric(metrics.Metric):
+    page_id = metrics.Keyword()
+    duration = metrics.Integer()
+
+    class Meta:
+        app_label = "inmemoryapp"
+        retention = 30
+
+
+@pytest.fixture()
+def cluster():
+    return InMemoryCluster()
+
+
+@pytest.fixture()
+def client(cluster):
+    client = connections.create_connection(
+        "memory",
+        hosts=["localhost:9200"],
+        connection_class=InMemoryConnection,
+        cluster=cluster,
+    )
+    yield client
+    connections.remove_connection("memory")
+
+
+def test_save_and_get(client, cluster):
+    metric = InMemoryMetric(page_id="a", duration=3)
+    metric.save(using="memory")
+    index = InMemoryMetric.get_index_name()
+    assert list(cluster.indices) == [index]
+    doc = client.get(index=index, doc_type="doc", id=metric.meta.id)
+    assert doc["_source"]["page_id"] == "a"
+    with pytest.raises(NotFoundError):
+        client.get(index=index, doc_type="doc", id="missing")
+
+
+def test_record_many(client, cluster):
+    InMemoryMetric.record_many(
+        ({"page_id": str(i), "duration": i} for i in range(5)), using="memory"
+    )
+    index = InMemoryMetric.get_index_name()
+    assert len(cluster.indices[index]) == 5
+
+
+def test_sync_and_check(client, cluster, run_mgmt_command):
+    with pytest.raises(IndexTemplateNotFoundError):
+        InMemoryMetric.check_index_template(using="memory")
+    out, err = run_mgmt_command(SyncCommand, ["sync_metrics", "--connection", "memory"])
+    assert InMemoryMetric._template_name in cluster.templates
+    assert InMemoryMetric.check_index_template(using="memory")
+    out, err = run_mgmt_command(
+        SyncCommand, ["sync_metrics", "inmemoryapp", "--connection", "memory"]
+    )
+    assert "Skipping InMemoryMetric (unchanged)" in out
+    out, err = run_mgmt_command(
+        CheckCommand, ["check_metrics", "inmemoryapp", "--connection", "memory"]
+    )
+    assert "All metrics in sync" in out
+
+
+def test_prune(client, cluster, run_mgmt_command):
+    now = dt.datetime.now()
+    for days in (0, 60, 90):
+        InMemoryMetric.record_many(
+            [{"timestamp": now - dt.timedelta(days=days), "page_id": "a"}],
+            using="memory",
+        )
+    assert len(cluster.indices) == 3
+    run_mgmt_command(
+        PruneCommand, ["prune_metrics", "inmemoryapp", "--connection", "memory"]
+    )
+    assert list(cluster.indices) == [InMemoryMetric.get_index_name()]
+
+
+def test_search_and_aggregations(client):
+    start = dt.datetime(2020, 1, 30, 12)
+    InMemoryMetric.record_many(
+        (
+            {
+                "timestamp": start + dt.timedelta(days=i),
+                "page_id": "a" if i % 2 else "b",
+                "duration": i,
+            }
+            for i in range(4)
+        ),
+        using="memory",
+    )
+    search = InMemoryMetric.search(
+        using="memory", start=dt.date(2020, 1, 31), end=dt.date(2020, 2, 1)
+    )
+    assert sorted(hit.duration for hit in search.execute()) == [1, 2]
+
+    search = InMemoryMetric.search(using="memory").filter("term", page_id="a")
+    assert search.count() == 2
+    search = InMemoryMetric.search(using="memory").sort("-duration")[:2]
+    assert [hit.duration for hit in search.execute()] == [3, 2]
+
+    search = InMemoryMetric.search(using="memory")
+    search.aggs.bucket("pages", "terms", field="page_id").metric(
+        "total", "sum", field="duration"
+    )
+    search.aggs.bucket("months", "date_histogram", field="timestamp", interval="month")
+    response = search.execute()
+    pages = {
+        bucket.key: bucket.total.value for bucket in response.aggregations.pages.buckets
+    }
+    assert pages == {"a": 4.0, "b": 2.0}
+    months = [bucket.doc_count for bucket in response.aggregations.months.buckets]
+    assert months == [2, 2]
+
+
+def test_source_disabled_by_template(client, cluster):
+    InMemoryMetric.sync_index_template(using="memory")
+    metric = InMemoryMetric(page_id="a", duration=3)
+    metric.save(using="memory")
+    index = InMemoryMetric.get_index_name()
+    assert index in cluster.sourceless_indices
+    doc = client.get(index=index, doc_type="doc", id=metric.meta.id)
+    assert "_source" not in doc
+    response = client.search(index=index, body={"query": {"match_all": {}}})
+    (hit,) = response["hits"]["hits"]
+    assert "_source" not in hit
+    assert hit["_id"] == metric.meta.id
+
+
+def test_unsupported_request(client):
+    with pytest.raises(Exception) as excinfo:
+        client.indices.get_settings(index="foo")
+    assert excinfo.value.status_code in (400, 404)